@@ -1,43 +1,12 @@
 import argparse
 import json
 import os
-from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
-import threading
 import time
+from buffered_writer import BufferedWriterPool
 
-# Thread-local storage for per-thread file caches
-local = threading.local()
 
-
-def get_handle(user_id, output_dir, max_open):
-    """
-    Returns a writable file handle for a given user_id.
-    Uses an LRU cache per thread.
-    """
-    if not hasattr(local, "open_files"):
-        local.open_files = OrderedDict()
-
-    open_files = local.open_files
-
-    # If present, move to end (LRU)
-    if user_id in open_files:
-        open_files.move_to_end(user_id)
-        return open_files[user_id]
-
-    # Evict if needed
-    if len(open_files) >= max_open:
-        old_id, old_fh = open_files.popitem(last=False)
-        old_fh.close()
-
-    path = os.path.join(output_dir, f"{user_id}.jsonl")
-    fh = open(path, "a", encoding="utf-8")
-
-    open_files[user_id] = fh
-    return fh
-
-
-def process_chunk(chunk, output_dir, max_open):
+def process_chunk(chunk, pool):
     """
     Worker function that processes a chunk of JSON lines.
     """
@@ -50,13 +19,14 @@ def process_chunk(chunk, output_dir, max_open):
         except Exception:
             continue  # ignore malformed lines
 
-        fh = get_handle(user_id, output_dir, max_open)
-        fh.write(line)
+        pool.write(user_id, line)
 
 
 def main(args):
     start_time = time.time()
     os.makedirs(args.output_dir, exist_ok=True)
+    # lines are buffered per user and flushed largest-first, one open per flush
+    pool = BufferedWriterPool(args.output_dir, int(args.buffer_mb * 1024 * 1024))
 
     with ThreadPoolExecutor(max_workers=args.workers) as executor:
         futures = []
@@ -67,24 +37,23 @@ def main(args):
                 chunk.append(line)
                 if len(chunk) >= args.chunk_size:
                     futures.append(
-                        executor.submit(process_chunk, chunk, args.output_dir, args.max_open)
+                        executor.submit(process_chunk, chunk, pool)
                     )
                     chunk = []
 
         if chunk:
             futures.append(
-                executor.submit(process_chunk, chunk, args.output_dir, args.max_open)
+                executor.submit(process_chunk, chunk, pool)
             )
 
         # Wait for all threads to finish
         for fut in futures:
             fut.result()
 
-    if hasattr(local, "open_files"):
-        for fh in local.open_files.values():
-            fh.close()
+    flushes = pool.close()
 
     print("Completed splitting file by user_id (threaded).")
+    print(f"[INFO] {flushes:,} buffered file writes")
     duration = time.time() - start_time
     print(f"[INFO] Finished in {duration:.2f}s")
 
@@ -95,6 +64,6 @@ if __name__ == "__main__":
     parser.add_argument("--output_dir", required=True)
     parser.add_argument("--workers", type=int, default=8)
     parser.add_argument("--chunk_size", type=int, default=1000)
-    parser.add_argument("--max_open", type=int, default=100)
+    parser.add_argument("--buffer_mb", type=float, default=256, help="Memory budget for buffered per-user lines in MB")
     args = parser.parse_args()
     main(args)
@@ -1,41 +1,15 @@
 import argparse
 import json
 import os
-from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
-import threading
 import time
+from byte_range_reader import plan_ranges, iter_range_lines
+from buffered_writer import BufferedWriterPool
 
-# Global shared file handle cache
-file_cache_lock = threading.Lock()
-file_cache = OrderedDict()  # user_id -> open file handle
 
-
-def get_handle(user_id, output_dir, max_open):
-    """
-    Thread-safe global LRU file handle cache.
-    Ensures at most max_open files exist across ALL threads.
-    """
-    with file_cache_lock:
-        # Already open? Move to end (LRU)
-        if user_id in file_cache:
-            file_cache.move_to_end(user_id)
-            return file_cache[user_id]
-
-        # Evict if needed
-        if len(file_cache) >= max_open:
-            old_uid, old_fh = file_cache.popitem(last=False)
-            old_fh.close()
-
-        path = os.path.join(output_dir, f"{user_id}.jsonl")
-        fh = open(path, "a", encoding="utf-8")
-        file_cache[user_id] = fh
-        return fh
-
-
-def process_chunk(chunk, output_dir, max_open):
+def process_chunk(chunk, pool):
     """
-    Worker function that processes a chunk of JSON lines.
+    Worker function that processes a chunk of JSON lines (raw bytes).
     """
     for line in chunk:
         if not line.strip():
@@ -46,50 +20,41 @@ def process_chunk(chunk, output_dir, max_open):
         except Exception:
             continue  # ignore malformed lines
 
-        fh = get_handle(user_id, output_dir, max_open)
-        fh.write(line)
+        pool.write(user_id, line if line.endswith(b"\n") else line + b"\n")
 
 
 def main(args):
     start_time = time.time()
     os.makedirs(args.output_dir, exist_ok=True)
 
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures = []
-        chunk = []
+    # Each thread reads its own newline-aligned byte range; the main thread never touches lines.
+    # A .gz/.zst input cannot be split, so each compressed file is streamed by a single thread.
+    ranges = plan_ranges(args.input, int(args.chunk_mb * 1024 * 1024))
+    # one shared pool: lines are buffered per user and flushed largest-first
+    pool = BufferedWriterPool(args.output_dir, int(args.buffer_mb * 1024 * 1024))
 
-        with open(args.input, "r", encoding="utf-8") as f:
-            for line in f:
-                chunk.append(line)
-                if len(chunk) >= args.chunk_size:
-                    futures.append(
-                        executor.submit(process_chunk, chunk, args.output_dir, args.max_open)
-                    )
-                    chunk = []
-
-        if chunk:
-            futures.append(
-                executor.submit(process_chunk, chunk, args.output_dir, args.max_open)
-            )
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(process_chunk, iter_range_lines(path, start, end), pool)
+            for path, start, end in ranges
+        ]
 
         for fut in futures:
             fut.result()
 
-    # Clean up global cache
-    with file_cache_lock:
-        for fh in file_cache.values():
-            fh.close()
+    flushes = pool.close()
 
     print("Completed splitting file by user_id (threaded).")
+    print(f"[INFO] {flushes:,} buffered file writes")
     print(f"[INFO] Finished in {time.time() - start_time:.2f}s")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Split users into JSONL files with threads.")
-    parser.add_argument("--input", required=True)
+    parser.add_argument("--input", required=True, nargs="+", help="Input JSONL file(s), optionally .gz/.zst shards")
     parser.add_argument("--output_dir", required=True)
     parser.add_argument("--workers", type=int, default=8)
-    parser.add_argument("--chunk_size", type=int, default=1000)
-    parser.add_argument("--max_open", type=int, default=100)
+    parser.add_argument("--chunk_mb", type=float, default=16, help="Size of each thread's byte range in MB")
+    parser.add_argument("--buffer_mb", type=float, default=256, help="Memory budget for buffered per-user lines in MB")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,199 @@
+import argparse
+import os
+import shutil
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tempfile import mkdtemp
+import jsonl_codec as codec
+from post_store import NULL_ID, to_int
+from byte_range_reader import plan_ranges, iter_range_lines, ByteProgress
+from buffered_writer import BufferedWriterPool
+from packed_store import ShardWriter, write_index
+
+# =====================================================
+# TWO-PHASE (SHUFFLE) SPLIT BY USER_ID
+# =====================================================
+# Phase 1: worker processes parse their own byte ranges and append every line,
+#          prefixed with "<user_id>\t", to one of N bucket spill files
+#          (bucket = crc32(user_id) % N). No locks, no per-user files; buffered
+#          lines are appended to the spill files whenever they pass the byte budget.
+# Phase 2: buckets are independent (a user lives in exactly one), so workers
+#          take whole buckets and feed them through a BufferedWriterPool: lines
+#          are grouped per user under a byte budget and each flush opens a
+#          user's file once, so a bucket never has to fit in memory.
+# Lines of a user keep their input order: spill files are named by range index
+# and read back in that order.
+#
+# With --packed, phase 2 writes each bucket as one shard of a packed store
+# (packed_store.py) instead of one file per user; the bucket is grouped in
+# memory, so pick --buckets large enough for that. Packed stores key users by
+# integer user_id, so lines whose user_id is not an integer count as malformed
+# in phase 1.
+
+
+def bucket_of(user_id, n_buckets):
+    return zlib.crc32(user_id) % n_buckets
+
+
+def bucket_path(spill_dir, bucket, task_id):
+    return os.path.join(spill_dir, f"bucket-{bucket:04d}-t{task_id:06d}.txt")
+
+
+# --- phase 1: one byte range -> per-bucket spill files ---
+def scatter_range(path, start, end, task_id, spill_dir, n_buckets, budget_bytes, int_ids=False):
+    project = codec.make_projector(("user_id",))
+    buckets = defaultdict(list)
+    opened = set()  # buckets whose spill file this task has started
+    kept = malformed = buffered = 0
+
+    def flush():
+        for bucket, lines in buckets.items():
+            with open(bucket_path(spill_dir, bucket, task_id), "ab" if bucket in opened else "wb") as f:
+                f.writelines(lines)
+            opened.add(bucket)
+        buckets.clear()
+
+    for line in iter_range_lines(path, start, end):
+        if not line.strip():
+            continue
+        try:
+            user_id = project(line).get("user_id")
+        except codec.DecodeError:
+            user_id = None
+        if int_ids:
+            user_id = to_int(user_id)  # "42" and 42 are the same user
+            if user_id == NULL_ID:
+                user_id = None
+        if user_id is None:
+            malformed += 1
+            continue
+
+        key = str(user_id).encode("utf-8")
+        record = key + b"\t" + (line if line.endswith(b"\n") else line + b"\n")
+        buckets[bucket_of(key, n_buckets)].append(record)
+        kept += 1
+        buffered += len(record)
+        if buffered >= budget_bytes:
+            flush()
+            buffered = 0
+
+    flush()
+
+    nbytes = os.path.getsize(path) if end is None else end - start
+    return nbytes, kept, malformed
+
+
+# --- phase 2: one bucket -> its users' files ---
+def gather_bucket(bucket, spill_dir, output_dir, budget_bytes):
+    prefix = f"bucket-{bucket:04d}-t"
+    paths = sorted(os.path.join(spill_dir, name) for name in os.listdir(spill_dir) if name.startswith(prefix))
+
+    pool = BufferedWriterPool(output_dir, budget_bytes)
+    users = set()
+    for path in paths:
+        with open(path, "rb") as f:
+            for record in f:
+                key, line = record.split(b"\t", 1)
+                users.add(key)
+                pool.write(key.decode("utf-8"), line)
+        os.remove(path)
+
+    pool.close()
+    return len(users)
+
+
+# --- phase 2 (--packed): one bucket -> one shard of the packed store ---
+def pack_bucket(bucket, spill_dir, store_dir):
+    prefix = f"bucket-{bucket:04d}-t"
+    paths = sorted(os.path.join(spill_dir, name) for name in os.listdir(spill_dir) if name.startswith(prefix))
+
+    users = defaultdict(list)
+    for path in paths:
+        with open(path, "rb") as f:
+            for record in f:
+                key, line = record.split(b"\t", 1)
+                users[key].append(line)
+
+    rows = None
+    if users:
+        writer = ShardWriter(store_dir, bucket)
+        for key in sorted(users, key=int):  # keys were checked to be integers in phase 1
+            writer.write_user(int(key), users[key])
+        rows = writer.close()
+
+    # only now: a failed shard leaves the bucket's spill files for a re-run
+    for path in paths:
+        os.remove(path)
+    return rows
+
+
+def main(args):
+    start_time = time.time()
+    os.makedirs(args.output_dir, exist_ok=True)
+    spill_dir = args.spill_dir or mkdtemp(prefix=".split_", dir=args.output_dir)
+    os.makedirs(spill_dir, exist_ok=True)
+
+    # ===== PHASE 1: scatter =====
+    tasks = plan_ranges(args.input, int(args.chunk_mb * 1024 * 1024))
+    progress = ByteProgress(sum(os.path.getsize(p) for p in args.input), every=args.progress, label="SCATTER")
+    total_lines = total_malformed = 0
+    budget_bytes = int(args.buffer_mb * 1024 * 1024)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(scatter_range, path, start, end, task_id, spill_dir, args.buckets, budget_bytes, args.packed)
+            for task_id, (path, start, end) in enumerate(tasks)
+        ]
+        for fut in as_completed(futures):
+            nbytes, kept, malformed = fut.result()
+            total_lines += kept
+            total_malformed += malformed
+            progress.update(nbytes)
+
+    print(f"[INFO] Phase 1: {total_lines:,} lines into {args.buckets} buckets "
+          f"({total_malformed:,} malformed) in {time.time() - start_time:.2f}s")
+
+    # ===== PHASE 2: gather =====
+    total_users = 0
+    index_rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if args.packed:
+            futures = [executor.submit(pack_bucket, b, spill_dir, args.output_dir) for b in range(args.buckets)]
+        else:
+            futures = [executor.submit(gather_bucket, b, spill_dir, args.output_dir, budget_bytes)
+                       for b in range(args.buckets)]
+        for fut in as_completed(futures):
+            result = fut.result()
+            if args.packed:
+                if result is not None:
+                    index_rows.append(result)
+                    total_users += len(result)
+            else:
+                total_users += result
+
+    if args.packed:
+        meta = write_index(args.output_dir, index_rows)
+        print(f"[INFO] Packed store: {meta['users']:,} users, {meta['lines']:,} lines in {len(index_rows)} shards")
+
+    if not args.spill_dir:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    print(f"Completed splitting file by user_id ({total_users:,} users).")
+    print(f"[INFO] Finished in {time.time() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split users into JSONL files with a two-phase multi-process shuffle.")
+    parser.add_argument("--input", required=True, nargs="+", help="Input JSONL file(s), optionally .gz/.zst shards")
+    parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--chunk_mb", type=float, default=64, help="Size of each worker's byte range in MB")
+    parser.add_argument("--buckets", type=int, default=256, help="Number of user_id hash buckets")
+    parser.add_argument("--buffer_mb", type=float, default=256, help="Per-worker memory budget for buffered lines in both phases, in MB")
+    parser.add_argument("--packed", action="store_true", help="Write a packed store (shards + user index) instead of one file per user")
+    parser.add_argument("--spill_dir", default=None, help="Where bucket files go (default: a temp dir inside --output_dir)")
+    parser.add_argument("--progress", type=float, default=10.0, help="Seconds between progress updates")
+    args = parser.parse_args()
+    main(args)
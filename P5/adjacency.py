@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from csr_graph import iter_edge_chunks
+
+# =====================================================
+# PLUGGABLE ADJACENCY BACKENDS FOR TRAVERSAL
+# =====================================================
+# Every backend answers neighbors_many(ids) -> one neighbour list per id, so a
+# BFS fetches a whole frontier layer in a single round-trip.
+#
+#   DictAdjacency     the in-memory dict index (build/load_reverse_index)
+#   CSRGraph          mmapped CSR arrays (csr_graph.py), used as is
+#   SQLiteAdjacency   edges clustered by target in a SQLite file; for indexes
+#                     that do not fit in memory
+#   LRUAdjacency      bounded LRU cache in front of any backend
+
+SQLITE_BATCH = 900  # stay under SQLite's default host-parameter limit
+
+
+class DictAdjacency:
+    def __init__(self, index):
+        self.index = index
+
+    def neighbors_many(self, ids):
+        get = self.index.get
+        return [get(i, []) for i in ids]
+
+
+def as_adjacency(index):
+    """Wrap a plain dict index; backends with neighbors_many pass through."""
+    return index if hasattr(index, "neighbors_many") else DictAdjacency(index)
+
+
+# =====================================================
+# SQLITE BACKEND
+# =====================================================
+class SQLiteAdjacency:
+    """
+    edges(node, seq, nbr) WITHOUT ROWID, primary key (node, seq): a node's
+    neighbours sit next to each other on disk, in edge-file order.
+    One connection per thread; lookups use IN (...) batches.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+
+    @property
+    def conn(self):
+        if not hasattr(self.local, "conn"):
+            self.local.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        return self.local.conn
+
+    @classmethod
+    def build(cls, edges_path, db_path, direction="reverse", chunk_edges=1_000_000):
+        """Stream edges (JSONL or edge_extractor dir) into a new database."""
+        tmp_path = db_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE edges (node INTEGER, seq INTEGER, nbr INTEGER, "
+                     "PRIMARY KEY (node, seq)) WITHOUT ROWID")
+        seq = 0
+        for src, dst, _ in iter_edge_chunks(edges_path, chunk_edges):
+            node, nbr = (dst, src) if direction == "reverse" else (src, dst)
+            conn.executemany("INSERT INTO edges VALUES (?, ?, ?)",
+                             zip(node.tolist(), range(seq, seq + len(src)), nbr.tolist()))
+            seq += len(src)
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, db_path)
+        return seq
+
+    def neighbors_many(self, ids):
+        ids = list(ids)
+        found = {}
+        for i in range(0, len(ids), SQLITE_BATCH):
+            batch = ids[i:i + SQLITE_BATCH]
+            query = (f"SELECT node, nbr FROM edges WHERE node IN ({','.join('?' * len(batch))}) "
+                     f"ORDER BY node, seq")
+            for node, nbr in self.conn.execute(query, batch):
+                found.setdefault(node, []).append(nbr)
+        return [found.get(i, []) for i in ids]
+
+    def get(self, node_id, default=None):
+        nbrs = self.neighbors_many([node_id])[0]
+        return nbrs if nbrs else default
+
+
+# =====================================================
+# LRU CACHE
+# =====================================================
+class LRUAdjacency:
+    """Keeps the neighbour lists of up to max_entries recently used nodes."""
+
+    def __init__(self, backend, max_entries=1_000_000):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def neighbors_many(self, ids):
+        ids = list(ids)
+        result = [None] * len(ids)
+        missing = []
+        with self.lock:
+            for k, i in enumerate(ids):
+                if i in self.cache:
+                    self.cache.move_to_end(i)
+                    result[k] = self.cache[i]
+                else:
+                    missing.append(k)
+            self.hits += len(ids) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            fetched = self.backend.neighbors_many([ids[k] for k in missing])
+            with self.lock:
+                for k, nbrs in zip(missing, fetched):
+                    result[k] = nbrs
+                    self.cache[ids[k]] = nbrs
+                    self.cache.move_to_end(ids[k])
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+        return result
+
+    def get(self, node_id, default=None):
+        nbrs = self.neighbors_many([node_id])[0]
+        return nbrs if nbrs else default
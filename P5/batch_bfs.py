@@ -0,0 +1,52 @@
+import numpy as np
+from cascade_forest import iter_grouped_walks
+
+# =====================================================
+# VECTORISED BATCH-FRONTIER BFS (many small cascades)
+# =====================================================
+# A batch of roots advances together, one CSR layer at a time. The frontier is
+# a pair of arrays (owner root index, node position); neighbours of the whole
+# frontier come from one CSRGraph.expand call, and every root keeps its own
+# visited set as keys owner * n_nodes + node in one sorted array. Unlike the
+# forest labelling, cascades do not compete for nodes: each root gets exactly
+# the walk reverse_hybrid_traversal would produce, layer order included, but
+# thousands of tiny cascades cost a few array operations per layer instead of
+# a set, a frontier list and a dict each.
+
+
+def batch_bfs(graph, root_ids, max_depth=None):
+    """(owner, depth, node) arrays for every root of the batch, in depth-then-discovery order."""
+    n = len(graph)
+    pos = graph.id_map.encode(root_ids).astype(np.int64)
+    owner = np.flatnonzero(pos >= 0)
+    frontier = pos[owner]
+    visited = np.sort(owner * n + frontier)
+
+    owners, depths, nodes = [owner], [np.zeros(len(owner), dtype=np.int32)], [frontier]
+    depth = 0
+    while len(frontier) and (max_depth is None or depth < max_depth):
+        depth += 1
+        nbrs, src = graph.expand(frontier)
+        cand = owner[src]
+        keys = cand * n + nbrs
+        if len(visited) and len(keys):
+            at = np.minimum(np.searchsorted(visited, keys), len(visited) - 1)
+            fresh = visited[at] != keys
+            keys, nbrs, cand = keys[fresh], nbrs[fresh], cand[fresh]
+        # first discovery per (root, node) wins; the rest of the order is kept
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        frontier, owner = nbrs[first], cand[first]
+        visited = np.sort(np.concatenate([visited, keys[first]]))
+
+        owners.append(owner)
+        depths.append(np.full(len(owner), depth, dtype=np.int32))
+        nodes.append(frontier)
+
+    return np.concatenate(owners), np.concatenate(depths), np.concatenate(nodes)
+
+
+def iter_batch_walks(graph, root_ids, max_depth=None, layer_counts=False):
+    """(index in batch, walk record) per root, same records as reverse_hybrid_traversal."""
+    owners, depths, nodes = batch_bfs(graph, root_ids, max_depth)
+    return iter_grouped_walks(graph, root_ids, owners, depths, nodes, layer_counts)
@@ -0,0 +1,66 @@
+import argparse
+import json
+import time
+from itertools import islice
+import jsonl_codec
+
+# Keys the pipeline stages actually read from a post record
+POST_KEYS = ("post_id", "user_id", "reply_to", "quotes", "repost_from")
+
+
+def read_sample(path, n):
+    lines = []
+    with open(path, "rb") as f:
+        for line in islice(f, n):
+            try:
+                json.loads(line)
+            except ValueError:
+                continue  # benchmark only records every codec can decode
+            lines.append(line.rstrip(b"\n"))
+    return lines
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def bench(label, lines, repeat, projected_keys=None):
+    print(f"\n📊 {label}: {len(lines):,} records, {sum(map(len, lines)) / 1e6:.1f} MB")
+    print(f"{'codec':<10}{'decode MB/s':>14}{'project MB/s':>14}{'encode MB/s':>14}")
+    mb = sum(map(len, lines)) / 1e6
+
+    for name, (loads, dumps_bytes) in jsonl_codec.BACKENDS.items():
+        decoded = [loads(line) for line in lines]
+        t_dec = best_of(lambda: [loads(line) for line in lines], repeat)
+        t_enc = best_of(lambda: [dumps_bytes(obj) for obj in decoded], repeat)
+
+        proj = "-"
+        if projected_keys:
+            project = jsonl_codec.make_projector(projected_keys, backend=name)
+            proj = f"{mb / best_of(lambda: [project(line) for line in lines], repeat):.1f}"
+
+        print(f"{name:<10}{mb / t_dec:>14.1f}{proj:>14}{mb / t_enc:>14.1f}")
+
+    print(f"(selected codec: {jsonl_codec.CODEC})")
+
+
+def main(args):
+    if args.posts:
+        bench("posts", read_sample(args.posts, args.n), args.repeat, projected_keys=POST_KEYS)
+    if args.walks:
+        bench("walks", read_sample(args.walks, args.n), args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark the JSON codecs on real post and walk records.")
+    parser.add_argument("--posts", type=str, help="JSONL file with post records (e.g. one ./posts/<user>.jsonl)")
+    parser.add_argument("--walks", type=str, help="JSONL file with walk records (e.g. walks.jsonl)")
+    parser.add_argument("--n", type=int, default=100_000, help="Records to sample from each file")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement (best is reported)")
+    args = parser.parse_args()
+    main(args)
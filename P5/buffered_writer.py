@@ -0,0 +1,148 @@
+import os
+import queue
+import threading
+
+# =====================================================
+# WRITE-COALESCING BUFFER POOL FOR PER-USER FILES
+# =====================================================
+# Lines are collected per key (user_id) in memory. When the pool holds more
+# than `budget_bytes`, the largest buffers are flushed first until it is back
+# under half the budget: every flush opens the key's file once, appends all its
+# lines in one write and closes it. Hot users get big sequential writes, and
+# cold users stay buffered instead of costing an open/close per line.
+
+
+class BufferedWriterPool:
+    def __init__(self, output_dir, budget_bytes=256 * 1024 * 1024, suffix=".jsonl"):
+        self.output_dir = output_dir
+        self.budget = budget_bytes
+        self.suffix = suffix
+        self.buffers = {}  # key -> list of bytes
+        self.sizes = {}    # key -> buffered bytes
+        self.total = 0
+        self.flushes = 0
+        self.lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.output_dir, f"{key}{self.suffix}")
+
+    def write(self, key, line):
+        if isinstance(line, str):
+            line = line.encode("utf-8")
+        with self.lock:
+            if key in self.buffers:
+                self.buffers[key].append(line)
+                self.sizes[key] += len(line)
+            else:
+                self.buffers[key] = [line]
+                self.sizes[key] = len(line)
+            self.total += len(line)
+            if self.total > self.budget:
+                self._flush_largest(self.budget // 2)
+
+    def _flush_key(self, key):
+        lines = self.buffers.pop(key)
+        self.total -= self.sizes.pop(key)
+        with open(self.path_for(key), "ab") as fh:
+            fh.write(b"".join(lines))
+        self.flushes += 1
+
+    def _flush_largest(self, target):
+        for key in sorted(self.sizes, key=self.sizes.get, reverse=True):
+            if self.total <= target:
+                break
+            self._flush_key(key)
+
+    def close(self):
+        """Flush everything that is still buffered."""
+        with self.lock:
+            for key in list(self.buffers):
+                self._flush_key(key)
+        return self.flushes
+
+
+# =====================================================
+# BACKGROUND BLOCK WRITER FOR ONE OUTPUT STREAM
+# =====================================================
+# One thread owns the file. Producers hand over whole lists of records through
+# a bounded queue (so a slow disk throttles them instead of growing memory);
+# the thread joins them into ~block_bytes blocks and writes each with one call.
+
+
+class BlockWriter:
+    def __init__(self, fileobj, block_bytes=8 * 1024 * 1024, max_pending=64):
+        self.fileobj = fileobj
+        self.block_bytes = block_bytes
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.records = 0
+        self.blocks = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def sync(self):
+        """Block until everything queued so far is written and fsynced; returns the file offset."""
+        done, offset = threading.Event(), []
+        self.queue.put((done, offset))
+        done.wait()
+        if self.error is not None:
+            raise self.error
+        return offset[0]
+
+    def write_many(self, records):
+        """Queue a list of ready-to-write bytes records (newlines included)."""
+        if self.error is not None:
+            raise self.error
+        self.queue.put(records)
+
+    def write(self, record):
+        self.write_many([record])
+
+    def _flush(self, block):
+        self.fileobj.write(b"".join(block))
+        self.blocks += 1
+
+    def _run(self):
+        block, size = [], 0
+        while True:
+            records = self.queue.get()
+            if records is None:
+                break
+            if isinstance(records, tuple):  # sync() barrier
+                done, offset = records
+                try:
+                    if block and self.error is None:
+                        self._flush(block)
+                    block, size = [], 0
+                    if self.error is None:
+                        self.fileobj.flush()
+                        os.fsync(self.fileobj.fileno())
+                        offset.append(self.fileobj.tell())
+                except Exception as e:
+                    self.error = e
+                done.set()
+                continue
+            if self.error is not None:
+                continue  # keep draining so producers never block on a dead writer
+            try:
+                block.extend(records)
+                size += sum(map(len, records))
+                self.records += len(records)
+                if size >= self.block_bytes:
+                    self._flush(block)
+                    block, size = [], 0
+            except Exception as e:
+                self.error = e
+        if block and self.error is None:
+            try:
+                self._flush(block)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """Write what is left and stop the thread; re-raises a write error."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.records
@@ -0,0 +1,132 @@
+import os
+import mmap
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from compressed_io import is_compressed, open_input
+
+# =====================================================
+# BYTE-RANGE PARALLEL READER FOR ONE LARGE JSONL FILE
+# =====================================================
+# The parent only computes newline-aligned (start, end) offsets; every worker
+# mmaps the file and reads its own range, so no lines are pickled between
+# processes and progress/ETA come from byte offsets instead of a count_lines pass.
+#
+# gzip/zstd inputs cannot be split at byte offsets: each compressed file is one
+# task, decompressed inside its worker. To parallelise, shard compressed data
+# into several files and pass them all (map_ranges accepts a list of paths).
+
+
+def split_ranges(path, chunk_bytes):
+    """Newline-aligned [start, end) byte ranges of roughly chunk_bytes each."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+
+    ranges = []
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()  # move to the end of the line we landed in
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def plan_ranges(paths, chunk_bytes):
+    """(path, start, end) tasks; end is None for a whole compressed file."""
+    tasks = []
+    for path in paths:
+        if is_compressed(path):
+            tasks.append((path, 0, None))
+        else:
+            tasks.extend((path, start, end) for start, end in split_ranges(path, chunk_bytes))
+    return tasks
+
+
+def iter_range_lines(path, start, end):
+    """Yield the raw lines (bytes, newline included) inside [start, end); end=None streams the whole file."""
+    if end is None:
+        with open_input(path, "rb") as f:
+            yield from f
+        return
+    if end <= start:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            nl = mm.find(b"\n", pos, end)
+            stop = end if nl == -1 else nl + 1
+            yield mm[pos:stop]
+            pos = stop
+
+
+def process_range(fn, path, start, end, args):
+    """Worker entry point: fn(lines, *args) over one byte range."""
+    nbytes = os.path.getsize(path) if end is None else end - start
+    return nbytes, fn(iter_range_lines(path, start, end), *args)
+
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+
+class ByteProgress:
+    """Progress + ETA from processed bytes, printed at most every `every` seconds."""
+
+    def __init__(self, total_bytes, every=10.0, label="PROGRESS"):
+        self.total = total_bytes
+        self.done = 0
+        self.every = every
+        self.label = label
+        self.start = self.last = time.time()
+
+    def update(self, nbytes, force=False):
+        self.done += nbytes
+        now = time.time()
+        if not force and now - self.last < self.every:
+            return
+        self.last = now
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0
+        pct = 100 * self.done / self.total if self.total else 100
+        eta = format_eta((self.total - self.done) / rate) if rate else "?"
+        print(f"[{self.label}] {self.done / 1e9:.2f}/{self.total / 1e9:.2f} GB ({pct:.1f}%) "
+              f"@ {rate / 1e6:.1f} MB/s, ETA {eta}")
+
+
+def map_ranges(path, fn, workers, chunk_bytes=64 * 1024 * 1024, args=(), progress_every=10.0):
+    """
+    Run fn(lines, *args) over newline-aligned byte ranges of `path` in a process pool.
+    `path` may also be a list of files (e.g. compressed shards).
+    Yields fn's results in completion order; at most 2 * workers ranges are in flight.
+    fn must be a module-level (picklable) function.
+    """
+    paths = [path] if isinstance(path, (str, os.PathLike)) else list(path)
+    tasks = plan_ranges(paths, chunk_bytes)
+    # progress of compressed files is counted in compressed bytes
+    progress = ByteProgress(sum(os.path.getsize(p) for p in paths), every=progress_every)
+    futures = set()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, start, end in tasks:
+            futures.add(executor.submit(process_range, fn, path, start, end, args))
+            if len(futures) >= workers * 2:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    nbytes, result = fut.result()
+                    progress.update(nbytes)
+                    yield result
+
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                nbytes, result = fut.result()
+                progress.update(nbytes, force=not futures)
+                yield result
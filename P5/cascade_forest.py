@@ -0,0 +1,98 @@
+import numpy as np
+
+# =====================================================
+# WHOLE-FOREST CASCADE LABELLING (multi-source BFS)
+# =====================================================
+# One level-synchronous BFS over the CSR reverse graph, started from every root
+# at once. Each layer is expanded with a single vectorised CSRGraph.expand call,
+# so the total cost is O(V + E) array work instead of one Python BFS (visited
+# set, frontier lists) per root.
+#
+#   root_of[pos]   index (into the roots list) of the cascade that claimed pos, -1 if none
+#   depth_of[pos]  BFS depth of pos in that cascade
+#   order          claimed positions in discovery order
+#
+# A node reachable from several roots is attributed to exactly one: the root
+# that reaches it at the smallest depth, ties going to the root listed first.
+# A per-root BFS would list such a node (and what hangs below it) in every
+# cascade that reaches it, so walks can differ from reverse_hybrid_traversal
+# on graphs with shared nodes; on trees they are identical, layer order included.
+
+UNCLAIMED = -1
+
+
+def label_forest(graph, root_ids, max_depth=None):
+    """root_of / depth_of per node position and the discovery order, for all roots at once."""
+    n = len(graph)
+    root_pos = graph.id_map.encode(root_ids).astype(np.int64)
+    root_of = np.full(n, UNCLAIMED, dtype=np.int64)
+    depth_of = np.full(n, UNCLAIMED, dtype=np.int32)
+
+    # depth 0: every root claims itself (first listing wins for duplicates)
+    known = np.flatnonzero(root_pos >= 0)
+    _, first = np.unique(root_pos[known], return_index=True)
+    known = known[np.sort(first)]
+    frontier = root_pos[known]
+    root_of[frontier] = known
+    depth_of[frontier] = 0
+
+    order = [frontier]
+    depth = 0
+    while len(frontier) and (max_depth is None or depth < max_depth):
+        depth += 1
+        nbrs, owner = graph.expand(frontier)
+        fresh = root_of[nbrs] == UNCLAIMED
+        nbrs, owner = nbrs[fresh], owner[fresh]
+        # first claim wins; keep the discovery order of what is left
+        _, first = np.unique(nbrs, return_index=True)
+        first.sort()
+        frontier = nbrs[first]
+        root_of[frontier] = root_of[order[-1][owner[first]]]
+        depth_of[frontier] = depth
+        order.append(frontier)
+
+    return root_of, depth_of, np.concatenate(order)
+
+
+def iter_forest_walks(graph, root_ids, labels, layer_counts=False, skip=None):
+    """
+    (root index, walk record) per root, in root order, from label_forest output;
+    root indices in `skip` are left out. Records look like reverse_hybrid_traversal's;
+    with layer_counts only the size of each layer is kept ("layer_sizes") instead of walk_path.
+    """
+    root_of, depth_of, order = labels
+    return iter_grouped_walks(graph, root_ids, root_of[order], depth_of[order], order, layer_counts, skip)
+
+
+def iter_grouped_walks(graph, root_ids, owners, depths, nodes, layer_counts=False, skip=None):
+    """
+    Walk records from flat (owner root index, depth, node position) arrays listed in
+    depth-then-discovery order; shared by the forest labelling and batch_bfs.py.
+    """
+    by_root = np.argsort(owners, kind="stable")  # by root, then depth, then discovery
+    owners, depths, nodes = owners[by_root], depths[by_root], nodes[by_root]
+    bounds = np.searchsorted(owners, np.arange(len(root_ids) + 1))
+
+    for k, root_id in enumerate(root_ids):
+        if skip is not None and k in skip:
+            continue
+        members = nodes[bounds[k]:bounds[k + 1]]
+        if not len(members):
+            # not in the graph (isolated post) or a repeated root
+            sizes, layers = [1], [[root_id]]
+        else:
+            cuts = np.flatnonzero(np.diff(depths[bounds[k]:bounds[k + 1]])) + 1
+            sizes = np.diff(np.concatenate(([0], cuts, [len(members)]))).tolist()
+            layers = None if layer_counts else np.split(graph.ids[members], cuts)
+
+        record = {
+            "start_node": root_id,
+            "walk_length": int(sum(sizes)),
+            "walk_depth": len(sizes) - 1,
+        }
+        if layer_counts:
+            record["layer_sizes"] = sizes
+        else:
+            record["walk_path"] = {str(d): layer if isinstance(layer, list) else layer.tolist()
+                                   for d, layer in enumerate(layers)}
+        yield k, record
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+from manifest import hash_file
+
+# =====================================================
+# RESUMABLE TRAVERSAL CHECKPOINT
+# =====================================================
+# <walks_file>.ckpt holds one JSON header line followed by a bitmap:
+#
+#   header   roots file identity, sink paths, their durable byte offsets, counts
+#
+# The roots file is identified by its size and content hash, not its mtime:
+# --posts_dir runs rewrite roots.jsonl every time, with the same content.
+#   bitmap   bit i set = the i-th root of the roots file has been written
+#
+# A checkpoint is only saved right after the sink writers have fsynced
+# (BlockWriter.sync), so every marked root is on disk below the recorded
+# offsets. Resuming is one small read: the sink files are truncated back to
+# those offsets (dropping a torn final record and anything written after the
+# last checkpoint) and the marked roots are skipped.
+
+
+class Checkpoint:
+    def __init__(self, path, roots_file, paths, interval=30.0):
+        self.path = path
+        self.roots_file = roots_file
+        self.paths = list(paths)
+        self.interval = interval
+        self.bits = bytearray()
+        self.done_count = 0
+        self.offsets = None
+        self.last_save = time.time()
+        self._identity = None
+
+    def identity(self):
+        if self._identity is None:  # the roots file does not change during a run
+            self._identity = {
+                "roots_file": os.path.abspath(self.roots_file),
+                "roots_size": os.path.getsize(self.roots_file),
+                "roots_hash": hash_file(self.roots_file).hexdigest(),
+                "paths": [os.path.abspath(p) for p in self.paths],
+            }
+        return self._identity
+
+    # --- bitmap ---
+    def mark(self, index):
+        byte, bit = index >> 3, 1 << (index & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        if not self.bits[byte] & bit:
+            self.bits[byte] |= bit
+            self.done_count += 1
+
+    def is_done(self, index):
+        byte = index >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (index & 7)))
+
+    # --- persistence ---
+    def load(self):
+        """Read a matching checkpoint; False if there is none or it belongs to other inputs."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            header = json.loads(f.readline())
+            bits = f.read()
+        saved = {k: header.get(k) for k in ("roots_file", "roots_size", "roots_hash", "paths")}
+        if saved != self.identity():
+            print(f"[WARN] {self.path} was written for other roots/output files — ignoring it")
+            return False
+        self.bits = bytearray(bits)
+        self.done_count = header["done"]
+        self.offsets = header["offsets"]
+        return True
+
+    def restore_files(self):
+        """Cut every sink file back to its durable offset."""
+        for path, offset in zip(self.paths, self.offsets):
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size < offset:
+                raise SystemExit(f"[ERROR] {path} is shorter ({size:,} B) than its checkpoint ({offset:,} B); "
+                                 f"delete {self.path} to rescan the walks instead")
+            if size > offset:
+                os.truncate(path, offset)
+                print(f"[INFO] Truncated {path} by {size - offset:,} bytes past the last checkpoint")
+
+    def due(self):
+        return time.time() - self.last_save >= self.interval
+
+    def save(self, offsets):
+        """offsets must come from the sinks' sync(), taken after the last mark()."""
+        header = dict(self.identity(), offsets=list(offsets), done=self.done_count)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(self.bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.offsets = list(offsets)
+        self.last_save = time.time()
+
+
+def trim_partial_line(path, block=1 << 16):
+    """Drop a torn last line (no trailing newline) from a plain JSONL file; returns bytes removed."""
+    if not os.path.exists(path):
+        return 0
+    size = os.path.getsize(path)
+    with open(path, "rb+") as f:
+        end = size
+        while end > 0:
+            start = max(end - block, 0)
+            f.seek(start)
+            chunk = f.read(end - start)
+            if end == size and chunk.endswith(b"\n"):
+                return 0
+            nl = chunk.rfind(b"\n")
+            if nl >= 0:
+                keep = start + nl + 1
+                break
+            end = start
+        else:
+            keep = 0
+        f.truncate(keep)
+    return size - keep
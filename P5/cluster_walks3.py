@@ -1,4 +1,3 @@
-import json
 import argparse
 from pathlib import Path
 from collections import defaultdict
@@ -6,23 +5,62 @@ import numpy as np
 from sklearn.cluster import MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
 import time
+import jsonl_codec as codec
+from byte_range_reader import map_ranges
+from compressed_io import is_jsonl, strip_jsonl_suffix, open_input
 
 
-def count_lines(path):
-    with open(path, "r") as f:
-        return sum(1 for _ in f)
+def extract_features(obj):
+    return [
+        obj["depth"],
+        obj["size"],
+        obj["max_width"],
+        obj["avg_branching"]
+    ]
+
+
+def label_lines(lines, scaler, kmeans):
+    """Assign a cluster to every raw metrics line; returns {label: [raw lines]}."""
+    lines = [line for line in lines if line.strip()]
+    grouped = defaultdict(list)
+    if not lines:
+        return grouped
+    X = scaler.transform(np.array([extract_features(codec.loads(line)) for line in lines]))
+    for label, line in zip(kmeans.predict(X), lines):
+        grouped[int(label)].append(line if line.endswith(b"\n") else line + b"\n")
+    return grouped
 
 
 def main(args):
     start_time = time.time()
     args.output_dir.mkdir(parents=True, exist_ok=True)
 
-    metric_files = sorted(args.metrics_dir.glob("*_metrics.jsonl"))
+    metric_files = sorted(p for p in args.metrics_dir.glob("*_metrics.jsonl*") if is_jsonl(p.name))
     metric_files = metric_files[args.skip_first_n:]
 
     for metrics_file in metric_files:
-        threshold_name = metrics_file.stem.replace("_metrics", "")
-        n_samples = count_lines(metrics_file)
+        threshold_name = strip_jsonl_suffix(metrics_file.name).replace("_metrics", "")
+
+        scaler = StandardScaler()
+        kmeans = None
+        buffer = []
+        n_samples = 0
+
+        # ---- First pass: fit scaler + kmeans ----
+        # The model is created at the first full batch (or at EOF for small
+        # files), so n_samples is counted here instead of in a separate pass.
+        with open_input(metrics_file, "rb") as f:
+            for line in f:
+                buffer.append(extract_features(codec.loads(line)))
+                n_samples += 1
+
+                if len(buffer) >= args.batch_size:
+                    if kmeans is None:
+                        kmeans = MiniBatchKMeans(n_clusters=args.k, batch_size=args.batch_size, random_state=0)
+                    X = np.array(buffer)
+                    X = scaler.partial_fit(X).transform(X)
+                    kmeans.partial_fit(X)
+                    buffer.clear()
 
         if n_samples < args.min_samples:
             print(
@@ -41,33 +79,13 @@ def main(args):
         threshold_out = args.output_dir / threshold_name
         threshold_out.mkdir(parents=True, exist_ok=True)
 
-        scaler = StandardScaler()
-        kmeans = MiniBatchKMeans(
-            n_clusters=effective_k,
-            batch_size=min(args.batch_size, n_samples),
-            random_state=0
-        )
-
-        buffer = []
-
-        # ---- First pass: fit scaler + kmeans ----
-        with open(metrics_file) as f:
-            for line in f:
-                obj = json.loads(line)
-                buffer.append([
-                    obj["depth"],
-                    obj["size"],
-                    obj["max_width"],
-                    obj["avg_branching"]
-                ])
-
-                if len(buffer) >= kmeans.batch_size:
-                    X = np.array(buffer)
-                    X = scaler.partial_fit(X).transform(X)
-                    kmeans.partial_fit(X)
-                    buffer.clear()
-
         if buffer:
+            if kmeans is None:
+                kmeans = MiniBatchKMeans(
+                    n_clusters=effective_k,
+                    batch_size=min(args.batch_size, n_samples),
+                    random_state=0
+                )
             X = np.array(buffer)
             X = scaler.partial_fit(X).transform(X)
             kmeans.partial_fit(X)
@@ -75,22 +93,16 @@ def main(args):
 
         # ---- Prepare output files ----
         cluster_files = {
-            i: open(threshold_out / f"cluster_{i}.jsonl", "w")
+            i: open(threshold_out / f"cluster_{i}.jsonl", "wb")
             for i in range(effective_k)
         }
 
-        # ---- Second pass: assign clusters ----
-        with open(metrics_file) as f:
-            for line in f:
-                obj = json.loads(line)
-                X = scaler.transform([[
-                    obj["depth"],
-                    obj["size"],
-                    obj["max_width"],
-                    obj["avg_branching"]
-                ]])
-                label = int(kmeans.predict(X)[0])
-                cluster_files[label].write(json.dumps(obj) + "\n")
+        # ---- Second pass: assign clusters (vectorized per byte range) ----
+        chunks = map_ranges(metrics_file, label_lines, args.workers,
+                            chunk_bytes=int(args.chunk_mb * 1024 * 1024), args=(scaler, kmeans))
+        for grouped in chunks:
+            for label, lines in grouped.items():
+                cluster_files[label].writelines(lines)
 
         for f in cluster_files.values():
             f.close()
@@ -102,11 +114,13 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--metrics_dir", required=True, type=Path, help="Directory containing *_metrics.jsonl files")
+    parser.add_argument("--metrics_dir", required=True, type=Path, help="Directory containing *_metrics.jsonl(.gz/.zst) files")
     parser.add_argument("--output_dir", required=True, type=Path, help="Root output directory for per-threshold clusters")
     parser.add_argument("--k", type=int, default=5, help="Number of clusters")
     parser.add_argument("--batch_size", type=int, default=10000)
     parser.add_argument("--skip_first_n", type=int, default=0, help="Skip the first N metric files (sorted)")
     parser.add_argument("--min_samples", type=int, default=3, help="Minimum samples required to cluster a threshold")
+    parser.add_argument("--workers", type=int, default=4, help="Processes used to assign cluster labels")
+    parser.add_argument("--chunk_mb", type=float, default=64, help="Size of each worker's byte range in MB")
     args = parser.parse_args()
     main(args)
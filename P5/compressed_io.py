@@ -0,0 +1,90 @@
+import io
+import gzip
+
+# =====================================================
+# TRANSPARENT COMPRESSED JSONL I/O
+# =====================================================
+# Readers accept plain, gzip (.gz) or zstd (.zst/.zstd) JSONL; the format is
+# detected from the magic bytes, so renamed files still work. Writers compress
+# when the output path ends in .gz or .zst. zstandard is optional and only
+# needed for zstd files.
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+JSONL_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst", ".jsonl.zstd")
+
+
+def is_jsonl(name):
+    return name.endswith(JSONL_SUFFIXES)
+
+
+def strip_jsonl_suffix(name):
+    for suffix in sorted(JSONL_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def compression_of(path):
+    """'gzip', 'zstd' or None, from the file's magic bytes."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def is_compressed(path):
+    return compression_of(path) is not None
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstd-compressed JSONL needs the 'zstandard' package (pip install zstandard)")
+
+
+def open_input(path, mode="rb", encoding="utf-8", errors="replace"):
+    """open() for reading that decompresses gzip/zstd transparently."""
+    kind = compression_of(path)
+    if kind == "gzip":
+        raw = gzip.open(path, "rb")
+    elif kind == "zstd":
+        require_zstandard()
+        dctx = zstandard.ZstdDecompressor()
+        raw = io.BufferedReader(dctx.stream_reader(open(path, "rb"), read_across_frames=True, closefd=True))
+    else:
+        return open(path, mode, **({} if "b" in mode else {"encoding": encoding, "errors": errors}))
+
+    if "b" in mode:
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding, errors=errors)
+
+
+def compresses_output(path):
+    """True if open_output would compress this path."""
+    return str(path).endswith((".gz", ".zst", ".zstd"))
+
+
+def open_output(path, mode="wb", encoding="utf-8", level=3):
+    """open() for writing/appending; compresses when the path ends in .gz or .zst."""
+    path_str = str(path)
+    if path_str.endswith(".gz"):
+        raw = gzip.open(path, mode.replace("t", "").rstrip("b") + "b", compresslevel=level * 2)
+    elif path_str.endswith((".zst", ".zstd")):
+        require_zstandard()
+        # every open starts a new zstd frame; concatenated frames read back as one stream
+        cctx = zstandard.ZstdCompressor(level=level)
+        raw = cctx.stream_writer(open(path, mode.replace("t", "").rstrip("b") + "b"), closefd=True)
+    else:
+        return open(path, mode, **({} if "b" in mode else {"encoding": encoding}))
+
+    if "b" in mode:
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding)
@@ -1,8 +1,9 @@
-import json
 import argparse
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
 from collections import defaultdict
+import jsonl_codec as codec
+from byte_range_reader import map_ranges
+from compressed_io import open_input, open_output
 
 # -------- Core logic -------- #
 
@@ -39,7 +40,7 @@ def compute_metrics(walk):
 def process_chunk(lines):
     results = []
     for line in lines:
-        walk = json.loads(line)
+        walk = codec.loads(line)
         results.append(compute_metrics(walk))
     return results
 
@@ -47,37 +48,27 @@ def process_chunk(lines):
 # -------- Entry point -------- #
 
 def main(args):
-    with open(args.input, "r") as infile, open(args.output, "w") as outfile:
+    # .gz/.zst inputs are decompressed transparently; a .gz/.zst output path is compressed
+    with open_output(args.output, "wb") as outfile:
         if args.workers == 1:
-            for line in infile:
-                result = compute_metrics(json.loads(line))
-                outfile.write(json.dumps(result) + "\n")
+            for path in args.input:
+                with open_input(path, "rb") as infile:
+                    for line in infile:
+                        result = compute_metrics(codec.loads(line))
+                        outfile.write(codec.dumpline(result))
         else:
-            executor = ProcessPoolExecutor(max_workers=args.workers)
-            futures = []
-
-            chunk = []
-            for line in infile:
-                chunk.append(line)
-                if len(chunk) >= args.chunk_size:
-                    futures.append(executor.submit(process_chunk, chunk))
-                    chunk = []
-
-            if chunk:
-                futures.append(executor.submit(process_chunk, chunk))
-
-            for future in as_completed(futures):
-                for result in future.result():
-                    outfile.write(json.dumps(result) + "\n")
-
-            executor.shutdown()
+            # each worker parses its own byte range of the input
+            for results in map_ranges(args.input, process_chunk, args.workers,
+                                      chunk_bytes=int(args.chunk_mb * 1024 * 1024)):
+                for result in results:
+                    outfile.write(codec.dumpline(result))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", required=True, type=Path)
+    parser.add_argument("--input", required=True, type=Path, nargs="+", help="Walks JSONL file(s), optionally .gz/.zst shards")
     parser.add_argument("--output", required=True, type=Path)
     parser.add_argument("--workers", type=int, default=1)
-    parser.add_argument("--chunk_size", type=int, default=10_000)
+    parser.add_argument("--chunk_mb", type=float, default=64, help="Size of each worker's byte range in MB")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,399 @@
+import os
+import time
+import shutil
+import argparse
+from itertools import islice
+from tempfile import NamedTemporaryFile, mkdtemp
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import numpy as np
+import jsonl_codec as codec
+from compressed_io import is_jsonl, open_input
+from id_set import IdSet, IdSetBuilder
+from post_store import NULL_ID, to_int
+from spill import spill_partitioned
+from duplicates import make_file_id, make_rows, save_file_list, reduce_rows_partition
+from data_minimizer3 import lut_to_npy
+
+# =====================================================
+# SINGLE-PASS CORPUS SCAN
+# =====================================================
+# Every per-user file is opened and decoded exactly once; each record is handed
+# to all registered consumers. A consumer implements:
+#   start(worker_id)                  -> per-worker state
+#   consume(state, post, line, filepath, line_num)   (post is None if malformed)
+#   close(state)                      -> picklable partial result (in the worker)
+#   merge(total, partial)             -> total (in the parent, total starts as None)
+#   finish(total)                     -> write outputs / print summary
+
+# --- helper: iterate over files ---
+def iter_files(directory):
+    for entry in os.scandir(directory):
+        if entry.is_file() and is_jsonl(entry.name):
+            yield entry.path
+
+# --- helper: chunking generator ---
+def chunker(iterable, chunksize):
+    filenames = iter(iterable)
+    while True:
+        batch = list(islice(filenames, chunksize))
+        if not batch:
+            break
+        yield batch
+
+
+# =====================================================
+# CONSUMERS
+# =====================================================
+class LineCountConsumer:
+    """Counts files and lines (same numbers as user_posts_amount2)."""
+    name = "count"
+
+    def __init__(self, outdir):
+        self.output = os.path.join(outdir, "user_posts_amount.txt")
+
+    def start(self, worker_id):
+        return {"files": set(), "lines": 0}
+
+    def consume(self, state, post, line, filepath, line_num):
+        state["files"].add(filepath)
+        state["lines"] += 1
+
+    def close(self, state):
+        return {"files": len(state["files"]), "lines": state["lines"]}
+
+    def merge(self, total, partial):
+        if total is None:
+            return partial
+        total["files"] += partial["files"]
+        total["lines"] += partial["lines"]
+        return total
+
+    def finish(self, total):
+        with open(self.output, "w") as f:
+            f.write(f"Total users (files):{total['files']}\n")
+            f.write(f"Total posts (lines):{total['lines']}\n")
+        print(f"[count] {total['files']:,} files, {total['lines']:,} lines → {self.output}")
+
+
+class IsolatedPostsConsumer:
+    """Posts with neither in- nor out-edges (same output as threadless_posts4)."""
+    name = "isolated"
+
+    def __init__(self, outdir):
+        self.output = os.path.join(outdir, "threadless.txt")
+
+    def start(self, worker_id):
+        return {"all_posts": IdSetBuilder(), "sources": IdSetBuilder(), "targets": IdSetBuilder()}
+
+    def consume(self, state, post, line, filepath, line_num):
+        pid = to_int(post.get("post_id")) if post is not None else NULL_ID
+        if pid == NULL_ID:
+            return
+        state["all_posts"].add(pid)
+        has_interaction = False
+        for key in ("reply_to", "quotes", "repost_from"):
+            target = to_int(post.get(key))
+            if target != NULL_ID:
+                has_interaction = True
+                state["targets"].add(target)
+        if has_interaction:
+            state["sources"].add(pid)
+
+    def close(self, state):
+        return {key: [builder.build()] for key, builder in state.items()}
+
+    def merge(self, total, partial):
+        if total is None:
+            return partial
+        for key in ("all_posts", "sources", "targets"):
+            total[key].extend(partial[key])
+        return total
+
+    def finish(self, total):
+        merged = {key: IdSet.union_all(sets) for key, sets in total.items()}
+        isolated = merged["all_posts"] - merged["sources"] - merged["targets"]
+        with open(self.output, "w") as f:
+            for pid in isolated:
+                f.write(f"{pid}\n")
+        print(f"[isolated] {len(isolated):,} isolated posts → {self.output}")
+
+
+class EdgeConsumer:
+    """Edge list + roots (same outputs as reverse_hybrid_search3.extract_edges)."""
+    name = "edges"
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.edges_path = os.path.join(outdir, "edges.jsonl")
+        self.roots_path = os.path.join(outdir, "roots.jsonl")
+
+    def start(self, worker_id):
+        out = NamedTemporaryFile("w", delete=False, dir=self.outdir, prefix=f"edges_{worker_id}_", suffix=".jsonl")
+        return {"out": out, "count": 0, "all_posts": IdSetBuilder(), "sources": IdSetBuilder(), "targets": IdSetBuilder()}
+
+    def consume(self, state, post, line, filepath, line_num):
+        pid = to_int(post.get("post_id")) if post is not None else NULL_ID
+        if pid == NULL_ID:
+            return
+        state["all_posts"].add(pid)
+        has_edge = False
+        for field in ("reply_to", "quotes", "repost_from"):
+            dst = post.get(field)
+            dst = to_int(dst) if dst else NULL_ID
+            if dst != NULL_ID:
+                state["out"].write(codec.dumps({"src": pid, "dst": dst}) + "\n")
+                state["count"] += 1
+                state["targets"].add(dst)
+                has_edge = True
+        if has_edge:
+            state["sources"].add(pid)
+
+    def close(self, state):
+        state["out"].close()
+        partial = {"parts": [state["out"].name], "count": state["count"]}
+        for key in ("all_posts", "sources", "targets"):
+            partial[key] = [state[key].build()]
+        return partial
+
+    def merge(self, total, partial):
+        if total is None:
+            return partial
+        total["parts"].extend(partial["parts"])
+        total["count"] += partial["count"]
+        for key in ("all_posts", "sources", "targets"):
+            total[key].extend(partial[key])
+        return total
+
+    def finish(self, total):
+        with open(self.edges_path, "w", encoding="utf-8") as out:
+            for tmp in total["parts"]:
+                with open(tmp, "r", encoding="utf-8") as f:
+                    for line in f:
+                        out.write(line)
+                os.remove(tmp)
+
+        merged = {key: IdSet.union_all(total[key]) for key in ("all_posts", "sources", "targets")}
+        roots = merged["targets"] - merged["sources"]
+        roots |= merged["all_posts"] - merged["targets"] - merged["sources"]
+        with open(self.roots_path, "w", encoding="utf-8") as f:
+            for r in roots:
+                f.write(codec.dumps(r) + "\n")
+        print(f"[edges] {total['count']:,} edges → {self.edges_path}, {len(roots):,} roots → {self.roots_path}")
+
+
+# --- per-process LUT: memory-mapped once, shared through the page cache ---
+threadless_luts = {}
+
+def load_lut(lut_path):
+    if lut_path not in threadless_luts:
+        threadless_luts[lut_path] = IdSet.load(lut_path, mmap=True)
+    return threadless_luts[lut_path]
+
+
+class MinimizerConsumer:
+    """Drops threadless posts (same output as data_minimizer3)."""
+    name = "minimize"
+    flush_lines = 50_000
+
+    def __init__(self, outdir, lookup):
+        self.outdir = outdir
+        self.lookup = lookup
+        # text LUTs are converted once here, not in every batch
+        self.lut_path = lut_to_npy(lookup, outdir)
+        self.output = os.path.join(outdir, "minimized.jsonl")
+
+    def start(self, worker_id):
+        out = NamedTemporaryFile("w", delete=False, dir=self.outdir, prefix=f"minimizer_{worker_id}_", suffix=".jsonl")
+        return {"lut": load_lut(self.lut_path), "out": out, "lines": [], "pids": [], "removed": 0, "kept": 0}
+
+    # batched membership test against the LUT
+    def flush(self, state):
+        drop = state["lut"].contains_many(state["pids"])
+        for line, is_threadless in zip(state["lines"], drop):
+            if is_threadless:
+                state["removed"] += 1
+                continue
+            state["kept"] += 1
+            state["out"].write(line if line.endswith("\n") else line + "\n")
+        state["lines"].clear()
+        state["pids"].clear()
+
+    def consume(self, state, post, line, filepath, line_num):
+        if post is None:
+            return
+        state["lines"].append(line)
+        state["pids"].append(to_int(post.get("post_id")))  # "777" matches 777, as in data_minimizer3
+        if len(state["lines"]) >= self.flush_lines:
+            self.flush(state)
+
+    def close(self, state):
+        self.flush(state)
+        state["out"].close()
+        return {"parts": [state["out"].name], "removed": state["removed"], "kept": state["kept"]}
+
+    def merge(self, total, partial):
+        if total is None:
+            return partial
+        total["parts"].extend(partial["parts"])
+        total["removed"] += partial["removed"]
+        total["kept"] += partial["kept"]
+        return total
+
+    def finish(self, total):
+        with open(self.output, "w", encoding="utf-8") as out:
+            for tmp in total["parts"]:
+                with open(tmp, "r", encoding="utf-8") as f:
+                    for line in f:
+                        out.write(line)
+                os.remove(tmp)
+        if self.lut_path != self.lookup:
+            os.remove(self.lut_path)
+        print(f"[minimize] Removed {total['removed']:,}, Kept {total['kept']:,} → {self.output}")
+
+
+class DuplicateConsumer:
+    """
+    Duplicate post_ids across the whole corpus, plus malformed lines (same outputs as
+    threadless_posts4). Workers spill (post_id, file_id, line_num) rows to hash
+    partitions; finish reduces them one partition at a time within memory_mb.
+    """
+    name = "duplicates"
+
+    def __init__(self, outdir, partitions=64, memory_mb=1024):
+        self.dup_path = os.path.join(outdir, "duplicate_posts.log")
+        self.inv_path = os.path.join(outdir, "invalid_posts.log")
+        self.partitions = partitions
+        self.budget_bytes = memory_mb * 1024 * 1024
+        self.spill_dir = mkdtemp(prefix=".duplicates_spill_", dir=outdir)
+
+    def start(self, worker_id):
+        return {"worker_id": worker_id, "files": {}, "pids": [], "file_idxs": [], "line_nums": [], "invalid": []}
+
+    def consume(self, state, post, line, filepath, line_num):
+        if post is None:
+            state["invalid"].append({"file": filepath, "reason": "decode_error", "line_num": line_num})
+            return
+        pid = to_int(post.get("post_id"))
+        if pid == NULL_ID:
+            state["invalid"].append({"file": filepath, "reason": "missing_post_id", "line_num": line_num})
+            return
+        state["pids"].append(pid)
+        state["file_idxs"].append(state["files"].setdefault(filepath, len(state["files"])))
+        state["line_nums"].append(line_num)
+
+    def close(self, state):
+        worker_id = state["worker_id"]
+        pids = np.asarray(state["pids"], dtype=np.int64)
+        rows = make_rows(pids, make_file_id(worker_id, state["file_idxs"]), state["line_nums"])
+        spill_partitioned(rows, self.spill_dir, "rows", worker_id, self.partitions, key="post_id")
+        save_file_list(self.spill_dir, worker_id, list(state["files"]))
+        return {"invalid": state["invalid"]}
+
+    def merge(self, total, partial):
+        if total is None:
+            return partial
+        total["invalid"].extend(partial["invalid"])
+        return total
+
+    def finish(self, total):
+        open(self.dup_path, "wb").close()  # partitions are appended one after another
+        n_duplicates = 0
+        for k in range(self.partitions):
+            n_duplicates += reduce_rows_partition(self.spill_dir, "rows", k, self.dup_path, self.budget_bytes)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+        with open(self.inv_path, "w", encoding="utf-8") as f:
+            for rec in total["invalid"]:
+                f.write(codec.dumps(rec) + "\n")
+        print(f"[duplicates] {n_duplicates:,} duplicates, {len(total['invalid']):,} invalid lines")
+
+
+CONSUMERS = {
+    cls.name: cls
+    for cls in (LineCountConsumer, IsolatedPostsConsumer, EdgeConsumer, MinimizerConsumer, DuplicateConsumer)
+}
+
+
+def build_consumers(names, outdir, lookup=None, partitions=64, memory_mb=1024):
+    consumers = []
+    for name in names:
+        if name not in CONSUMERS:
+            raise ValueError(f"Unknown consumer '{name}' (choose from {', '.join(CONSUMERS)})")
+        if name == "minimize":
+            if not lookup:
+                raise ValueError("The minimize consumer needs --lookup")
+            consumers.append(MinimizerConsumer(outdir, lookup))
+        elif name == "duplicates":
+            consumers.append(DuplicateConsumer(outdir, partitions, memory_mb))
+        else:
+            consumers.append(CONSUMERS[name](outdir))
+    return consumers
+
+
+# =====================================================
+# SCAN ENGINE
+# =====================================================
+def scan_batch(batch, consumers, worker_id):
+    states = [c.start(worker_id) for c in consumers]
+
+    for filepath in batch:
+        try:
+            with open_input(filepath, "r") as f:
+                for line_num, line in enumerate(f, start=1):
+                    try:
+                        post = codec.loads(line)
+                    except codec.DecodeError:
+                        post = None
+                    for consumer, state in zip(consumers, states):
+                        consumer.consume(state, post, line, filepath, line_num)
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+
+    if worker_id % 10 == 0:
+        print(f"Processed {worker_id * len(batch):,} files so far...")
+
+    return [c.close(s) for c, s in zip(consumers, states)]
+
+
+def run_scan(inputpath, consumers, workers, batchsize):
+    totals = [None] * len(consumers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        worker_id = 1
+        for batch in chunker(iter_files(inputpath), batchsize):
+            futures.append(executor.submit(scan_batch, batch, consumers, worker_id))
+            worker_id += 1
+
+        for fut in as_completed(futures):
+            for i, partial in enumerate(fut.result()):
+                totals[i] = consumers[i].merge(totals[i], partial)
+
+    for consumer, total in zip(consumers, totals):
+        if total is not None:
+            consumer.finish(total)
+    return totals
+
+
+def main(args):
+    st = time.time()
+    os.makedirs(args.outdir, exist_ok=True)
+    consumers = build_consumers(args.consumers.split(","), args.outdir, args.lookup, args.partitions, args.memory_mb)
+    print(f"[INFO] Scanning {args.inputpath} once for: {', '.join(c.name for c in consumers)}")
+    run_scan(args.inputpath, consumers, args.workers, args.batchsize)
+    print(f"Δt = {time.time() - st:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan the per-user posts corpus once and feed several consumers.")
+    parser.add_argument("--inputpath", type=str, required=True, help="Path to input directory")
+    parser.add_argument("--outdir", type=str, required=True, help="Directory for all consumer outputs")
+    parser.add_argument("--consumers", type=str, default="isolated,edges,count,duplicates",
+                        help=f"Comma-separated consumers: {', '.join(CONSUMERS)}")
+    parser.add_argument("--lookup", type=str, help="Threadless lookup table (text or .npy), needed by the minimize consumer")
+    parser.add_argument("--partitions", type=int, default=64, help="Number of hash partitions for the duplicates consumer")
+    parser.add_argument("--memory_mb", type=int, default=1024, help="Per-partition memory budget for the duplicates consumer")
+    parser.add_argument("--workers", type=int, default=32, help="Number of parallel workers")
+    parser.add_argument("--batchsize", type=int, default=1000, help="Number of files per batch")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,355 @@
+import os
+import json
+import shutil
+from tempfile import mkdtemp
+import numpy as np
+import jsonl_codec as codec
+from compressed_io import open_input
+from id_map import IdMap, index_dtype
+from edge_extractor import load_edges, edge_shards, EDGE_TYPE_NAMES, TYPE_BY_NAME, UNTYPED, mask_types
+from external_sort import write_run, merge_runs, merge_unique
+
+# =====================================================
+# BINARY CSR ADJACENCY (REVERSE + FORWARD INDEX)
+# =====================================================
+# <csr_dir>/ids.npy                    IdMap of the node ids (position <-> post id)
+# <csr_dir>/<direction>_indptr.npy     row i's neighbours are indices[indptr[i]:indptr[i+1]]
+# <csr_dir>/<direction>_indices.npy    neighbour positions (int32 while they fit)
+# <csr_dir>/<direction>_<relation>_*.npy   the same, restricted to reply / quote / repost edges
+# <csr_dir>/meta.json                  {"nodes", "edges", "edges_by_type"}
+#
+# direction "reverse" maps dst -> [src] (what build_reverse_index produced),
+# "forward" maps src -> [dst]. Every array is opened with mmap, so loading is
+# instant, the index costs a few bytes per edge, and worker processes share the
+# pages read-only. Neighbours keep the edge-file order of the dict index.
+# A graph opened with a relation mask reads only the slices of those relations
+# (neighbours are listed relation by relation: reply, quote, repost).
+
+DIRECTIONS = ("reverse", "forward")
+
+
+def csr_paths(csr_dir, direction, relation=None):
+    name = direction if relation is None else f"{direction}_{relation}"
+    return (os.path.join(csr_dir, f"{name}_indptr.npy"),
+            os.path.join(csr_dir, f"{name}_indices.npy"))
+
+
+def is_csr(csr_dir):
+    return os.path.isfile(os.path.join(csr_dir, "meta.json"))
+
+
+def read_edge_arrays(edges_path):
+    """
+    (src, dst, type) arrays from an edges JSONL file or an edge_extractor directory, in file order.
+    JSONL edges without a "type" get UNTYPED.
+    """
+    if os.path.isdir(edges_path):
+        edges = load_edges(edges_path)
+        return edges["src"].copy(), edges["dst"].copy(), edges["type"].copy()
+    src, dst, types = [], [], []
+    with open_input(edges_path, "rb") as f:
+        for line in f:
+            edge = codec.loads(line)
+            src.append(edge["src"])
+            dst.append(edge["dst"])
+            types.append(TYPE_BY_NAME.get(edge.get("type"), UNTYPED))
+    return (np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64),
+            np.asarray(types, dtype=np.int8))
+
+
+def rows_to_csr(rows, cols, n):
+    """indptr/indices for n rows; a stable sort keeps each row's input order."""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order]
+
+
+def build_csr(src, dst, csr_dir, types=None):
+    """Write the reverse and forward CSR for edges src -> dst, plus one per edge type."""
+    os.makedirs(csr_dir, exist_ok=True)
+    if types is None:
+        types = np.full(len(src), UNTYPED, dtype=np.int8)
+    id_map = IdMap(np.concatenate([src, dst]))
+    src_pos = id_map.encode(src, strict=True)
+    dst_pos = id_map.encode(dst, strict=True)
+
+    id_map.save(os.path.join(csr_dir, "ids.npy"))
+    for direction, rows, cols in (("reverse", dst_pos, src_pos), ("forward", src_pos, dst_pos)):
+        indptr, indices = rows_to_csr(rows, cols, len(id_map))
+        indptr_path, indices_path = csr_paths(csr_dir, direction)
+        np.save(indptr_path, indptr)
+        np.save(indices_path, indices)
+
+        for edge_type, relation in EDGE_TYPE_NAMES.items():
+            sel = types == edge_type
+            indptr, indices = rows_to_csr(rows[sel], cols[sel], len(id_map))
+            indptr_path, indices_path = csr_paths(csr_dir, direction, relation)
+            np.save(indptr_path, indptr)
+            np.save(indices_path, indices)
+
+    by_type = {relation: int(np.count_nonzero(types == t)) for t, relation in EDGE_TYPE_NAMES.items()}
+    by_type["untyped"] = int(np.count_nonzero(types == UNTYPED))
+    write_meta(csr_dir, len(id_map), len(src), by_type)
+    return len(id_map), len(src)
+
+
+def write_meta(csr_dir, n_nodes, n_edges, by_type):
+    # meta.json last: its presence marks a complete index
+    with open(os.path.join(csr_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"nodes": n_nodes, "edges": n_edges, "edges_by_type": by_type}, f, indent=2)
+
+
+# =====================================================
+# OUT-OF-CORE BUILD (graphs larger than RAM)
+# =====================================================
+# Pass 1 cuts the edge stream into chunks that fit the memory budget and saves
+# each as sorted runs: by dst (reverse), by src (forward) and its unique node
+# ids. Pass 2 k-way merges the id runs into ids.npy, then merges each
+# direction's runs and streams the rows straight into memmapped indptr/indices
+# files. Every edge carries its position in the stream (seq) as a tie-breaker,
+# so the result is identical to build_csr.
+
+RUN_DTYPE = np.dtype([("key", "<i8"), ("val", "<i8"), ("type", "i1"), ("seq", "<i8")])
+ID_RUN_DTYPE = np.dtype([("key", "<i8")])
+CUMSUM_BLOCK = 1 << 22
+
+
+def iter_edge_chunks(edges_path, chunk_edges):
+    """(src, dst, type) arrays of at most chunk_edges edges, in file order."""
+    if os.path.isdir(edges_path):
+        for shard in edge_shards(edges_path):
+            edges = np.load(shard, mmap_mode="r")
+            for i in range(0, len(edges), chunk_edges):
+                piece = np.asarray(edges[i:i + chunk_edges])
+                yield piece["src"], piece["dst"], piece["type"]
+        return
+
+    src, dst, types = [], [], []
+    with open_input(edges_path, "rb") as f:
+        for line in f:
+            edge = codec.loads(line)
+            src.append(edge["src"])
+            dst.append(edge["dst"])
+            types.append(TYPE_BY_NAME.get(edge.get("type"), UNTYPED))
+            if len(src) >= chunk_edges:
+                yield np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64), np.asarray(types, dtype=np.int8)
+                src, dst, types = [], [], []
+    if src:
+        yield np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64), np.asarray(types, dtype=np.int8)
+
+
+def alloc_npy(path, dtype, n):
+    """A zero-filled .npy of n elements opened as a writable memmap."""
+    if n == 0:
+        np.save(path, np.empty(0, dtype=dtype))
+        return np.empty(0, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n,))
+
+
+def cumsum_inplace(arr):
+    carry = 0
+    for i in range(0, len(arr), CUMSUM_BLOCK):
+        block = np.cumsum(arr[i:i + CUMSUM_BLOCK]) + carry
+        arr[i:i + CUMSUM_BLOCK] = block
+        carry = int(block[-1])
+
+
+def build_csr_external(edges_path, csr_dir, budget_bytes, tmp_dir=None):
+    """build_csr for edge lists that do not fit in memory; reads edges_path twice at most."""
+    os.makedirs(csr_dir, exist_ok=True)
+    run_dir = mkdtemp(prefix=".csr_runs_", dir=tmp_dir or csr_dir)
+    # a chunk is alive ~4 times while it is sorted (rows, sort order, sorted copy, ids)
+    chunk_edges = max(budget_bytes // (4 * RUN_DTYPE.itemsize), 1024)
+
+    # ===== PASS 1: sorted runs =====
+    runs = {"reverse": [], "forward": [], "ids": []}
+    by_type = {relation: 0 for relation in EDGE_TYPE_NAMES.values()}
+    by_type["untyped"] = 0
+    n_edges = 0
+    for run_id, (src, dst, types) in enumerate(iter_edge_chunks(edges_path, chunk_edges)):
+        for direction, key, val in (("reverse", dst, src), ("forward", src, dst)):
+            rows = np.empty(len(src), dtype=RUN_DTYPE)
+            rows["key"], rows["val"], rows["type"] = key, val, types
+            rows["seq"] = np.arange(n_edges, n_edges + len(src))
+            runs[direction].append(write_run(rows, run_dir, direction, run_id, ("key", "seq")))
+        ids = np.union1d(src, dst).astype(np.int64).view(ID_RUN_DTYPE)
+        runs["ids"].append(write_run(ids, run_dir, "ids", run_id, ("key",)))
+
+        for t, relation in EDGE_TYPE_NAMES.items():
+            by_type[relation] += int(np.count_nonzero(types == t))
+        by_type["untyped"] += int(np.count_nonzero(types == UNTYPED))
+        n_edges += len(src)
+        print(f"[INFO] Run {run_id}: {n_edges:,} edges sorted so far")
+
+    block_rows = max(budget_bytes // (4 * RUN_DTYPE.itemsize * max(len(runs["ids"]), 1)), 1024)
+
+    # ===== PASS 2a: node ids =====
+    raw_ids = os.path.join(run_dir, "ids.bin")
+    n_nodes = 0
+    with open(raw_ids, "wb") as f:
+        for keys in merge_unique(runs["ids"], block_rows):
+            keys.tofile(f)
+            n_nodes += len(keys)
+    ids = alloc_npy(os.path.join(csr_dir, "ids.npy"), np.int64, n_nodes)
+    if n_nodes:
+        raw = np.memmap(raw_ids, dtype=np.int64, mode="r")
+        for i in range(0, n_nodes, CUMSUM_BLOCK):
+            ids[i:i + CUMSUM_BLOCK] = raw[i:i + CUMSUM_BLOCK]
+        ids.flush()
+        del raw
+    del ids
+    id_map = IdMap.load(os.path.join(csr_dir, "ids.npy"), mmap=True)
+    pos_dtype = index_dtype(n_nodes)
+
+    # ===== PASS 2b: merge each direction into indptr/indices =====
+    for direction in DIRECTIONS:
+        targets = [(None, None, n_edges)] + [(relation, t, by_type[relation]) for t, relation in EDGE_TYPE_NAMES.items()]
+        outputs = []
+        for relation, edge_type, count in targets:
+            indptr_path, indices_path = csr_paths(csr_dir, direction, relation)
+            outputs.append({
+                "type": edge_type,
+                "indptr": alloc_npy(indptr_path, np.int64, n_nodes + 1),
+                "indices": alloc_npy(indices_path, pos_dtype, count),
+                "filled": 0,
+            })
+
+        for block in merge_runs(runs[direction], ("key", "seq"), block_rows):
+            rows = id_map.encode(block["key"], strict=True)
+            cols = id_map.encode(block["val"], strict=True)
+            for out in outputs:
+                sel = slice(None) if out["type"] is None else block["type"] == out["type"]
+                r, c = rows[sel], cols[sel]
+                out["indices"][out["filled"]:out["filled"] + len(c)] = c
+                out["filled"] += len(c)
+                # rows arrive sorted, so counts go straight into the (shifted) indptr
+                u, counts = np.unique(r, return_counts=True)
+                out["indptr"][u.astype(np.int64) + 1] += counts
+
+        for out in outputs:
+            cumsum_inplace(out["indptr"])
+            for name in ("indptr", "indices"):
+                if isinstance(out[name], np.memmap):
+                    out[name].flush()
+        del outputs
+
+    shutil.rmtree(run_dir, ignore_errors=True)
+    write_meta(csr_dir, n_nodes, n_edges, by_type)
+    return n_nodes, n_edges
+
+
+class CSRGraph:
+    """Read-only adjacency over mmapped CSR arrays; .get() works like the dict index."""
+
+    def __init__(self, csr_dir, direction="reverse", mmap=True, relations=None):
+        self.csr_dir, self.direction, self.mmap = csr_dir, direction, mmap
+        self.relations = relations
+        self.id_map = IdMap.load(os.path.join(csr_dir, "ids.npy"), mmap=mmap)
+        self.ids = self.id_map.ids
+        self.restricted = {}
+
+        if relations is None:
+            names = [None]
+        else:
+            with open(os.path.join(csr_dir, "meta.json"), "r", encoding="utf-8") as f:
+                if json.load(f).get("edges_by_type", {}).get("untyped", 1):
+                    raise ValueError(f"{csr_dir} has untyped edges; re-extract the edges to filter by relation")
+            names = [EDGE_TYPE_NAMES[t] for t in mask_types(relations)]
+
+        mode = "r" if mmap else None
+        self.slices = []
+        for relation in names:
+            indptr_path, indices_path = csr_paths(csr_dir, direction, relation)
+            self.slices.append((np.load(indptr_path, mmap_mode=mode), np.load(indices_path, mmap_mode=mode)))
+
+    def restrict(self, relations):
+        """The same graph seen through a relation mask (None = every edge)."""
+        if relations == self.relations:
+            return self
+        if relations not in self.restricted:
+            self.restricted[relations] = CSRGraph(self.csr_dir, self.direction, self.mmap, relations)
+        return self.restricted[relations]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, node_id):
+        """Row of node_id, or -1 if the node is not in the graph."""
+        return self.id_map.encode_one(node_id)
+
+    def __contains__(self, node_id):
+        return self.position(node_id) >= 0
+
+    def _row(self, i):
+        if len(self.slices) == 1:
+            indptr, indices = self.slices[0]
+            return indices[indptr[i]:indptr[i + 1]]
+        return np.concatenate([indices[indptr[i]:indptr[i + 1]] for indptr, indices in self.slices])
+
+    def neighbors(self, node_id):
+        """Neighbour ids as an int64 array (empty for unknown nodes)."""
+        i = self.position(node_id)
+        if i < 0:
+            return self.ids[:0]
+        return self.ids[self._row(i)]
+
+    def get(self, node_id, default=None):
+        i = self.position(node_id)
+        if i < 0:
+            return default
+        return self.ids[self._row(i)].tolist()
+
+    @staticmethod
+    def _gather(indptr, indices, rows):
+        """Neighbour positions of all `rows` concatenated, plus each row's length."""
+        starts = np.asarray(indptr[rows])
+        lengths = np.asarray(indptr[rows + 1]) - starts
+        total = int(lengths.sum())
+        if not total:
+            return indices[:0], lengths
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+        return indices[offsets], lengths
+
+    def neighbors_many(self, node_ids):
+        """One neighbour list per id for a whole BFS layer, gathered with one vectorised lookup."""
+        node_ids = list(node_ids)
+        pos = self.id_map.encode(node_ids).astype(np.int64)
+        known = np.flatnonzero(pos >= 0)
+        result = [[] for _ in node_ids]
+
+        for indptr, indices in self.slices:
+            flat, lengths = self._gather(indptr, indices, pos[known])
+            nbrs = self.ids[flat].tolist()
+            bounds = np.cumsum(lengths).tolist()
+            start = 0
+            for k, end in zip(known.tolist(), bounds):
+                if end > start:
+                    result[k] = result[k] + nbrs[start:end] if result[k] else nbrs[start:end]
+                start = end
+        return result
+
+    def expand(self, rows):
+        """
+        Neighbour positions of all `rows` (positions, not ids) concatenated, and for
+        each neighbour the index in `rows` it came from. Same order as neighbors_many.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        flats, owners = [], []
+        for indptr, indices in self.slices:
+            flat, lengths = self._gather(indptr, indices, rows)
+            flats.append(np.asarray(flat, dtype=np.int64))
+            owners.append(np.repeat(np.arange(len(rows)), lengths))
+        if len(flats) == 1:
+            return flats[0], owners[0]
+        flat, owner = np.concatenate(flats), np.concatenate(owners)
+        order = np.argsort(owner, kind="stable")  # per row: relation by relation
+        return flat[order], owner[order]
+
+    def degree(self, rows):
+        """Out-degree of each row position (summed over the relations in view)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        deg = np.zeros(len(rows), dtype=np.int64)
+        for indptr, _ in self.slices:
+            deg += np.asarray(indptr[rows + 1]) - np.asarray(indptr[rows])
+        return deg
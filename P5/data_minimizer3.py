@@ -1,13 +1,20 @@
-import json, os, time, argparse
+import os, time, argparse
 from itertools import islice
-from concurrent.futures import as_completed, ThreadPoolExecutor
+from concurrent.futures import as_completed, ProcessPoolExecutor
 from tempfile import NamedTemporaryFile, mkdtemp
 from pathlib import Path
 from tempfile import mkdtemp
+import numpy as np
+import jsonl_codec as codec
+from compressed_io import is_jsonl, open_input, open_output
+from id_set import IdSet
+from post_store import to_int, list_parts, open_part, part_info
+from manifest import (file_columns, attach_entries, load_manifest, save_manifest_piece,
+                      merge_manifest_pieces, prune_cache, STATUS_DECODE_ERROR)
 
 def iter_files(directory):
     for user in os.scandir(directory):
-        if user.is_file() and user.name.endswith(".jsonl"):
+        if user.is_file() and is_jsonl(user.name):
             yield user.path
 
 def chunker(iterable, chunksize):
@@ -18,25 +25,130 @@ def chunker(iterable, chunksize):
             break
         yield batch
 
-def batch_process(batch, threadless_set, worker_id, tmpdir):
+# --- per-process LUT: memory-mapped once, shared through the page cache ---
+threadless_lut = None
+
+def init_worker(lut_path):
+    global threadless_lut
+    threadless_lut = IdSet.load(lut_path, mmap=True)
+
+def lut_to_npy(lookup, tmpdir):
+    """Text LUTs (one post_id per line) are converted once into a sorted .npy."""
+    if lookup.endswith(".npy"):
+        return lookup
+    npy_path = os.path.join(tmpdir, "threadless_lut.npy")
+    IdSet(np.loadtxt(lookup, dtype=np.int64, ndmin=1)).save(npy_path)
+    return npy_path
+
+def batch_process(batch, worker_id, tmpdir, flush_lines=50_000):
     removed = kept = 0
-    tmp_out = NamedTemporaryFile("w", delete=False, dir=tmpdir, prefix=f"worker_{worker_id}_", suffix=".jsonl")
+    tmp_out = NamedTemporaryFile("wb", delete=False, dir=tmpdir, prefix=f"worker_{worker_id}_", suffix=".jsonl")
+    project = codec.make_projector(("post_id",))
+    lines, pids = [], []
+
+    # batched membership test against the LUT
+    def flush():
+        nonlocal removed, kept
+        drop = threadless_lut.contains_many(pids)
+        for line, is_threadless in zip(lines, drop):
+            if is_threadless:
+                removed += 1
+                continue
+            kept += 1
+            tmp_out.write(line if line.endswith(b"\n") else line + b"\n")
+        lines.clear()
+        pids.clear()
 
     for filepath in batch:
         try:
-            with open(filepath, "r", encoding="utf-8", errors="replace") as f:
+            with open_input(filepath, "rb") as f:
                 for line in f:
                     try:
-                        obj = json.loads(line)
-                    except json.JSONDecodeError:
+                        obj = project(line)
+                    except codec.DecodeError:
                         continue
 
-                    pid = str(obj.get("post_id"))
-                    if pid in threadless_set:
+                    pid = obj.get("post_id")
+                    lines.append(line)
+                    pids.append(to_int(pid))  # "777" matches 777, as in the LUT builder
+                    if len(lines) >= flush_lines:
+                        flush()
+
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+
+    flush()
+    tmp_out.close()
+    print(f"Worker {worker_id}: Removed {removed:,}, Kept {kept:,}")
+    if worker_id % 10 == 0:
+        print(f"Processed {worker_id * len(batch):,} files so far...")
+    return tmp_out.name
+
+# --- same filter, but parsed columns come from the incremental cache (manifest.py) ---
+def cached_batch_process(batch_entries, worker_id, tmpdir, cache_dir):
+    removed = kept = 0
+    tmp_out = NamedTemporaryFile("wb", delete=False, dir=tmpdir, prefix=f"worker_{worker_id}_", suffix=".jsonl")
+    entries = []
+
+    for filepath, entry in batch_entries:
+        try:
+            cols, new_entry, _ = file_columns(filepath, entry, cache_dir)
+            entries.append(new_entry)
+            decoded = cols["status"] != STATUS_DECODE_ERROR
+            drop = threadless_lut.contains_many(cols["post_id"])
+            keep = decoded & ~drop
+            removed += int(np.count_nonzero(decoded & drop))
+            kept += int(np.count_nonzero(keep))
+
+            # offsets index the decompressed stream for .gz/.zst files
+            with open_input(filepath, "rb") as f:
+                data = f.read()
+            for start, length in zip(cols["offset"][keep].tolist(), cols["length"][keep].tolist()):
+                line = data[start:start + length]
+                tmp_out.write(line if line.endswith(b"\n") else line + b"\n")
+
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+
+    save_manifest_piece(cache_dir, worker_id, entries)
+    tmp_out.close()
+    print(f"Worker {worker_id}: Removed {removed:,}, Kept {kept:,}")
+    if worker_id % 10 == 0:
+        print(f"Processed {worker_id * len(batch_entries):,} files so far...")
+    return tmp_out.name
+
+# --- same filter, but post_ids come from a columnar post store (post_store.py) ---
+def store_batch_process(part_dir, worker_id, tmpdir):
+    removed = kept = 0
+    tmp_out = NamedTemporaryFile("wb", delete=False, dir=tmpdir, prefix=f"worker_{worker_id}_", suffix=".jsonl")
+    cols = open_part(part_dir, ["post_id", "file_idx", "line_num"])
+    files = part_info(part_dir)["files"]
+
+    drop = threadless_lut.contains_many(np.asarray(cols["post_id"]))
+    order = np.argsort(cols["file_idx"], kind="stable")
+    bounds = np.searchsorted(np.asarray(cols["file_idx"])[order], np.arange(len(files) + 1))
+    line_nums = np.asarray(cols["line_num"])[order]
+    drop = drop[order]
+
+    # the store only decides what to drop; kept lines are copied from the source files
+    for file_idx, filepath in enumerate(files):
+        lo, hi = bounds[file_idx], bounds[file_idx + 1]
+        stored = set(line_nums[lo:hi].tolist())
+        dropped = set(line_nums[lo:hi][drop[lo:hi]].tolist())
+        try:
+            with open_input(filepath, "rb") as f:
+                for line_num, line in enumerate(f, start=1):
+                    if line_num in dropped:
                         removed += 1
                         continue
+                    if line_num not in stored:
+                        # skipped by the converter: undecodable (dropped here too) or without post_id (kept)
+                        try:
+                            codec.loads(line)
+                        except codec.DecodeError:
+                            continue
                     kept += 1
-                    tmp_out.write(line if line.endswith("\n") else line + "\n")
+                    tmp_out.write(line if line.endswith(b"\n") else line + b"\n")
 
         except Exception as e:
             print(f"Error reading {filepath}: {e}")
@@ -44,37 +156,54 @@ def batch_process(batch, threadless_set, worker_id, tmpdir):
     tmp_out.close()
     print(f"Worker {worker_id}: Removed {removed:,}, Kept {kept:,}")
     if worker_id % 10 == 0:
-        print(f"Processed {worker_id * args.batchsize:,} files so far...")
+        print(f"Processed {worker_id:,} parts so far...")
     return tmp_out.name
 
 def main(args):
     start = time.time()
-    file_iterator = iter_files(args.inputpath)
     tmpdir = args.tempdir or mkdtemp(prefix="minimizer_")
     os.makedirs(tmpdir, exist_ok=True)
     print(f"🗂 Using temporary dir: {tmpdir}")
 
-    with open(args.lookup, "r") as f:
-        threadless_set = set(line.strip() for line in f)
+    lut_path = lut_to_npy(args.lookup, tmpdir)
+
+    if args.cache_dir:
+        os.makedirs(args.cache_dir, exist_ok=True)
+        manifest = load_manifest(args.cache_dir)
+        print(f"🗃 Manifest: {len(manifest):,} files from previous runs")
 
     tmp_files = []
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(lut_path,)) as executor:
         futures = []
         worker_id = 1
-        for batch in chunker(file_iterator, args.batchsize):
-            futures.append(executor.submit(batch_process, batch, threadless_set, worker_id, tmpdir))
-            worker_id += 1
+        if args.store:
+            for part_dir in list_parts(args.store):
+                futures.append(executor.submit(store_batch_process, part_dir, worker_id, tmpdir))
+                worker_id += 1
+        else:
+            for batch in chunker(iter_files(args.inputpath), args.batchsize):
+                if args.cache_dir:
+                    futures.append(executor.submit(cached_batch_process, attach_entries(batch, manifest),
+                                                   worker_id, tmpdir, args.cache_dir))
+                else:
+                    futures.append(executor.submit(batch_process, batch, worker_id, tmpdir))
+                worker_id += 1
 
         for fut in as_completed(futures):
             tmp_files.append(fut.result())
 
-    # Combine worker outputs
-    with open(args.output, "w", encoding="utf-8") as out:
+    if args.cache_dir:
+        prune_cache(args.cache_dir, manifest, merge_manifest_pieces(args.cache_dir))
+
+    # Combine worker outputs (compressed when --output ends in .gz/.zst)
+    with open_output(args.output, "wb") as out:
         for tmp in tmp_files:
-            with open(tmp, "r", encoding="utf-8") as f:
+            with open(tmp, "rb") as f:
                 for line in f:
                     out.write(line)
             os.remove(tmp)
+    if lut_path != args.lookup:
+        os.remove(lut_path)
 
     dt = time.time() - start
     print(f"✅ Done in {dt:.2f} seconds")
@@ -83,11 +212,17 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--inputpath", type=str, required=True, help="Path to input directory")
+    parser.add_argument("--inputpath", type=str, help="Path to input directory")
+    parser.add_argument("--store", type=str, help="Columnar post store (post_store.py) of the input directory; only post_id/file_idx/line_num are read to filter")
     parser.add_argument("--output", type=str, required=True, help="Output filepath")
-    parser.add_argument("--lookup", type=str, required=True, help="Path to lookup table (LUT)")
+    parser.add_argument("--lookup", type=str, required=True, help="Path to lookup table (LUT), text or .npy from threadless_posts4")
     parser.add_argument("--tempdir", type=str, required=True, help="Path to temporary directory")
+    parser.add_argument("--cache_dir", type=str, help="Manifest + per-file cache for incremental re-runs")
     parser.add_argument("--workers", type=int, default=32)
     parser.add_argument("--batchsize", type=int, default=1000)
     args = parser.parse_args()
+    if not (args.inputpath or args.store):
+        parser.error("one of --inputpath or --store is required")
+    if args.cache_dir and args.store:
+        parser.error("--cache_dir needs --inputpath")
     main(args)
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import jsonl_codec as codec
+from spill import spill_partitioned, partition_files, partition_bytes, load_partition
+
+# =====================================================
+# CORPUS-WIDE DUPLICATE POST DETECTION
+# =====================================================
+# Every post becomes one (post_id, file_id, line_num) row. file_id packs the
+# worker id and the file's index in that worker's batch, so rows stay 20 bytes
+# and paths are only resolved for the duplicates themselves. Rows are
+# hash-partitioned by post_id (spill.py); a partition that is larger than the
+# memory budget is re-partitioned with a new salt until it fits.
+
+ROW_DTYPE = np.dtype([("post_id", "<i8"), ("file_id", "<i8"), ("line_num", "<i4")])
+MAX_SPLITS = 4
+
+
+def make_file_id(worker_id, file_idx):
+    return (np.int64(worker_id) << np.int64(32)) | np.asarray(file_idx, dtype=np.int64)
+
+
+def make_rows(pids, file_ids, line_nums):
+    rows = np.empty(len(pids), dtype=ROW_DTYPE)
+    rows["post_id"] = pids
+    rows["file_id"] = file_ids
+    rows["line_num"] = line_nums
+    return rows
+
+
+def repeated(rows):
+    """Rows whose post_id already occurs at an earlier (file_id, line_num)."""
+    order = np.lexsort((rows["line_num"], rows["file_id"], rows["post_id"]))
+    sorted_rows = rows[order]
+    dup_mask = np.zeros(len(rows), dtype=bool)
+    dup_mask[1:] = sorted_rows["post_id"][1:] == sorted_rows["post_id"][:-1]
+    return sorted_rows[dup_mask]
+
+
+# --- file_id -> path, loading each worker's file list only when needed ---
+class FileResolver:
+    def __init__(self, spill_dir=None, files=None):
+        self.spill_dir = spill_dir
+        self.files = files if files is not None else {}
+
+    def __call__(self, file_id):
+        worker_id, file_idx = int(file_id) >> 32, int(file_id) & 0xFFFFFFFF
+        if worker_id not in self.files:
+            self.files[worker_id] = load_file_list(self.spill_dir, worker_id)
+        return self.files[worker_id][file_idx]
+
+
+def file_list_path(spill_dir, worker_id):
+    return os.path.join(spill_dir, f"files-w{worker_id:06d}.txt")
+
+
+def save_file_list(spill_dir, worker_id, files):
+    with open(file_list_path(spill_dir, worker_id), "w", encoding="utf-8") as f:
+        for path in files:
+            f.write(path + "\n")
+
+
+def load_file_list(spill_dir, worker_id):
+    with open(file_list_path(spill_dir, worker_id), "r", encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def write_duplicates(dups, resolve, out):
+    for row in dups:
+        out.write(codec.dumpline({
+            "file": resolve(row["file_id"]),
+            "post_id": int(row["post_id"]),
+            "line_num": int(row["line_num"]),
+        }))
+    return len(dups)
+
+
+# =====================================================
+# PARTITION REDUCTION (bounded memory)
+# =====================================================
+def reduce_rows_partition(spill_dir, prefix, k, out_path, budget_bytes, root=None, salt=0):
+    """
+    Find duplicates in partition k and stream them to out_path (one shard).
+    Oversized partitions are split again by a different hash salt, piece by piece.
+    `root` is the spill dir holding the per-worker file lists.
+    Returns the number of duplicate rows written.
+    """
+    root = root or spill_dir
+    # past MAX_SPLITS the partition is dominated by very few post_ids; load it as is
+    if partition_bytes(spill_dir, prefix, k) <= budget_bytes or salt >= MAX_SPLITS:
+        rows = load_partition(spill_dir, prefix, k, dtype=ROW_DTYPE, remove=True)
+        with open(out_path, "ab") as out:
+            return write_duplicates(repeated(rows), FileResolver(root), out)
+
+    sub_dir = os.path.join(spill_dir, f"{prefix}-p{k:04d}-split{salt + 1}")
+    os.makedirs(sub_dir, exist_ok=True)
+    n_sub = int(partition_bytes(spill_dir, prefix, k) // max(budget_bytes, 1)) + 2
+    for i, path in enumerate(partition_files(spill_dir, prefix, k)):
+        spill_partitioned(np.load(path), sub_dir, prefix, i, n_sub, key="post_id", salt=salt + 1)
+        os.remove(path)
+
+    total = 0
+    for j in range(n_sub):
+        total += reduce_rows_partition(sub_dir, prefix, j, out_path, budget_bytes, root, salt + 1)
+    os.rmdir(sub_dir)
+    return total
@@ -0,0 +1,225 @@
+import os
+import json
+import glob
+import time
+import argparse
+from itertools import islice
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import numpy as np
+import jsonl_codec as codec
+from compressed_io import is_jsonl, open_input, open_output
+from byte_range_reader import plan_ranges, iter_range_lines
+from id_set import IdSet
+from post_store import NULL_ID, to_int
+
+# =====================================================
+# PARALLEL BINARY EDGE EXTRACTION
+# =====================================================
+# Workers take batches of per-user files (or byte ranges of one big JSONL) and
+# write their edges as one structured .npy shard each:
+#
+#   <out>/edges-tNNNNNN.npy   (src, dst, type) records, shards in input order
+#   <out>/roots.npy           IdSet: targets that never point anywhere
+#   <out>/isolated.npy        IdSet: posts with no edge in or out
+#   <out>/meta.json           counts per edge type
+#
+# Roots and isolated posts come from per-shard IdSets combined with
+# vectorised set operations, so the parent never parses a line.
+
+EDGE_DTYPE = np.dtype([("src", "<i8"), ("dst", "<i8"), ("type", "i1")])
+REPLY, QUOTE, REPOST = 0, 1, 2
+EDGE_TYPES = {"reply_to": REPLY, "quotes": QUOTE, "repost_from": REPOST}
+EDGE_TYPE_NAMES = {REPLY: "reply", QUOTE: "quote", REPOST: "repost"}
+TYPE_BY_NAME = {name: t for t, name in EDGE_TYPE_NAMES.items()}
+UNTYPED = -1  # edges from older untyped JSONL files
+POST_FIELDS = ("post_id",) + tuple(EDGE_TYPES)
+
+
+# --- helper: iterate over files ---
+def iter_files(directory):
+    for entry in os.scandir(directory):
+        if entry.is_file() and is_jsonl(entry.name):
+            yield entry.path
+
+# --- helper: chunking generator ---
+def chunker(iterable, chunksize):
+    filenames = iter(iterable)
+    while True:
+        batch = list(islice(filenames, chunksize))
+        if not batch:
+            break
+        yield batch
+
+
+# --- relation masks: one bit per edge type ---
+def relation_mask(names):
+    """Bitmask from relation names, e.g. "reply,repost" or ["reply"]."""
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(",") if n.strip()]
+    mask = 0
+    for name in names:
+        if name not in TYPE_BY_NAME:
+            raise ValueError(f"unknown relation {name!r} (expected one of {', '.join(TYPE_BY_NAME)})")
+        mask |= 1 << TYPE_BY_NAME[name]
+    return mask
+
+
+def mask_types(mask):
+    return [t for t in EDGE_TYPE_NAMES if mask & (1 << t)]
+
+
+def shard_path(out_dir, task_id):
+    return os.path.join(out_dir, f"edges-t{task_id:06d}.npy")
+
+
+def edge_shards(edge_dir):
+    return sorted(glob.glob(os.path.join(edge_dir, "edges-t*.npy")))
+
+
+def load_edges(edge_dir):
+    """All edges of an extractor output directory, in input order."""
+    shards = [np.load(p) for p in edge_shards(edge_dir)]
+    return np.concatenate(shards) if shards else np.empty(0, dtype=EDGE_DTYPE)
+
+
+# =====================================================
+# WORKERS
+# =====================================================
+def parse_lines(lines):
+    """
+    Edges in extract_edges order (per post: reply_to, quotes, repost_from) + post ids,
+    and the number of malformed lines skipped. Ids are coerced like post_store.to_int
+    ("777" is 777); a line without a usable post_id is skipped, as is an unusable target.
+    """
+    project = codec.make_projector(POST_FIELDS)
+    src, dst, kind, pids = [], [], [], []
+    skipped = 0
+    for line in lines:
+        try:
+            post = project(line)
+        except codec.DecodeError:
+            skipped += 1
+            continue
+        pid = to_int(post.get("post_id"))
+        if pid == NULL_ID:
+            if post.get("post_id") is not None:
+                skipped += 1
+            continue
+        pids.append(pid)
+        for field, edge_type in EDGE_TYPES.items():
+            target = post.get(field)
+            target = to_int(target) if target else NULL_ID
+            if target != NULL_ID:
+                src.append(pid)
+                dst.append(target)
+                kind.append(edge_type)
+
+    edges = np.empty(len(src), dtype=EDGE_DTYPE)
+    edges["src"], edges["dst"], edges["type"] = src, dst, kind
+    return edges, pids, skipped
+
+
+def save_shard(edges, pids, skipped, out_dir, task_id):
+    np.save(shard_path(out_dir, task_id), edges)
+    type_counts = np.bincount(edges["type"], minlength=len(EDGE_TYPE_NAMES))
+    return len(edges), type_counts, IdSet(pids), IdSet(edges["src"]), IdSet(edges["dst"]), skipped
+
+
+def extract_files(batch, task_id, out_dir):
+    edges, pids = [], []
+    skipped = 0
+    for filepath in batch:
+        try:
+            with open_input(filepath, "rb") as f:
+                file_edges, file_pids, file_skipped = parse_lines(f)
+            edges.append(file_edges)
+            pids.extend(file_pids)
+            skipped += file_skipped
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+    edges = np.concatenate(edges) if edges else np.empty(0, dtype=EDGE_DTYPE)
+    return save_shard(edges, pids, skipped, out_dir, task_id)
+
+
+def extract_range(path, start, end, task_id, out_dir):
+    edges, pids, skipped = parse_lines(iter_range_lines(path, start, end))
+    return save_shard(edges, pids, skipped, out_dir, task_id)
+
+
+# =====================================================
+# MAIN
+# =====================================================
+def main(args):
+    start = time.time()
+    os.makedirs(args.output, exist_ok=True)
+    for old in edge_shards(args.output):
+        os.remove(old)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if args.input:
+            tasks = plan_ranges(args.input, int(args.chunk_mb * 1024 * 1024))
+            futures = [executor.submit(extract_range, path, s, e, task_id, args.output)
+                       for task_id, (path, s, e) in enumerate(tasks)]
+        else:
+            futures = [executor.submit(extract_files, batch, task_id, args.output)
+                       for task_id, batch in enumerate(chunker(iter_files(args.inputpath), args.batchsize))]
+
+        n_edges = n_skipped = 0
+        type_counts = np.zeros(len(EDGE_TYPE_NAMES), dtype=np.int64)
+        posts, sources, targets = [], [], []
+        for fut in as_completed(futures):
+            count, counts, p, s, t, skipped = fut.result()
+            n_edges += count
+            n_skipped += skipped
+            type_counts += counts
+            posts.append(p)
+            sources.append(s)
+            targets.append(t)
+
+    posts, sources, targets = IdSet.union_all(posts), IdSet.union_all(sources), IdSet.union_all(targets)
+    roots = targets - sources
+    isolated = posts - targets - sources
+    if args.with_isolated:
+        # same roots as reverse_hybrid_search3.extract_edges on an unminimized input
+        roots |= isolated
+
+    roots.save(os.path.join(args.output, "roots.npy"))
+    isolated.save(os.path.join(args.output, "isolated.npy"))
+    if args.roots_jsonl:
+        with open_output(args.roots_jsonl, "wb") as f:
+            for r in roots:
+                f.write(codec.dumpline(r))
+
+    meta = {
+        "edges": n_edges,
+        "edges_by_type": {EDGE_TYPE_NAMES[t]: int(c) for t, c in enumerate(type_counts)},
+        "posts": len(posts),
+        "roots": len(roots),
+        "isolated": len(isolated),
+        "shards": len(futures),
+    }
+    with open(os.path.join(args.output, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"✅ {n_edges:,} edges in {len(futures)} shards -> {args.output}")
+    print(f"   by type: {meta['edges_by_type']}")
+    print(f"   roots: {len(roots):,}, isolated posts: {len(isolated):,}")
+    if n_skipped:
+        print(f"[WARN] Skipped {n_skipped:,} malformed lines (undecodable or non-integer post_id)")
+    print(f"Δt = {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract typed edges into binary shards with worker processes.")
+    parser.add_argument("--inputpath", type=str, help="Per-user posts directory")
+    parser.add_argument("--input", type=str, nargs="+", help="JSONL file(s) read by byte ranges instead of --inputpath")
+    parser.add_argument("--output", type=str, required=True, help="Output directory for edge shards, roots.npy, isolated.npy")
+    parser.add_argument("--roots_jsonl", type=str, default=None, help="Also write the roots as JSONL (reverse_hybrid_search3 --roots_file)")
+    parser.add_argument("--with_isolated", action="store_true", help="Count isolated posts as roots, like extract_edges")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batchsize", type=int, default=1000, help="Files per task with --inputpath")
+    parser.add_argument("--chunk_mb", type=float, default=64, help="Byte range per task with --input, in MB")
+    args = parser.parse_args()
+    if not (args.inputpath or args.input):
+        parser.error("one of --inputpath or --input is required")
+    main(args)
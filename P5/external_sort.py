@@ -0,0 +1,69 @@
+import os
+import numpy as np
+
+# =====================================================
+# EXTERNAL SORT: SORTED RUNS + BLOCK-WISE K-WAY MERGE
+# =====================================================
+# Chunks that fit the memory budget are sorted and saved as .npy runs. The
+# merge memory-maps every run and reads `block_rows` rows of each at a time:
+# everything up to the smallest "last row of a block" (over runs that still
+# have more rows) is final, so it is sorted and emitted, and the cursors move
+# on. Peak memory is about k * block_rows rows, independent of the data size.
+
+
+def sort_rows(rows, fields):
+    """Rows sorted lexicographically by `fields` (first field is the primary key)."""
+    return rows[np.lexsort([rows[f] for f in reversed(fields)])]
+
+
+def write_run(rows, run_dir, prefix, run_id, fields):
+    path = os.path.join(run_dir, f"{prefix}-run{run_id:06d}.npy")
+    np.save(path, sort_rows(rows, fields))
+    return path
+
+
+def _count_le(block, threshold, fields):
+    """How many leading rows of a sorted block are <= threshold (lexicographic)."""
+    le = np.zeros(len(block), dtype=bool)
+    eq = np.ones(len(block), dtype=bool)
+    for f in fields:
+        le |= eq & (block[f] < threshold[f])
+        eq &= block[f] == threshold[f]
+    return int(np.count_nonzero(le | eq))
+
+
+def merge_runs(paths, fields, block_rows):
+    """Yield the rows of all runs as globally sorted blocks."""
+    runs = [np.load(p, mmap_mode="r") for p in paths]
+    pos = [0] * len(runs)
+
+    while True:
+        blocks = [(i, run[pos[i]:pos[i] + block_rows]) for i, run in enumerate(runs) if pos[i] < len(run)]
+        if not blocks:
+            return
+
+        # a block's last row bounds what may still come from that run
+        bounds = [block[-1] for i, block in blocks if pos[i] + len(block) < len(runs[i])]
+        threshold = min(bounds, key=lambda row: tuple(row[f] for f in fields)) if bounds else None
+
+        taken = []
+        for i, block in blocks:
+            n = len(block) if threshold is None else _count_le(block, threshold, fields)
+            if n:
+                taken.append(np.asarray(block[:n]))
+                pos[i] += n
+        yield sort_rows(np.concatenate(taken), fields)
+
+
+def merge_unique(paths, block_rows):
+    """Yield the sorted union of sorted unique int64 runs, block by block, without repeats."""
+    last = None
+    for block in merge_runs(paths, ("key",), block_rows):
+        keys = block["key"]
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = keys[1:] != keys[:-1]
+        if last is not None and len(keys):
+            keep[0] = keys[0] != last
+        if len(keys):
+            last = keys[-1]
+        yield keys[keep]
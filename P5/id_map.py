@@ -0,0 +1,143 @@
+import os
+import time
+import argparse
+from itertools import islice
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import numpy as np
+import jsonl_codec as codec
+from compressed_io import is_jsonl, open_input
+from id_set import IdSet, IdSetBuilder
+
+# =====================================================
+# DENSE ID REMAPPING
+# =====================================================
+# Sparse 64-bit ids (post_id, user_id) <-> dense positions 0..n-1.
+# The map is just the sorted unique ids: encode is a searchsorted, decode is an
+# array lookup, and the persisted .npy can be mmapped and shared by every stage.
+# Positions are int32 while they fit, so arrays indexed by them stay small.
+
+MISSING = -1
+
+
+def index_dtype(n):
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+
+class IdMap:
+    __slots__ = ("ids",)
+
+    def __init__(self, ids=None, assume_unique=False):
+        self.ids = IdSet(ids, assume_unique=assume_unique).ids
+
+    @classmethod
+    def from_idset(cls, id_set):
+        return cls(id_set.ids, assume_unique=True)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dtype(self):
+        return index_dtype(len(self.ids))
+
+    def encode(self, values, strict=False):
+        """Dense positions of `values`; unknown ids become MISSING (or raise if strict)."""
+        values = np.asarray(values, dtype=np.int64)
+        pos = np.searchsorted(self.ids, values)
+        if not len(self.ids):
+            found = np.zeros(len(values), dtype=bool)
+        else:
+            found = self.ids[np.minimum(pos, len(self.ids) - 1)] == values
+        if strict and not found.all():
+            raise KeyError(f"{int((~found).sum())} ids are not in the map")
+        return np.where(found, pos, MISSING).astype(self.dtype)
+
+    def encode_one(self, value):
+        i = int(np.searchsorted(self.ids, value))
+        return i if i < len(self.ids) and self.ids[i] == value else MISSING
+
+    def decode(self, positions):
+        return self.ids[np.asarray(positions)]
+
+    def save(self, path):
+        np.save(path, self.ids)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        return cls(np.load(path, mmap_mode="r" if mmap else None), assume_unique=True)
+
+
+# =====================================================
+# BUILD POST/USER MAPS FROM THE PER-USER POSTS (one pass)
+# =====================================================
+MAPPED_FIELDS = ("post_id", "user_id")
+
+
+def iter_files(directory):
+    for entry in os.scandir(directory):
+        if entry.is_file() and is_jsonl(entry.name):
+            yield entry.path
+
+
+def chunker(iterable, chunksize):
+    filenames = iter(iterable)
+    while True:
+        batch = list(islice(filenames, chunksize))
+        if not batch:
+            break
+        yield batch
+
+
+def collect_ids(batch, fields):
+    project = codec.make_projector(fields)
+    builders = {field: IdSetBuilder() for field in fields}
+    for filepath in batch:
+        try:
+            with open_input(filepath, "rb") as f:
+                for line in f:
+                    try:
+                        post = project(line)
+                    except codec.DecodeError:
+                        continue
+                    for field in fields:
+                        value = post.get(field)
+                        if isinstance(value, int):
+                            builders[field].add(value)
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+    return {field: builder.build() for field, builder in builders.items()}
+
+
+def map_path(output_dir, field):
+    return os.path.join(output_dir, f"{field}s.npy")
+
+
+def main(args):
+    start = time.time()
+    os.makedirs(args.output, exist_ok=True)
+    fields = MAPPED_FIELDS
+
+    collected = {field: [] for field in fields}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(collect_ids, batch, fields)
+                   for batch in chunker(iter_files(args.inputpath), args.batchsize)]
+        for fut in as_completed(futures):
+            for field, ids in fut.result().items():
+                collected[field].append(ids)
+
+    for field in fields:
+        id_map = IdMap.from_idset(IdSet.union_all(collected[field]))
+        id_map.save(map_path(args.output, field))
+        print(f"✅ {field}: {len(id_map):,} ids -> {map_path(args.output, field)} ({np.dtype(id_map.dtype).name} positions)")
+
+    print(f"Δt = {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build dense post_id/user_id maps from the per-user posts directory.")
+    parser.add_argument("--inputpath", type=str, required=True, help="Path to input directory")
+    parser.add_argument("--output", type=str, required=True, help="Directory for post_ids.npy / user_ids.npy")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batchsize", type=int, default=1000)
+    args = parser.parse_args()
+    main(args)
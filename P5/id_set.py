@@ -0,0 +1,98 @@
+import numpy as np
+
+# =====================================================
+# COMPACT INTEGER ID SETS
+# =====================================================
+# A set of post ids kept as one sorted, unique int64 array: 8 bytes per id
+# (a Python set of ints costs ~60-90), cheap to pickle between processes,
+# and union/difference/intersection run as vectorized merges.
+
+
+class IdSet:
+    __slots__ = ("ids",)
+
+    def __init__(self, ids=None, assume_unique=False):
+        if ids is None:
+            self.ids = np.empty(0, dtype=np.int64)
+        elif assume_unique:
+            self.ids = np.asarray(ids, dtype=np.int64)
+        else:
+            self.ids = np.unique(np.asarray(ids, dtype=np.int64))
+
+    @classmethod
+    def union_all(cls, sets):
+        arrays = [s.ids for s in sets if len(s)]
+        if not arrays:
+            return cls()
+        return cls(np.concatenate(arrays))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __contains__(self, value):
+        i = np.searchsorted(self.ids, value)
+        return i < len(self.ids) and self.ids[i] == value
+
+    def contains_many(self, values):
+        """Boolean mask: which of `values` are in the set."""
+        values = np.asarray(values, dtype=np.int64)
+        if not len(self.ids):
+            return np.zeros(len(values), dtype=bool)
+        idx = np.searchsorted(self.ids, values)
+        idx[idx == len(self.ids)] = 0
+        return self.ids[idx] == values
+
+    def union(self, other):
+        return IdSet(np.union1d(self.ids, other.ids), assume_unique=True)
+
+    def difference(self, other):
+        return IdSet(np.setdiff1d(self.ids, other.ids, assume_unique=True), assume_unique=True)
+
+    def intersection(self, other):
+        return IdSet(np.intersect1d(self.ids, other.ids, assume_unique=True), assume_unique=True)
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    def save(self, path):
+        np.save(path, self.ids)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        return cls(np.load(path, mmap_mode="r" if mmap else None), assume_unique=True)
+
+
+class IdSetBuilder:
+    """Collects ids one by one; compacts to sorted unique chunks every `flush` ids."""
+
+    def __init__(self, flush=1_000_000):
+        self.flush = flush
+        self.pending = []
+        self.chunks = []
+
+    def add(self, value):
+        self.pending.append(value)
+        if len(self.pending) >= self.flush:
+            self._compact()
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        if len(values):
+            self.chunks.append(np.unique(values))
+
+    def _compact(self):
+        if self.pending:
+            self.chunks.append(np.unique(np.asarray(self.pending, dtype=np.int64)))
+            self.pending = []
+
+    def build(self):
+        self._compact()
+        if not self.chunks:
+            return IdSet()
+        if len(self.chunks) == 1:
+            return IdSet(self.chunks[0], assume_unique=True)
+        return IdSet(np.concatenate(self.chunks))
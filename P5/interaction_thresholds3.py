@@ -1,21 +1,10 @@
 import json
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from pathlib import Path
 from collections import defaultdict
 import argparse
-
-
-def batch_reader(file_path, batch_size):
-    batch = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            batch.append(line)
-            if len(batch) >= batch_size:
-                yield batch
-                batch = []
-        if batch:
-            yield batch
+import jsonl_codec as codec
+from byte_range_reader import map_ranges
 
 
 def build_threshold_key(t):
@@ -36,8 +25,8 @@ def process_batch(batch_lines, thresholds):
 
     for line in batch_lines:
         try:
-            obj = json.loads(line)
-        except json.JSONDecodeError:
+            obj = codec.loads(line)
+        except codec.DecodeError:
             continue
 
         wl, wd = obj.get("walk_length", 0), obj.get("walk_depth", 0)
@@ -62,22 +51,16 @@ def write_results(result_dict, output):
         if not records:
             continue
         out_path = output / f"{key}.jsonl"
-        with open(out_path, "a", encoding="utf-8") as f:
+        with open(out_path, "ab") as f:
             for rec in records:
-                f.write(json.dumps(rec) + "\n")
-
-
-def count_lines(filename):
-    with open(filename, "r", encoding="utf-8") as f:
-        return sum(1 for _ in f)
+                f.write(codec.dumpline(rec))
 
 
 def main(args):
     start_time = time.time()
-    total_lines = count_lines(args.input)
     output_dir = Path(args.output)
-    print(f"📊 Total lines to process: {total_lines:,}")
-    print(f"⚙️  Using {args.workers} workers, batch size {args.batchsize:,}")
+    print(f"📊 Total bytes to process: {sum(Path(p).stat().st_size for p in args.input):,}")
+    print(f"⚙️  Using {args.workers} workers, chunk size {args.chunk_mb:g} MB")
     print("=" * 60)
 
     # --- Load thresholds dynamically ---
@@ -95,34 +78,14 @@ def main(args):
     print("=" * 60)
 
     global_counts = defaultdict(int)
-    processed_lines = 0
-    futures = set()
-
-    with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        for batch in batch_reader(args.input, args.batchsize):
-            processed_lines += len(batch)
-
-            # Throttle number of queued futures to prevent memory growth
-            if len(futures) >= args.workers * 2:
-                done, futures = wait(futures, return_when=FIRST_COMPLETED)
-                for f in done:
-                    result_dict, counts = f.result()
-                    write_results(result_dict, output_dir)
-                    for k, v in counts.items():
-                        global_counts[k] += v
-
-            futures.add(executor.submit(process_batch, batch, thresholds))
-
-            if processed_lines % args.progress == 0:
-                print(f"➡️  {processed_lines:,} / {total_lines:,} lines processed")
-
-        # Drain any remaining futures
-        for f in as_completed(futures):
-            result_dict, counts = f.result()
-            write_results(result_dict, output_dir)
-            for k, v in counts.items():
-                global_counts[k] += v
-        print(f"➡️  {total_lines:,} / {total_lines:,} lines processed")
+
+    # Workers read their own byte ranges; results stream back as they complete
+    for result_dict, counts in map_ranges(args.input, process_batch, args.workers,
+                                          chunk_bytes=int(args.chunk_mb * 1024 * 1024),
+                                          args=(thresholds,), progress_every=args.progress):
+        write_results(result_dict, output_dir)
+        for k, v in counts.items():
+            global_counts[k] += v
 
     total_time = time.time() - start_time
     print("\n✅ Done.")
@@ -139,11 +102,11 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Two-pass reverse hybrid traversal for Bluesky posts.")
-    parser.add_argument("--input", type=str, required=True, help="Input JSONL file with posts")
+    parser.add_argument("--input", type=str, required=True, nargs="+", help="Input JSONL file(s) with posts, optionally .gz/.zst shards")
     parser.add_argument("--output", type=str, default="thresholds", help="Output directory for traversal results")
     parser.add_argument("--thresholds", type=str, help="JSON string or .json file defining thresholds")
     parser.add_argument("--workers", type=int, default=4, help="Number of threads for parallel traversal")
-    parser.add_argument("--batchsize", type=int, default=1_000, help="Number of lines per batch")
-    parser.add_argument("--progress", type=int, default=10_000, help="How many processed lines between each progress update")
+    parser.add_argument("--chunk_mb", type=float, default=64, help="Size of each worker's byte range in MB")
+    parser.add_argument("--progress", type=float, default=10.0, help="Seconds between progress updates")
     args = parser.parse_args()
     main(args)
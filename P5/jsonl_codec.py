@@ -0,0 +1,92 @@
+import json
+
+# =====================================================
+# JSON CODEC (picked once at import time)
+# =====================================================
+# Preference: orjson > msgspec > ujson > stdlib json. Every backend exposes
+#   loads(str | bytes) -> obj
+#   dumps_bytes(obj)   -> bytes (utf-8, no trailing newline, non-ascii kept)
+# Projected decoding (only some keys) uses msgspec when installed, which skips
+# unrequested values like "text" without building Python objects for them.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _stdlib_dumps_bytes(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+BACKENDS = {"json": (json.loads, _stdlib_dumps_bytes)}
+if ujson is not None:
+    BACKENDS["ujson"] = (ujson.loads, lambda obj: ujson.dumps(obj, ensure_ascii=False).encode("utf-8"))
+if msgspec is not None:
+    BACKENDS["msgspec"] = (msgspec.json.decode, msgspec.json.encode)
+if orjson is not None:
+    BACKENDS["orjson"] = (orjson.loads, orjson.dumps)
+
+CODEC = next(name for name in ("orjson", "msgspec", "ujson", "json") if name in BACKENDS)
+loads, dumps_bytes = BACKENDS[CODEC]
+
+# Exceptions a caller should treat as "malformed line"
+DecodeError = (ValueError,) if msgspec is None else (ValueError, msgspec.DecodeError)
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def dumpline(obj):
+    """One JSONL record as bytes, newline included — write to files opened in 'wb'/'ab'."""
+    return dumps_bytes(obj) + b"\n"
+
+
+# =====================================================
+# FIELD PROJECTION
+# =====================================================
+def make_projector(keys, backend=None):
+    """
+    Returns decode(line) -> dict holding only `keys` (missing keys are absent or None).
+    Use it where a stage needs a handful of fields and never looks at "text".
+    """
+    keys = tuple(keys)
+    backend = backend or ("msgspec" if msgspec is not None else CODEC)
+
+    if backend == "msgspec" and msgspec is not None:
+        from typing import Any
+        proj_type = msgspec.defstruct("Projection", [(k, Any, None) for k in keys])
+        decoder = msgspec.json.Decoder(proj_type)
+
+        def project(line):
+            rec = decoder.decode(line)
+            return {k: getattr(rec, k) for k in keys}
+    else:
+        full_loads = BACKENDS[backend][0]
+
+        def project(line):
+            obj = full_loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError("JSONL record is not an object")
+            return {k: obj[k] for k in keys if k in obj}
+
+    def decode(line):
+        try:
+            return project(line)
+        except DecodeError:
+            # raw bytes with broken utf-8: retry like open(..., errors="replace") would
+            if isinstance(line, bytes):
+                return project(line.decode("utf-8", errors="replace"))
+            raise
+    return decode
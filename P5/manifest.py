@@ -0,0 +1,224 @@
+import os
+import hashlib
+import numpy as np
+import jsonl_codec as codec
+from post_store import NULL_ID, to_int
+from compressed_io import is_compressed, open_input
+
+# =====================================================
+# INCREMENTAL RE-INGEST: PER-FILE MANIFEST + CACHED COLUMNS
+# =====================================================
+# <cache_dir>/manifest.jsonl  one {"path", "size", "mtime_ns", "hash", "newline", "parser"} per user file
+# <cache_dir>/files/xx/<key>.npz  the columns every stage derives its results from:
+#   offset, length, line_num, status   one entry per line (byte span in the file)
+#   post_id, reply_to, quotes, repost_from   int64, NULL_ID when missing
+#
+# A re-run only parses what changed:
+#   same size + mtime                     -> reuse the cached columns
+#   grown, old bytes hash to the old hash -> parse only the appended tail
+#   anything else                         -> full rescan of that file
+# For .gz/.zst files offset/length index the decompressed stream and an append
+# always triggers a full rescan (the compressed bytes can't be resumed mid-file).
+# Entries written by an older PARSER_VERSION are rescanned as well.
+
+PARSER_VERSION = 2  # 2: numeric-string ids are parsed like post_store.to_int does
+STATUS_OK, STATUS_DECODE_ERROR, STATUS_MISSING_ID = 0, 1, 2
+STATUS_REASONS = {STATUS_DECODE_ERROR: "decode_error", STATUS_MISSING_ID: "missing_post_id"}
+
+EDGE_FIELDS = ("reply_to", "quotes", "repost_from")
+COLUMNS = {
+    "offset": np.int64, "length": np.int64, "line_num": np.int32, "status": np.int8,
+    "post_id": np.int64, "reply_to": np.int64, "quotes": np.int64, "repost_from": np.int64,
+}
+
+
+def manifest_path(cache_dir):
+    return os.path.join(cache_dir, "manifest.jsonl")
+
+
+def load_manifest(cache_dir):
+    manifest = {}
+    path = manifest_path(cache_dir)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                entry = codec.loads(line)
+                manifest[entry["path"]] = entry
+    return manifest
+
+
+def save_manifest(cache_dir, manifest):
+    tmp_path = manifest_path(cache_dir) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for entry in manifest.values():
+            f.write(codec.dumpline(entry))
+    os.replace(tmp_path, manifest_path(cache_dir))
+
+
+def cache_path(cache_dir, filepath):
+    key = hashlib.blake2b(filepath.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, "files", key[:2], f"{key}.npz")
+
+
+def hash_file(filepath, start=0, limit=None, h=None):
+    """Feed bytes [start, start + limit) of the file into blake2b hasher `h`."""
+    h = h or hashlib.blake2b(digest_size=16)
+    remaining = limit
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        while remaining is None or remaining > 0:
+            block = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            h.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return h
+
+
+# =====================================================
+# PARSING
+# =====================================================
+def parse_file(filepath, start=0, first_line=1):
+    """Parse lines from byte `start` on; returns {column: array}."""
+    project = codec.make_projector(("post_id",) + EDGE_FIELDS)
+    cols = {name: [] for name in COLUMNS}
+
+    with open_input(filepath, "rb") as f:
+        if start:
+            f.seek(start)
+        offset = start
+        for line_num, line in enumerate(f, start=first_line):
+            cols["offset"].append(offset)
+            cols["length"].append(len(line))
+            cols["line_num"].append(line_num)
+            offset += len(line)
+            try:
+                post = project(line)
+            except codec.DecodeError:
+                post = None
+
+            # numeric strings ("777") are coerced like the post_store converter does
+            post_id = to_int(post.get("post_id")) if post is not None else NULL_ID
+            if post is None:
+                status = STATUS_DECODE_ERROR
+            elif post_id == NULL_ID:
+                status = STATUS_MISSING_ID  # absent or not convertible to an integer
+            else:
+                status = STATUS_OK
+            cols["status"].append(status)
+
+            post = post or {}
+            cols["post_id"].append(post_id)
+            for field in EDGE_FIELDS:
+                cols[field].append(to_int(post.get(field)))
+
+    return {name: np.asarray(values, dtype=COLUMNS[name]) for name, values in cols.items()}
+
+
+def concat_columns(old, new):
+    return {name: np.concatenate([old[name], new[name]]) for name in COLUMNS}
+
+
+def load_columns(cache_file):
+    with np.load(cache_file) as data:
+        return {name: data[name] for name in COLUMNS}
+
+
+def save_columns(cache_file, cols):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = cache_file + ".tmp.npz"
+    np.savez(tmp_file, **cols)
+    os.replace(tmp_file, cache_file)
+
+
+def file_columns(filepath, entry, cache_dir):
+    """
+    Columns for one user file, reusing the cache where possible.
+    Returns (columns, new manifest entry, status) where status is
+    "unchanged", "appended", "changed" or "new".
+    """
+    st = os.stat(filepath)
+    cache_file = cache_path(cache_dir, filepath)
+    cached = entry is not None and entry.get("parser") == PARSER_VERSION and os.path.exists(cache_file)
+
+    if cached and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        return load_columns(cache_file), entry, "unchanged"
+
+    prefix = None
+    if cached and (entry["size"] == st.st_size or (entry["size"] < st.st_size and entry["newline"])):
+        prefix = hash_file(filepath, limit=entry["size"])
+
+    if prefix is not None and prefix.hexdigest() == entry["hash"] and entry["size"] == st.st_size:
+        # touched but not modified
+        return load_columns(cache_file), dict(entry, mtime_ns=st.st_mtime_ns), "unchanged"
+
+    if prefix is not None and prefix.hexdigest() == entry["hash"]:
+        old = load_columns(cache_file)
+        first_line = int(old["line_num"][-1]) + 1 if len(old["line_num"]) else 1
+        cols = concat_columns(old, parse_file(filepath, entry["size"], first_line))
+        digest = hash_file(filepath, start=entry["size"], limit=st.st_size - entry["size"], h=prefix).hexdigest()
+        status = "appended"
+    else:
+        cols = parse_file(filepath)
+        digest = hash_file(filepath, limit=st.st_size).hexdigest()
+        status = "changed" if entry is not None else "new"
+
+    with open(filepath, "rb") as f:
+        if st.st_size:
+            f.seek(st.st_size - 1)
+        ends_with_newline = st.st_size == 0 or f.read(1) == b"\n"
+    if is_compressed(filepath):
+        ends_with_newline = False  # disables the append path for this file
+
+    new_entry = {
+        "path": filepath,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "hash": digest,
+        "newline": ends_with_newline,
+        "parser": PARSER_VERSION,
+    }
+    save_columns(cache_file, cols)
+    return cols, new_entry, status
+
+
+# =====================================================
+# PER-WORKER MANIFEST PIECES
+# =====================================================
+# Workers write the entries of the files they saw; the parent rebuilds the
+# manifest from these pieces, so files deleted from ./posts drop out of it.
+def save_manifest_piece(cache_dir, worker_id, entries):
+    with open(os.path.join(cache_dir, f"manifest-w{worker_id:06d}.jsonl"), "wb") as f:
+        for entry in entries:
+            f.write(codec.dumpline(entry))
+
+
+def merge_manifest_pieces(cache_dir):
+    manifest = {}
+    for name in sorted(os.listdir(cache_dir)):
+        if name.startswith("manifest-w") and name.endswith(".jsonl"):
+            piece = os.path.join(cache_dir, name)
+            with open(piece, "rb") as f:
+                for line in f:
+                    entry = codec.loads(line)
+                    manifest[entry["path"]] = entry
+            os.remove(piece)
+    save_manifest(cache_dir, manifest)
+    return manifest
+
+
+def attach_entries(batch, manifest):
+    """Pair each file of a batch with its previous manifest entry (or None)."""
+    return [(filepath, manifest.get(filepath)) for filepath in batch]
+
+
+def prune_cache(cache_dir, old_manifest, new_manifest):
+    """Drop cached columns of files that disappeared from the corpus."""
+    removed = 0
+    for filepath in old_manifest.keys() - new_manifest.keys():
+        cache_file = cache_path(cache_dir, filepath)
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+            removed += 1
+    return removed
@@ -0,0 +1,160 @@
+import os
+import json
+import numpy as np
+
+# =====================================================
+# PACKED PER-USER POST STORE
+# =====================================================
+# Instead of one <user_id>.jsonl per user, posts live in a few large shards:
+#
+#   <store>/shard-NNNNN.jsonl   every user's lines stored contiguously
+#   <store>/index.npy           user_id -> (shard, offset, length, lines), sorted by user_id
+#   <store>/meta.json           {"shards", "users", "lines"}
+#
+# A user's posts are one pread away (searchsorted on the mmapped index), and
+# scans read each shard front to back in large blocks.
+
+INDEX_DTYPE = np.dtype([
+    ("user_id", "<i8"), ("shard", "<i4"), ("offset", "<i8"), ("length", "<i8"), ("lines", "<i8"),
+])
+SCAN_BLOCK = 64 * 1024 * 1024
+
+
+def shard_path(store_dir, shard):
+    return os.path.join(store_dir, f"shard-{shard:05d}.jsonl")
+
+
+def index_path(store_dir):
+    return os.path.join(store_dir, "index.npy")
+
+
+def is_packed(path):
+    return os.path.isfile(index_path(path))
+
+
+# =====================================================
+# WRITER
+# =====================================================
+class ShardWriter:
+    """Appends whole users to one shard and records their index rows."""
+
+    def __init__(self, store_dir, shard):
+        self.shard = shard
+        self.out = open(shard_path(store_dir, shard), "wb")
+        self.offset = 0
+        self.rows = []
+
+    def write_user(self, user_id, lines):
+        data = b"".join(lines)
+        self.out.write(data)
+        self.rows.append((int(user_id), self.shard, self.offset, len(data), len(lines)))
+        self.offset += len(data)
+
+    def close(self):
+        self.out.close()
+        return np.array(self.rows, dtype=INDEX_DTYPE)
+
+
+def write_index(store_dir, row_arrays):
+    """Merge the shard writers' rows into index.npy + meta.json."""
+    rows = [r for r in row_arrays if len(r)]
+    index = np.concatenate(rows) if rows else np.empty(0, dtype=INDEX_DTYPE)
+    index = index[np.argsort(index["user_id"], kind="stable")]
+    if len(index) > 1 and np.any(index["user_id"][1:] == index["user_id"][:-1]):
+        raise ValueError("a user_id appears in more than one shard")
+    np.save(index_path(store_dir), index)
+
+    meta = {
+        "shards": int(index["shard"].max()) + 1 if len(index) else 0,
+        "users": len(index),
+        "lines": int(index["lines"].sum()),
+    }
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# =====================================================
+# READER
+# =====================================================
+class PackedStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.index = np.load(index_path(store_dir), mmap_mode="r")
+        self.fds = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds.clear()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, user_id):
+        return self._row(user_id) is not None
+
+    def users(self):
+        return np.asarray(self.index["user_id"])
+
+    def _row(self, user_id):
+        ids = self.index["user_id"]
+        i = np.searchsorted(ids, user_id)
+        if i < len(ids) and ids[i] == user_id:
+            return self.index[i]
+        return None
+
+    def _read(self, row):
+        shard = int(row["shard"])
+        if shard not in self.fds:
+            self.fds[shard] = os.open(shard_path(self.store_dir, shard), os.O_RDONLY)
+        return os.pread(self.fds[shard], int(row["length"]), int(row["offset"]))
+
+    # --- random access ---
+    def read_user(self, user_id):
+        """All of a user's lines as one bytes blob (None for unknown users)."""
+        row = self._row(user_id)
+        return None if row is None else self._read(row)
+
+    def iter_user(self, user_id):
+        data = self.read_user(user_id)
+        if data:
+            yield from data.splitlines(keepends=True)
+
+    def read_many(self, user_ids):
+        """Yield (user_id, blob) for the known users, in on-disk order to keep reads sequential."""
+        ids = np.asarray(list(user_ids), dtype=np.int64)
+        pos = np.searchsorted(self.index["user_id"], ids)
+        pos = pos[pos < len(self.index)]
+        rows = self.index[pos]
+        rows = rows[np.isin(rows["user_id"], ids)]
+        rows = rows[np.lexsort((rows["offset"], rows["shard"]))]
+        for row in rows:
+            yield int(row["user_id"]), self._read(row)
+
+    # --- sequential scans ---
+    def scan(self):
+        """Yield (user_id, blob) for every user, shard by shard, in large reads."""
+        rows = self.index[np.lexsort((self.index["offset"], self.index["shard"]))]
+        bounds = np.flatnonzero(np.diff(rows["shard"])) + 1
+        for shard_rows in np.split(rows, bounds):
+            if not len(shard_rows):
+                continue
+            with open(shard_path(self.store_dir, int(shard_rows["shard"][0])), "rb") as f:
+                buf, buf_start = b"", 0
+                for row in shard_rows:
+                    start, length = int(row["offset"]), int(row["length"])
+                    if start + length > buf_start + len(buf):
+                        f.seek(start)
+                        buf, buf_start = f.read(max(length, SCAN_BLOCK)), start
+                    yield int(row["user_id"]), buf[start - buf_start:start - buf_start + length]
+
+    def iter_lines(self):
+        for _, data in self.scan():
+            yield from data.splitlines(keepends=True)
@@ -3,11 +3,15 @@ import numpy as np
 import json
 from pathlib import Path
 import argparse
+from packed_store import PackedStore
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--claimsum", required=True, type=Path, help="Summarised_claims.csv file path")
-parser.add_argument("--userposts", required=True, type=Path, help="Directory to posts split by user ID")
+parser.add_argument("--userposts", type=Path, help="Directory to posts split by user ID")
+parser.add_argument("--packed", type=Path, help="Packed per-user store (ID_seperator4 --packed) instead of --userposts")
 args = parser.parse_args()
+if not (args.userposts or args.packed):
+    parser.error("one of --userposts or --packed is required")
 
 # ----------------------
 # LABELING
@@ -33,29 +37,44 @@ df = df[["user_ID", "label"]]
 user_label_map = dict(zip(df["user_ID"], df["label"]))
 
 
-posts_dir = Path(args.userposts)
+def collect_post_ids(lines, source):
+    post_ids = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+            post_ids.append(record["post_id"])
+        except json.JSONDecodeError as e:
+            print(f"Skipping malformed JSON in {source}: {e}")
+            continue
+    return post_ids
+
+
 user_data = {}
 
-for user_id, label in user_label_map.items():
-    file_path = posts_dir / f"{user_id}.jsonl"
+if args.packed:
+    # one index lookup per user; reads are issued in on-disk order
+    with PackedStore(args.packed) as store:
+        for user_id, blob in store.read_many(user_label_map.keys()):
+            user_data[user_id] = {
+                "label": user_label_map[user_id],
+                "post_ids": collect_post_ids(blob.splitlines(), f"user {user_id}")
+            }
+else:
+    posts_dir = Path(args.userposts)
 
-    if not file_path.exists():
-        continue
+    for user_id, label in user_label_map.items():
+        file_path = posts_dir / f"{user_id}.jsonl"
 
-    post_ids = []
-    with file_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                record = json.loads(line)
-                post_ids.append(record["post_id"])
-            except json.JSONDecodeError as e:
-                print(f"Skipping malformed JSON in {file_path}: {e}")
-                continue
-
-    user_data[user_id] = {
-        "label": label,
-        "post_ids": post_ids
-    }
+        if not file_path.exists():
+            continue
+
+        with file_path.open("r", encoding="utf-8") as f:
+            post_ids = collect_post_ids(f, file_path)
+
+        user_data[user_id] = {
+            "label": label,
+            "post_ids": post_ids
+        }
 
 with open("user_data.json", "w", encoding="utf-8") as f:
     json.dump(user_data, f)
\ No newline at end of file
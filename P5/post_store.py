@@ -0,0 +1,289 @@
+import json
+import os
+import time
+import argparse
+from datetime import datetime
+from itertools import islice
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import numpy as np
+from compressed_io import is_jsonl, open_input
+
+# =====================================================
+# COLUMN LAYOUT
+# =====================================================
+# One-time converter from the per-user ./posts corpus into a columnar store.
+# Layout on disk:
+#   <store>/meta.json                 schema + list of parts
+#   <store>/part-00001/<column>.bin   raw little-endian column, np.memmap-able
+#   <store>/part-00001/part.json      row count, source files, dictionaries
+#   <store>/part-00001/text.bin       utf-8 text blob, sliced by text_offsets.bin
+#
+# Missing integers are stored as NULL_ID. Dictionary columns store int32 codes
+# into the part's own vocabulary (-1 for missing).
+
+NULL_ID = np.iinfo(np.int64).min
+
+INT_COLUMNS = [
+    "post_id", "user_id",
+    "like_count", "reply_count", "repost_count",
+    "reply_to", "replied_author", "thread_root", "thread_root_author",
+    "repost_from", "reposted_author", "quotes", "quoted_author",
+]
+DICT_COLUMNS = ["instance", "langs", "labels", "sent_label"]
+FLOAT_COLUMNS = ["sent_score"]
+
+COLUMN_DTYPES = {name: "<i8" for name in INT_COLUMNS}
+COLUMN_DTYPES.update({name: "<i4" for name in DICT_COLUMNS})
+COLUMN_DTYPES.update({name: "<f4" for name in FLOAT_COLUMNS})
+COLUMN_DTYPES["date"] = "<i8"
+COLUMN_DTYPES["file_idx"] = "<i4"
+COLUMN_DTYPES["line_num"] = "<i4"
+COLUMN_DTYPES["text_offsets"] = "<i8"
+
+# --- helper: iterate over files ---
+def iter_files(directory):
+    for entry in os.scandir(directory):
+        if entry.is_file() and is_jsonl(entry.name):
+            yield entry.path
+
+# --- helper: chunking generator ---
+def chunker(iterable, chunksize):
+    filenames = iter(iterable)
+    while True:
+        batch = list(islice(filenames, chunksize))
+        if not batch:
+            break
+        yield batch
+
+
+def to_int(value):
+    if value is None or value == "":
+        return NULL_ID
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NULL_ID
+
+
+def to_epoch(value):
+    """Dates arrive either as epoch numbers or ISO-8601 strings."""
+    if value is None or value == "":
+        return NULL_ID
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return NULL_ID
+
+
+def dict_key(value):
+    """Lists (langs, labels) are encoded as one comma-joined dictionary entry."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return ",".join(str(v) for v in value)
+    return str(value)
+
+
+# =====================================================
+# PART WRITER (one per worker batch)
+# =====================================================
+class PartWriter:
+    def __init__(self, part_dir, flush_rows=100_000):
+        self.part_dir = part_dir
+        self.flush_rows = flush_rows
+        os.makedirs(part_dir, exist_ok=True)
+        self.columns = {name: [] for name in COLUMN_DTYPES if name != "text_offsets"}
+        self.handles = {name: open(os.path.join(part_dir, f"{name}.bin"), "wb") for name in COLUMN_DTYPES}
+        self.text_out = open(os.path.join(part_dir, "text.bin"), "wb")
+        self.text_pos = 0
+        self.text_offsets = [0]
+        self.vocabs = {name: {} for name in DICT_COLUMNS}
+        self.files = []
+        self.rows = 0
+
+    def add_file(self, filepath):
+        self.files.append(filepath)
+        return len(self.files) - 1
+
+    def append(self, post, file_idx, line_num):
+        cols = self.columns
+        for name in INT_COLUMNS:
+            cols[name].append(to_int(post.get(name)))
+        for name in DICT_COLUMNS:
+            key = dict_key(post.get(name))
+            if key is None:
+                cols[name].append(-1)
+            else:
+                vocab = self.vocabs[name]
+                cols[name].append(vocab.setdefault(key, len(vocab)))
+        score = post.get("sent_score")
+        cols["sent_score"].append(float(score) if score is not None else np.nan)
+        cols["date"].append(to_epoch(post.get("date")))
+        cols["file_idx"].append(file_idx)
+        cols["line_num"].append(line_num)
+
+        text = (post.get("text") or "").encode("utf-8")
+        self.text_out.write(text)
+        self.text_pos += len(text)
+        self.text_offsets.append(self.text_pos)
+
+        self.rows += 1
+        if len(cols["post_id"]) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        for name, values in self.columns.items():
+            if values:
+                np.asarray(values, dtype=COLUMN_DTYPES[name]).tofile(self.handles[name])
+                values.clear()
+        if self.text_offsets:
+            np.asarray(self.text_offsets, dtype="<i8").tofile(self.handles["text_offsets"])
+            self.text_offsets = []
+
+    def close(self):
+        self.flush()
+        for fh in self.handles.values():
+            fh.close()
+        self.text_out.close()
+        with open(os.path.join(self.part_dir, "part.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "rows": self.rows,
+                "files": self.files,
+                # vocab position == code
+                "vocabs": {name: list(v) for name, v in self.vocabs.items()},
+            }, f)
+
+
+# --- function that converts a batch of files into one part ---
+def convert_batch(batch, part_dir):
+    writer = PartWriter(part_dir)
+    invalid = 0
+    for filepath in batch:
+        file_idx = writer.add_file(filepath)
+        try:
+            with open_input(filepath, "r") as f:
+                for line_num, line in enumerate(f, start=1):
+                    try:
+                        post = json.loads(line)
+                    except json.JSONDecodeError:
+                        invalid += 1
+                        continue
+                    if post.get("post_id") is None:
+                        invalid += 1
+                        continue
+                    writer.append(post, file_idx, line_num)
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+    writer.close()
+    return part_dir, writer.rows, invalid
+
+
+# =====================================================
+# READER API
+# =====================================================
+def list_parts(store_dir):
+    with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return [os.path.join(store_dir, p) for p in meta["parts"]]
+
+
+def part_info(part_dir):
+    with open(os.path.join(part_dir, "part.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def open_part(part_dir, columns):
+    """
+    Memory-map only the requested columns of one part.
+    Returns {column: np.memmap}; nothing else is read from disk.
+    """
+    out = {}
+    for name in columns:
+        path = os.path.join(part_dir, f"{name}.bin")
+        if os.path.getsize(path) == 0:
+            out[name] = np.empty(0, dtype=COLUMN_DTYPES[name])
+        else:
+            out[name] = np.memmap(path, dtype=COLUMN_DTYPES[name], mode="r")
+    return out
+
+
+def iter_parts(store_dir, columns):
+    for part_dir in list_parts(store_dir):
+        yield part_dir, open_part(part_dir, columns)
+
+
+def load_column(store_dir, name):
+    """Concatenate a single column across all parts (materialized in RAM)."""
+    arrays = [cols[name] for _, cols in iter_parts(store_dir, [name])]
+    if not arrays:
+        return np.empty(0, dtype=COLUMN_DTYPES[name])
+    return np.concatenate(arrays)
+
+
+def read_text(part_dir, rows):
+    """Fetch the text of the given row indices from one part."""
+    offsets = open_part(part_dir, ["text_offsets"])["text_offsets"]
+    texts = []
+    with open(os.path.join(part_dir, "text.bin"), "rb") as f:
+        for row in rows:
+            start, end = int(offsets[row]), int(offsets[row + 1])
+            f.seek(start)
+            texts.append(f.read(end - start).decode("utf-8"))
+    return texts
+
+
+def decode_dict(part_dir, name, codes):
+    vocab = part_info(part_dir)["vocabs"][name]
+    return [vocab[c] if c >= 0 else None for c in codes]
+
+
+# =====================================================
+# MAIN LOGIC
+# =====================================================
+def main(args):
+    st = time.time()
+    os.makedirs(args.output, exist_ok=True)
+
+    parts = []
+    total_rows = 0
+    total_invalid = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = []
+        part_id = 1
+        for batch in chunker(iter_files(args.inputpath), args.batchsize):
+            part_dir = os.path.join(args.output, f"part-{part_id:05d}")
+            futures.append(executor.submit(convert_batch, batch, part_dir))
+            part_id += 1
+
+        for fut in as_completed(futures):
+            part_dir, rows, invalid = fut.result()
+            parts.append(os.path.basename(part_dir))
+            total_rows += rows
+            total_invalid += invalid
+            if len(parts) % 10 == 0:
+                print(f"[PROGRESS] {len(parts):,}/{len(futures):,} parts written...")
+
+    with open(os.path.join(args.output, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "parts": sorted(parts),
+            "rows": total_rows,
+            "dtypes": COLUMN_DTYPES,
+            "null_id": int(NULL_ID),
+        }, f, indent=2)
+
+    print(f"[INFO] Wrote {total_rows:,} posts into {len(parts):,} parts at {args.output}")
+    print(f"[INFO] Skipped {total_invalid:,} invalid or malformed lines")
+    print(f"[INFO] Finished in {time.time() - st:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the per-user posts corpus into a columnar store.")
+    parser.add_argument("--inputpath", type=str, required=True, help="Path to input directory")
+    parser.add_argument("--output", type=str, required=True, help="Output store directory")
+    parser.add_argument("--workers", type=int, default=32, help="Number of parallel workers")
+    parser.add_argument("--batchsize", type=int, default=1000, help="Number of files per part")
+    args = parser.parse_args()
+    main(args)
@@ -1,7 +1,14 @@
 import json
 import os
+import argparse
+import numpy as np
+from post_store import iter_parts, NULL_ID
 #import time
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--store", type=str, help="Columnar post store (post_store.py) to read instead of ./posts")
+args = parser.parse_args()
+
 #st = time.time()
 directory = './posts'
 postdict = {}
@@ -15,30 +22,45 @@ keys = ["post_id", "user_id", "instance",
         "quotes", "quoted_author", "labels", 
         "sent_label", "sent_score"]
 
-# Reads all files in the directory
-for user in os.scandir(directory):
-    # If there is no file, skip the entry
-    if not user.is_file():
-        continue
-
-    with open(user, "r") as json_file:
-        # Make list of each post
-        json_list = list(json_file)
-
-        for json_str in json_list:
-            # Make each JSON object a string
-            result = json.loads(json_str)
-
-            # Check if it is a reply to another post
-            if result["reply_to"]:  
-                # Make key in dict of thread roots
-                postdict.setdefault(result["thread_root"], [])
-
-                # Add interaction to root
-                postdict[result["thread_root"]].append(result["post_id"])
-                """print(result["post_id"], "is a reply to", result["reply_to"], "with", result["thread_root"], "as root")"""
-            else:
-                threadlessposts.append(result["post_id"])
+# Only the post_id / reply_to / thread_root columns of the store are read
+def read_store(store_dir):
+    for _, cols in iter_parts(store_dir, ["post_id", "reply_to", "thread_root"]):
+        post_ids = np.asarray(cols["post_id"])
+        reply_to = np.asarray(cols["reply_to"])
+        # same test as `if result["reply_to"]` below
+        is_reply = (reply_to != NULL_ID) & (reply_to != 0)
+        roots = [None if r == NULL_ID else r for r in cols["thread_root"][is_reply].tolist()]
+        for root, post_id in zip(roots, post_ids[is_reply].tolist()):
+            postdict.setdefault(root, []).append(post_id)
+        threadlessposts.extend(post_ids[~is_reply].tolist())
+
+if args.store:
+    read_store(args.store)
+else:
+    # Reads all files in the directory
+    for user in os.scandir(directory):
+        # If there is no file, skip the entry
+        if not user.is_file():
+            continue
+
+        with open(user, "r") as json_file:
+            # Make list of each post
+            json_list = list(json_file)
+
+            for json_str in json_list:
+                # Make each JSON object a string
+                result = json.loads(json_str)
+
+                # Check if it is a reply to another post
+                if result["reply_to"]:  
+                    # Make key in dict of thread roots
+                    postdict.setdefault(result["thread_root"], [])
+
+                    # Add interaction to root
+                    postdict[result["thread_root"]].append(result["post_id"])
+                    """print(result["post_id"], "is a reply to", result["reply_to"], "with", result["thread_root"], "as root")"""
+                else:
+                    threadlessposts.append(result["post_id"])
 
 threadposts = 0
 
@@ -1,10 +1,25 @@
-import json
 import os
 import time
 import argparse
-from collections import defaultdict, deque
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from functools import partial
+from itertools import islice
+import numpy as np
+import jsonl_codec as codec
+from compressed_io import is_jsonl, open_input, open_output, compresses_output
+from id_set import IdSet, IdSetBuilder
+from post_store import NULL_ID, iter_parts
+import manifest
+from csr_graph import CSRGraph, build_csr, build_csr_external, read_edge_arrays, is_csr
+from edge_extractor import EDGE_TYPES, EDGE_TYPE_NAMES, relation_mask
+from adjacency import as_adjacency, SQLiteAdjacency, LRUAdjacency
+from cascade_forest import label_forest, iter_forest_walks
+from batch_bfs import iter_batch_walks
+from walk_sinks import SINK_KINDS, encode_walk, make_sinks
+from checkpoint import Checkpoint
+
+EDGE_FIELDS = ("post_id", "reply_to", "quotes", "repost_from")
 
 # =====================================================
 # EDGE EXTRACTION + ROOT DETECTION
@@ -12,26 +27,27 @@ from threading import Lock
 def extract_edges(posts_path, edges_path, roots_path):
     print(f"[INFO] Extracting edges & roots from {posts_path}")
     count_edges = 0
-    all_sources = set()
-    seen_targets = set()
-    all_posts = set()
+    all_sources = IdSetBuilder()
+    seen_targets = IdSetBuilder()
+    all_posts = IdSetBuilder()
+    project = codec.make_projector(EDGE_FIELDS)
 
-    with open(posts_path, "r", encoding="utf-8") as infile, \
-         open(edges_path, "w", encoding="utf-8") as edge_out:
+    with open_input(posts_path, "rb") as infile, \
+         open_output(edges_path, "wb") as edge_out:
 
         for line in infile:
             try:
-                post = json.loads(line)
+                post = project(line)
                 pid = post.get("post_id")
                 if pid is None:
                     continue
                 all_posts.add(pid)
 
                 has_edge = False
-                for field in ("reply_to", "quotes", "repost_from"):
+                for field, edge_type in EDGE_TYPES.items():
                     dst = post.get(field)
                     if dst:
-                        edge_out.write(json.dumps({"src": pid, "dst": dst}) + "\n")
+                        edge_out.write(codec.dumpline({"src": pid, "dst": dst, "type": EDGE_TYPE_NAMES[edge_type]}))
                         count_edges += 1
                         seen_targets.add(dst)
                         has_edge = True
@@ -42,17 +58,121 @@ def extract_edges(posts_path, edges_path, roots_path):
                 print(f"[WARN] Skipped malformed line: {e}")
                 continue
 
+    all_sources, seen_targets, all_posts = all_sources.build(), seen_targets.build(), all_posts.build()
     roots = seen_targets - all_sources
     isolated = all_posts - seen_targets - all_sources
     roots |= isolated
 
-    with open(roots_path, "w", encoding="utf-8") as f:
-        for r in sorted(roots):
-            f.write(json.dumps(r) + "\n")
+    # IdSet is already sorted
+    with open_output(roots_path, "wb") as f:
+        for r in roots:
+            f.write(codec.dumpline(r))
 
     print(f"[INFO] Wrote {count_edges:,} edges and {len(roots):,} roots to disk")
 
 
+# --- (src, dst, type) from id columns; shared by the cached and the --store variants ---
+def column_edges(pid, edge_cols):
+    """edge_cols: reply_to, quotes, repost_from columns aligned with the post ids `pid`."""
+    # (posts x fields) keeps the per-post reply_to, quotes, repost_from order of extract_edges
+    targets = np.stack([np.asarray(col) for col in edge_cols], axis=1)
+    present = (targets != NULL_ID) & (targets != 0)
+    field_types = np.array([EDGE_TYPES[f] for f in manifest.EDGE_FIELDS], dtype=np.int8)
+    return np.repeat(pid, present.sum(axis=1)), targets[present], np.broadcast_to(field_types, targets.shape)[present]
+
+
+# --- incremental variant: per-user directory + manifest cache (manifest.py) ---
+def cached_edges_batch(batch_entries, worker_id, cache_dir):
+    srcs, dsts, types, pids = [], [], [], []
+    entries = []
+    for filepath, entry in batch_entries:
+        try:
+            cols, new_entry, _ = manifest.file_columns(filepath, entry, cache_dir)
+        except Exception as e:
+            print(f"[WARN] Skipped {filepath}: {e}")
+            continue
+        entries.append(new_entry)
+        ok = cols["status"] == manifest.STATUS_OK
+        pid = cols["post_id"][ok]
+        src, dst, kind = column_edges(pid, [cols[f][ok] for f in manifest.EDGE_FIELDS])
+        srcs.append(src)
+        dsts.append(dst)
+        types.append(kind)
+        pids.append(pid)
+    manifest.save_manifest_piece(cache_dir, worker_id, entries)
+
+    def cat(arrays, dtype=np.int64):
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+    return cat(srcs), cat(dsts), cat(types, np.int8), IdSet(cat(pids))
+
+
+def extract_edges_cached(posts_dir, edges_path, roots_path, cache_dir, workers, batchsize=1000):
+    """
+    Same outputs as extract_edges, read straight from the per-user directory.
+    Only new or changed files are parsed; everything else comes from the cache.
+    Isolated posts are left out of the roots, as if the input had gone through data_minimizer3.
+    """
+    print(f"[INFO] Extracting edges & roots from {posts_dir} (cache: {cache_dir})")
+    os.makedirs(cache_dir, exist_ok=True)
+    old_manifest = manifest.load_manifest(cache_dir)
+    process = partial(cached_edges_batch, cache_dir=cache_dir)
+
+    files = (e.path for e in os.scandir(posts_dir) if e.is_file() and is_jsonl(e.name))
+    count_edges = 0
+    sources, targets = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor, open_output(edges_path, "wb") as edge_out:
+        futures = []
+        worker_id = 1
+        while True:
+            batch = list(islice(files, batchsize))
+            if not batch:
+                break
+            futures.append(executor.submit(process, manifest.attach_entries(batch, old_manifest), worker_id))
+            worker_id += 1
+
+        for fut in as_completed(futures):
+            src, dst, types, _ = fut.result()
+            for s, d, t in zip(src.tolist(), dst.tolist(), types.tolist()):
+                edge_out.write(codec.dumpline({"src": s, "dst": d, "type": EDGE_TYPE_NAMES[t]}))
+            count_edges += len(src)
+            sources.append(IdSet(src))
+            targets.append(IdSet(dst))
+
+    manifest.prune_cache(cache_dir, old_manifest, manifest.merge_manifest_pieces(cache_dir))
+
+    roots = IdSet.union_all(targets) - IdSet.union_all(sources)
+    with open_output(roots_path, "wb") as f:
+        for r in roots:
+            f.write(codec.dumpline(r))
+
+    print(f"[INFO] Wrote {count_edges:,} edges and {len(roots):,} roots to disk")
+
+
+# --- columnar variant: only the four id columns of a post store (post_store.py) are read ---
+def extract_edges_store(store_dir, edges_path, roots_path):
+    """
+    Same outputs as extract_edges_cached, read from a columnar post store;
+    isolated posts are left out of the roots here as well.
+    """
+    print(f"[INFO] Extracting edges & roots from post store {store_dir}")
+    count_edges = 0
+    sources, targets = [], []
+    with open_output(edges_path, "wb") as edge_out:
+        for _, cols in iter_parts(store_dir, EDGE_FIELDS):
+            ok = np.asarray(cols["post_id"]) != NULL_ID  # the converter keeps non-integer post_ids as NULL_ID
+            src, dst, types = column_edges(cols["post_id"][ok], [cols[f][ok] for f in manifest.EDGE_FIELDS])
+            for s, d, t in zip(src.tolist(), dst.tolist(), types.tolist()):
+                edge_out.write(codec.dumpline({"src": s, "dst": d, "type": EDGE_TYPE_NAMES[t]}))
+            count_edges += len(src)
+            sources.append(IdSet(src))
+            targets.append(IdSet(dst))
+
+    roots = IdSet.union_all(targets) - IdSet.union_all(sources)
+    with open_output(roots_path, "wb") as f:
+        for r in roots:
+            f.write(codec.dumpline(r))
+
+    print(f"[INFO] Wrote {count_edges:,} edges and {len(roots):,} roots to disk")
 
 
 # =====================================================
@@ -62,19 +182,20 @@ def build_reverse_index(edges_path, reverse_edges_path):
     print(f"[INFO] Building reverse index from {edges_path}")
     reverse_index = defaultdict(list)
 
-    with open(edges_path, "r", encoding="utf-8") as f:
-        for line in f:
-            edge = json.loads(line)
-            src, dst = edge["src"], edge["dst"]
-            reverse_index[dst].append(src)
+    # JSONL edges or a binary edge_extractor directory
+    src, dst, _ = read_edge_arrays(edges_path)
+    for s, d in zip(src.tolist(), dst.tolist()):
+        reverse_index[d].append(s)
 
     print(f"[INFO] Reverse index built with {len(reverse_index):,} target nodes")
 
     # --- Save immediately for fault tolerance ---
-    tmp_path = reverse_edges_path + ".tmp"
-    with open(tmp_path, "w", encoding="utf-8") as outfile:
+    # keep the extension so a .gz/.zst path is compressed the same way
+    head, name = os.path.split(reverse_edges_path)
+    tmp_path = os.path.join(head, f".tmp-{name}")
+    with open_output(tmp_path, "wb") as outfile:
         for target, sources in reverse_index.items():
-            outfile.write(json.dumps({"target": target, "sources": sources}) + "\n")
+            outfile.write(codec.dumpline({"target": target, "sources": sources}))
 
     os.replace(tmp_path, reverse_edges_path)
     print(f"[INFO] Saved reverse edges to {reverse_edges_path}")
@@ -82,11 +203,23 @@ def build_reverse_index(edges_path, reverse_edges_path):
     return reverse_index
 
 
+def build_csr_index(edges_path, csr_dir, memory_mb=None):
+    if memory_mb:
+        # external sort: sorted runs + k-way merge, never holds the edge list in RAM
+        print(f"[INFO] Building CSR index from {edges_path} out of core ({memory_mb:g} MB budget)")
+        n_nodes, n_edges = build_csr_external(edges_path, csr_dir, int(memory_mb * 1024 * 1024))
+    else:
+        print(f"[INFO] Building CSR index from {edges_path}")
+        src, dst, types = read_edge_arrays(edges_path)
+        n_nodes, n_edges = build_csr(src, dst, csr_dir, types)
+    print(f"[INFO] Saved CSR index ({n_nodes:,} nodes, {n_edges:,} edges) to {csr_dir}")
+
+
 def load_reverse_index(reverse_edges_path):
     reverse_index = defaultdict(list)
-    with open(reverse_edges_path, "r", encoding="utf-8") as infile:
+    with open_input(reverse_edges_path, "rb") as infile:
         for line in infile:
-            record = json.loads(line)
+            record = codec.loads(line)
             reverse_index[record["target"]] = record["sources"]
     print(f"[INFO] Loaded reverse index ({len(reverse_index):,} targets)")
     return reverse_index
@@ -95,43 +228,218 @@ def load_reverse_index(reverse_edges_path):
 # =====================================================
 # REVERSE HYBRID TRAVERSAL (BFS by layer)
 # =====================================================
-def reverse_hybrid_traversal(root_id, reverse_index, max_depth=None):
-    visited = set([root_id])
-    walk_path = defaultdict(list)
-    queue = deque([(root_id, 0)])
-    max_found_depth = 0
-
-    while queue:
-        node_id, depth = queue.popleft()
-        walk_path[depth].append(node_id)
-        max_found_depth = max(max_found_depth, depth)
-
+def reverse_hybrid_traversal(root_id, reverse_index, max_depth=None, relations=None):
+    # relation mask (edge_extractor.relation_mask): only follow those edge types
+    if relations is not None:
+        reverse_index = reverse_index.restrict(relations)
+    adjacency = as_adjacency(reverse_index)
+
+    # layer by layer: one neighbors_many round-trip per BFS layer, same visit order as a FIFO queue
+    visited = {root_id}
+    walk_path = {}
+    frontier = [root_id]
+    depth = 0
+    while frontier:
+        walk_path[depth] = frontier
         if max_depth is not None and depth >= max_depth:
-            continue
-
-        for nbr in reverse_index.get(node_id, []):
-            if nbr not in visited:
-                visited.add(nbr)
-                queue.append((nbr, depth + 1))
+            break
+        next_layer = []
+        for nbrs in adjacency.neighbors_many(frontier):
+            for nbr in nbrs:
+                if nbr not in visited:
+                    visited.add(nbr)
+                    next_layer.append(nbr)
+        frontier = next_layer
+        depth += 1
 
     return {
         "start_node": root_id,
         "walk_length": len(visited),
-        "walk_depth": max_found_depth,
+        "walk_depth": len(walk_path) - 1,
         "walk_path": {str(k): v for k, v in walk_path.items()},
     }
 
+
 # =====================================================
 # MULTI THREADING WORKER (1 TRAVERSAL)
 # =====================================================
-def process_root(root_id, reverse_index, max_depth, output_dir):
-    result = reverse_hybrid_traversal(root_id, reverse_index, max_depth)
+def process_root(root_id, reverse_index, max_depth, kinds, relations=None):
+    result = reverse_hybrid_traversal(root_id, reverse_index, max_depth, relations)
+    # encoded here, in the worker, once per sink kind (walk_sinks.py)
+    return encode_walk(result, kinds)
+
+
+def traverse_batch(root_ids, reverse_index, max_depth, kinds, relations=None):
+    """(root_id, payloads, error) per root; one failing root does not lose the batch."""
+    results = []
+    for root_id in root_ids:
+        try:
+            results.append((root_id, process_root(root_id, reverse_index, max_depth, kinds, relations), None))
+        except Exception as e:
+            results.append((root_id, None, str(e)))
+    return results
+
+
+def traverse_batch_vectorized(root_ids, graph, max_depth, kinds):
+    """traverse_batch over a CSRGraph, with the whole batch advancing together (batch_bfs.py)."""
+    try:
+        return [(root_ids[k], encode_walk(result, kinds), None)
+                for k, result in iter_batch_walks(graph, root_ids, max_depth)]
+    except Exception as e:
+        return [(root_id, None, str(e)) for root_id in root_ids]
+
+
+# =====================================================
+# STREAMING SCHEDULER (bounded in-flight window)
+# =====================================================
+def chunker(iterable, chunksize):
+    items = iter(iterable)
+    while True:
+        batch = list(islice(items, chunksize))
+        if not batch:
+            break
+        yield batch
+
+
+def index_batches(pairs, chunksize):
+    """(root index, root id) pairs -> (indices, root_ids) batches."""
+    for batch in chunker(pairs, chunksize):
+        indices, root_ids = zip(*batch)
+        yield list(indices), list(root_ids)
+
+
+def stream_tasks(executor, fn, batches, window):
+    """
+    Submit (indices, root_ids) batches lazily, never more than `window` in flight;
+    yields (indices, future) as they finish.
+    """
+    pending = {}
+    for indices, root_ids in batches:
+        pending[executor.submit(fn, root_ids)] = indices
+        if len(pending) >= window:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+    for future in as_completed(list(pending)):
+        yield pending.pop(future), future
+
+
+def run_batches(executor, fn, batches, window, sinks, checkpoint=None):
+    """
+    Hand every finished batch to the sinks' writer threads as one block of records.
+    Written roots are marked in the checkpoint, which is saved after an fsync barrier.
+    """
+    completed = failed = 0
+    for indices, future in stream_tasks(executor, fn, batches, window):
+        records = []
+        for index, (root_id, payloads, error) in zip(indices, future.result()):
+            if error is not None:
+                print(f"[ERROR] Traversal failed for root {root_id}: {error}")
+                failed += 1
+            else:
+                records.append((root_id, payloads))
+                if checkpoint is not None:
+                    checkpoint.mark(index)
+        sinks.write_many(records)
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(sinks.sync())
+        if (completed + len(records)) // 10_000 > completed // 10_000:
+            print(f"[PROGRESS] {completed + len(records):,} traversals completed...")
+        completed += len(records)
+    return completed, failed
 
-    out_path = os.path.join(output_dir, f"{root_id}.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(result, f)
 
-    return result
+# =====================================================
+# MULTI PROCESS WORKERS (shared mmapped CSR, size-aware scheduling)
+# =====================================================
+# --- per-process graph: the CSR arrays are mmapped once, pages shared by every worker ---
+worker_graph = None
+
+def init_traversal_worker(csr_dir, relations):
+    global worker_graph
+    worker_graph = CSRGraph(csr_dir, "reverse", relations=relations)
+
+def process_roots(root_ids, max_depth, kinds, vectorized=False):
+    if vectorized:
+        return traverse_batch_vectorized(root_ids, worker_graph, max_depth, kinds)
+    return traverse_batch(root_ids, worker_graph, max_depth, kinds)
+
+
+def estimate_cascade_sizes(graph, roots):
+    """Cheap size estimate per root: itself + its first two layers, counted as edges (no dedup)."""
+    pos = graph.id_map.encode(roots).astype(np.int64)
+    estimates = np.ones(len(roots), dtype=np.float64)
+    known = np.flatnonzero(pos >= 0)
+    children, owner = graph.expand(pos[known])
+    grandchildren = np.bincount(owner, weights=graph.degree(children), minlength=len(known))
+    estimates[known] += graph.degree(pos[known]) + grandchildren
+    return estimates
+
+
+def plan_chunks(estimates, workers, chunks_per_worker=16, max_roots=1000):
+    """
+    Largest-first chunks (lists of positions) of roughly equal estimated work. A viral
+    root gets a chunk of its own and starts first; the small ones at the end keep idle
+    workers busy.
+    """
+    target = max(estimates.sum() / (workers * chunks_per_worker), 1.0)
+    chunk, work = [], 0.0
+    for i in np.argsort(-estimates, kind="stable").tolist():
+        chunk.append(i)
+        work += estimates[i]
+        if work >= target or len(chunk) >= max_roots:
+            yield chunk
+            chunk, work = [], 0.0
+    if chunk:
+        yield chunk
+
+
+def run_processes(graph, indices, roots, relations, args, sinks, checkpoint=None):
+    estimates = estimate_cascade_sizes(graph, roots)
+    print(f"[INFO] Largest estimated cascade: {int(estimates.max()) if len(roots) else 0:,} nodes")
+
+    # the pool's shared task queue hands the next chunk to whichever worker is idle
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_traversal_worker,
+                             initargs=(args.csr, relations)) as executor:
+        fn = partial(process_roots, max_depth=args.max_depth, kinds=sinks.kinds, vectorized=args.batch_bfs)
+        batches = (([indices[i] for i in chunk], [roots[i] for i in chunk])
+                   for chunk in plan_chunks(estimates, args.workers))
+        return run_batches(executor, fn, batches, args.window, sinks, checkpoint)
+
+
+def run_threads(reverse_index, pairs, relations, args, sinks, checkpoint=None):
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        if args.batch_bfs:
+            fn = partial(traverse_batch_vectorized, graph=reverse_index.restrict(relations),
+                         max_depth=args.max_depth, kinds=sinks.kinds)
+        else:
+            fn = partial(traverse_batch, reverse_index=reverse_index, max_depth=args.max_depth,
+                         kinds=sinks.kinds, relations=relations)
+        return run_batches(executor, fn, index_batches(pairs, args.batch_roots), args.window, sinks, checkpoint)
+
+
+# =====================================================
+# WHOLE-FOREST MODE (one multi-source BFS, cascade_forest.py)
+# =====================================================
+def run_forest(graph, roots, skip, args, sinks, checkpoint=None):
+    print(f"[INFO] Labelling the whole forest from {len(roots):,} roots in one pass...")
+    labels = label_forest(graph, roots, args.max_depth)
+    claimed = int((labels[0] >= 0).sum())
+    print(f"[INFO] {claimed:,}/{len(graph):,} nodes claimed by a cascade")
+
+    completed = 0
+    walks = iter_forest_walks(graph, roots, labels, args.layer_counts, skip)
+    for batch in chunker(walks, args.batch_roots):
+        sinks.write_many([(result["start_node"], encode_walk(result, sinks.kinds)) for _, result in batch])
+        if checkpoint is not None:
+            for k, _ in batch:
+                checkpoint.mark(k)
+            if checkpoint.due():
+                checkpoint.save(sinks.sync())
+        if (completed + len(batch)) // 100_000 > completed // 100_000:
+            print(f"[PROGRESS] {completed + len(batch):,} walks written...")
+        completed += len(batch)
+    return completed
 
 # =====================================================
 # MAIN LOGIC
@@ -140,80 +448,163 @@ def main(args):
     start_time = time.time()
 
     # --- Step 1: Extract edges and roots if not present ---
-    if not (os.path.exists(args.edges) and os.path.exists(args.roots_file)):
-        extract_edges(args.input, args.edges, args.roots_file)
+    refreshed = False
+    if args.posts_dir:
+        # incremental: cheap to refresh on every run, only changed files are parsed
+        extract_edges_cached(args.posts_dir, args.edges, args.roots_file, args.cache_dir, args.workers)
+        refreshed = True
+    elif not (os.path.exists(args.edges) and os.path.exists(args.roots_file)):
+        if args.store:
+            extract_edges_store(args.store, args.edges, args.roots_file)
+        elif args.input:
+            extract_edges(args.input, args.edges, args.roots_file)
+        else:
+            raise SystemExit(f"[ERROR] {args.edges} / {args.roots_file} missing and no --input/--store to extract them from")
     else:
         print(f"[INFO] Using existing edges & roots files.")
 
     # --- Step 2: Build or load reverse index ---
-    if not os.path.exists(args.reverse_edges):
+    relations = relation_mask(args.relations) if args.relations else None
+    if args.csr:
+        # binary index: mmapped, so loading is instant and pages are shared
+        if refreshed or not is_csr(args.csr):
+            build_csr_index(args.edges, args.csr, args.memory_mb)
+        reverse_index = CSRGraph(args.csr, "reverse")
+        print(f"[INFO] Loaded CSR reverse index ({len(reverse_index):,} nodes)")
+        if relations is not None:
+            reverse_index.restrict(relations)  # fails fast on untyped edge files
+            print(f"[INFO] Following only {args.relations} edges")
+    elif args.relations:
+        raise SystemExit("[ERROR] --relations needs the relation-partitioned --csr index")
+    elif args.sqlite:
+        # disk-backed index for graphs that don't fit in memory; hot nodes stay in an LRU cache
+        if refreshed or not os.path.exists(args.sqlite):
+            print(f"[INFO] Building SQLite adjacency from {args.edges}")
+            n_edges = SQLiteAdjacency.build(args.edges, args.sqlite)
+            print(f"[INFO] Saved {n_edges:,} edges to {args.sqlite}")
+        reverse_index = LRUAdjacency(SQLiteAdjacency(args.sqlite), args.cache_entries)
+    elif refreshed or not os.path.exists(args.reverse_edges):
         reverse_index = build_reverse_index(args.edges, args.reverse_edges)
     else:
         reverse_index = load_reverse_index(args.reverse_edges)
 
     # --- Step 3: Prepare outputs ---
-    os.makedirs(args.output, exist_ok=True)
-    if args.walks_file:
-        os.makedirs(os.path.dirname(args.walks_file) or ".", exist_ok=True)
+    # per-root files are opt-in (--archive) and go into tar shards under --output
+    sinks = make_sinks(args.sink, args.walks_file, args.shards,
+                       args.output if args.archive else None, args.archive_members)
 
     # --- Step 4: Load roots (streaming) ---
     def load_roots(path):
-        with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".npy"):  # IdSet from edge_extractor
+            yield from IdSet.load(path, mmap=True)
+            return
+        with open_input(path, "rb") as f:
             for line in f:
-                yield json.loads(line)
+                yield codec.loads(line)
 
     # --- Step 5: Resume safety — skip already processed roots ---
+    # checkpoint: bitmap of finished root indices + durable sink offsets (one small read);
+    # without one (first run, compressed output, --checkpoint_secs 0) the walks are rescanned
+    checkpoint = None
+    if args.checkpoint_secs > 0 and not any(compresses_output(p) for p in sinks.paths):
+        checkpoint = Checkpoint(args.checkpoint or args.walks_file + ".ckpt", args.roots_file,
+                                sinks.paths, args.checkpoint_secs)
     processed_roots = set()
-    if os.path.exists(args.walks_file):
-        with open(args.walks_file, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    record = json.loads(line)
-                    processed_roots.add(record["start_node"])
-                except Exception:
-                    continue
-        print(f"[INFO] Found {len(processed_roots):,} already processed roots — will skip them.")
-
-    # --- Step 6: Traverse all roots (parallel)---
-    total_roots = 0
-    completed = 0
-    write_lock = Lock()
-
-    roots = [r for r in load_roots(args.roots_file) if r not in processed_roots]
-    total_roots = len(roots)
-    print(f"[INFO] Beginning traversal of {total_roots:,} roots using {args.workers} threads...")
-
-    with ThreadPoolExecutor(max_workers=args.workers) as executor, \
-        open(args.walks_file, "a", encoding="utf-8") as walks_out:
-        futures = {executor.submit(process_root, root_id, reverse_index, args.max_depth, args.output): root_id for root_id in roots}
-        
-        for future in as_completed(futures):
-            root_id = futures[future]
-            try:
-                result = future.result()
-                with write_lock:
-                    walks_out.write(json.dumps(result) + "\n")
-                completed += 1
-
-                if completed % 500 == 0:
-                    print(f"[PROGRESS] {completed:,}/{total_roots:,} traversals completed...")
-
-            except Exception as e:
-                print(f"[ERROR] Traversal failed for root {root_id}: {e}")
+    if checkpoint is not None and checkpoint.load():
+        checkpoint.restore_files()
+        print(f"[INFO] Checkpoint: {checkpoint.done_count:,} roots already processed — will skip them.")
+    else:
+        processed_roots = sinks.done_roots()
+        if processed_roots:
+            print(f"[INFO] Found {len(processed_roots):,} already processed roots — will skip them.")
+
+    def is_done(index, root_id):
+        if checkpoint is not None and checkpoint.is_done(index):
+            return True
+        if root_id in processed_roots:
+            if checkpoint is not None:
+                checkpoint.mark(index)  # carried over into the first checkpoint
+            return True
+        return False
+
+    if args.forest:
+        # every root is labelled (so shared nodes are claimed consistently), only new ones are written
+        graph = reverse_index.restrict(relations)
+        roots = list(load_roots(args.roots_file))
+        skip = {k for k, root_id in enumerate(roots) if is_done(k, root_id)}
+        with sinks:
+            completed = run_forest(graph, roots, skip, args, sinks, checkpoint)
+            if checkpoint is not None:
+                checkpoint.save(sinks.sync())
+        print(f"[INFO] Finished {completed:,} forest walks in {time.time() - start_time:.2f}s")
+        return
+
+    # --- Step 6: Traverse all roots (parallel) ---
+    # roots are read lazily and submitted in batches, at most --window batches in flight;
+    # every output file is owned by a writer thread that writes finished batches in large blocks
+    args.window = args.window or 4 * args.workers
+    # roots keep their index in the roots file, which is what the checkpoint bitmap records
+    pairs = ((i, r) for i, r in enumerate(load_roots(args.roots_file)) if not is_done(i, r))
+
+    with sinks:
+        if args.processes:
+            pairs = list(pairs)  # largest-first scheduling needs every root's size estimate
+            indices, roots = [i for i, _ in pairs], [r for _, r in pairs]
+            print(f"[INFO] Beginning traversal of {len(roots):,} roots using {args.workers} processes...")
+            completed, failed = run_processes(reverse_index.restrict(relations), indices, roots, relations, args, sinks, checkpoint)
+        else:
+            print(f"[INFO] Beginning traversal using {args.workers} threads ({args.batch_roots} roots per task)...")
+            completed, failed = run_threads(reverse_index, pairs, relations, args, sinks, checkpoint)
+        if checkpoint is not None:
+            checkpoint.save(sinks.sync())
 
     duration = time.time() - start_time
-    print(f"[INFO] Finished {completed:,}/{total_roots:,} traversals in {duration:.2f}s")
+    print(f"[INFO] Finished {completed:,} traversals ({failed:,} failed) in {duration:.2f}s")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Two-pass reverse hybrid traversal for Bluesky posts.")
-    parser.add_argument("--input", type=str, required=True, help="Input JSONL file with posts")
-    parser.add_argument("--edges", type=str, default="edges.jsonl", help="Temporary edge list output file")
+    parser.add_argument("--input", type=str, help="Input JSONL file with posts")
+    parser.add_argument("--posts_dir", type=str, help="Per-user posts directory, read incrementally instead of --input")
+    parser.add_argument("--store", type=str, help="Columnar post store (post_store.py) to extract edges from instead of --input")
+    parser.add_argument("--cache_dir", type=str, default="ingest_cache", help="Manifest + per-file cache used with --posts_dir")
+    parser.add_argument("--edges", type=str, default="edges.jsonl", help="Temporary edge list output file (or an edge_extractor.py directory)")
     parser.add_argument("--reverse_edges", type=str, default="reverse_edges.jsonl", help="Temporary edge list output file")
-    parser.add_argument("--roots_file", type=str, default="roots.jsonl", help="File to store automatically detected roots")
-    parser.add_argument("--walks_file", type=str, default="walks.jsonl", help="Aggregated JSONL file for all traversals")
-    parser.add_argument("--output", type=str, default="reverse_walks", help="Output directory for traversal results")
+    parser.add_argument("--csr", type=str, default=None, help="Directory of a binary CSR index (csr_graph.py) used instead of --reverse_edges")
+    parser.add_argument("--sqlite", type=str, default=None, help="SQLite adjacency file used instead of --reverse_edges (disk-backed)")
+    parser.add_argument("--cache_entries", type=int, default=1_000_000, help="LRU cache size (nodes) in front of --sqlite")
+    parser.add_argument("--memory_mb", type=float, default=None, help="Build the --csr index out of core within this memory budget (MB)")
+    parser.add_argument("--relations", type=str, default=None, help="Comma-separated edge types to follow (reply,quote,repost); needs --csr")
+    parser.add_argument("--roots_file", type=str, default="roots.jsonl", help="File to store automatically detected roots (or roots.npy from edge_extractor.py)")
+    parser.add_argument("--walks_file", type=str, default="walks.jsonl", help="Aggregated output for all traversals (see --sink)")
+    parser.add_argument("--sink", choices=SINK_KINDS, default="jsonl", help="Walks JSONL, metrics-only JSONL (layer sizes) or packed binary walks")
+    parser.add_argument("--shards", type=int, default=1, help="Spread jsonl/metrics output over N files by root id")
+    parser.add_argument("--archive", action="store_true", help="Also keep per-root <root_id>.json files, batched into tar shards in --output")
+    parser.add_argument("--archive_members", type=int, default=100_000, help="Per-root files per tar shard")
+    parser.add_argument("--output", type=str, default="reverse_walks", help="Output directory for the --archive tar shards")
+    parser.add_argument("--checkpoint", type=str, default=None, help="Checkpoint file (default: <walks_file>.ckpt)")
+    parser.add_argument("--checkpoint_secs", type=float, default=30, help="Seconds between checkpoints; 0 disables them (plain, uncompressed outputs only)")
     parser.add_argument("--max-depth", type=int, default=None, help="Optional traversal depth limit")
-    parser.add_argument("--workers", type=int, default=4, help="Number of threads for parallel traversal")
+    parser.add_argument("--workers", type=int, default=4, help="Number of threads (or processes) for parallel traversal")
+    parser.add_argument("--batch_roots", type=int, default=256, help="Roots per traversal task (threads); use thousands with --batch_bfs")
+    parser.add_argument("--window", type=int, default=None, help="Max traversal tasks in flight (default: 4 x workers)")
+    parser.add_argument("--processes", action="store_true", help="Traverse in worker processes sharing the mmapped --csr index, largest cascades first")
+    parser.add_argument("--forest", action="store_true", help="Label all cascades in one multi-source BFS over --csr instead of one BFS per root")
+    parser.add_argument("--batch_bfs", action="store_true", help="Advance each task's roots together with vectorised BFS over --csr (same walks as per-root BFS)")
+    parser.add_argument("--layer_counts", action="store_true", help="With --forest, write layer sizes instead of walk_path")
     args = parser.parse_args()
+    if args.forest and not args.csr:
+        parser.error("--forest needs the --csr index")
+    if args.processes and not args.csr:
+        parser.error("--processes needs the --csr index")
+    if args.processes and args.forest:
+        parser.error("--processes and --forest are separate traversal modes")
+    if args.batch_bfs and (args.forest or not args.csr):
+        parser.error("--batch_bfs needs the --csr index and is not used with --forest")
+    if args.sink == "binary" and (args.shards > 1 or args.layer_counts):
+        parser.error("--sink binary writes one file of full walks (no --shards / --layer_counts)")
+    if args.layer_counts and not args.forest:
+        parser.error("--layer_counts needs --forest")
+    if not (args.input or args.posts_dir or args.store or os.path.exists(args.edges)):
+        parser.error("one of --input, --posts_dir or --store is required (unless --edges already exists)")
     main(args)
@@ -22,7 +22,7 @@ for f in files:
         "--input", str(f),
         "--output", str(metrics_out),
         "--workers", "8",
-        "--chunk_size", "10000"
+        "--chunk_mb", "64"
     ], check=True)
 
     subprocess.run([
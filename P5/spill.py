@@ -0,0 +1,68 @@
+import os
+import glob
+import numpy as np
+
+# =====================================================
+# HASH-PARTITIONED SPILL FILES
+# =====================================================
+# Workers split their arrays by hash(key) % n and write one .npy per
+# (prefix, partition, worker). A second phase then loads a single partition at
+# a time, so every reduction over a key is bounded by one partition's size and
+# partitions can be reduced in parallel.
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def partition_of(keys, n, salt=0):
+    """Partition index in [0, n) for every int64 key (splitmix-style mixing)."""
+    offset = np.uint64((salt * int(GOLDEN)) & 0xFFFFFFFFFFFFFFFF)
+    h = np.asarray(keys, dtype=np.int64).view(np.uint64) + offset
+    h = h * GOLDEN
+    h ^= h >> np.uint64(29)
+    return (h % np.uint64(n)).astype(np.int64)
+
+
+def partition_path(spill_dir, prefix, k, worker_id):
+    return os.path.join(spill_dir, f"{prefix}-p{k:04d}-w{worker_id:06d}.npy")
+
+
+def spill_partitioned(arr, spill_dir, prefix, worker_id, n, key=None, salt=0):
+    """
+    Write `arr` split into n hash partitions (by arr[key] for structured arrays).
+    Returns the number of bytes written.
+    """
+    arr = np.asarray(arr)
+    if not len(arr):
+        return 0
+    parts = partition_of(arr[key] if key else arr, n, salt)
+    order = np.argsort(parts, kind="stable")
+    arr, parts = arr[order], parts[order]
+    bounds = np.searchsorted(parts, np.arange(n + 1))
+
+    written = 0
+    for k in range(n):
+        lo, hi = bounds[k], bounds[k + 1]
+        if hi > lo:
+            np.save(partition_path(spill_dir, prefix, k, worker_id), arr[lo:hi])
+            written += arr[lo:hi].nbytes
+    return written
+
+
+def partition_files(spill_dir, prefix, k):
+    return sorted(glob.glob(os.path.join(spill_dir, f"{prefix}-p{k:04d}-w*.npy")))
+
+
+def partition_bytes(spill_dir, prefix, k):
+    return sum(os.path.getsize(p) for p in partition_files(spill_dir, prefix, k))
+
+
+def load_partition(spill_dir, prefix, k, dtype=np.int64, remove=False):
+    """Concatenate every worker's piece of partition k."""
+    paths = partition_files(spill_dir, prefix, k)
+    arrays = [np.load(p) for p in paths]
+    if remove:
+        for p in paths:
+            os.remove(p)
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(arrays)
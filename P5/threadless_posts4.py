@@ -1,14 +1,29 @@
-import json
 import os
 import time
+import shutil
 import argparse
+from tempfile import mkdtemp
+from functools import partial
 from itertools import islice
 from concurrent.futures import as_completed, ProcessPoolExecutor
+import numpy as np
+from post_store import list_parts, open_part, part_info, NULL_ID, to_int
+import jsonl_codec as codec
+from compressed_io import is_jsonl, open_input
+from id_set import IdSet, IdSetBuilder
+from spill import spill_partitioned, load_partition
+from manifest import (file_columns, attach_entries, load_manifest, save_manifest_piece,
+                      merge_manifest_pieces, prune_cache, STATUS_OK, STATUS_REASONS, EDGE_FIELDS)
+from duplicates import make_file_id, make_rows, save_file_list, file_list_path, reduce_rows_partition
+
+SPILLED_SETS = ("posts", "sources", "targets")
+
+POST_FIELDS = ("post_id", "reply_to", "quotes", "repost_from")
 
 # --- helper: iterate over files ---
 def iter_files(directory):
     for entry in os.scandir(directory):
-        if entry.is_file() and entry.name.endswith(".jsonl"):
+        if entry.is_file() and is_jsonl(entry.name):
             yield entry.path
 
 # --- helper: chunking generator ---
@@ -22,42 +37,40 @@ def chunker(iterable, chunksize):
 
 # --- function that processes a batch of files ---
 def batch_process(batch, worker_id):
-    all_posts = set()
-    seen_posts = set()
-    duplicates = []
-    sources = set()
-    targets = set()
+    pids = []
+    file_idxs = []  # file index within the batch and line number per pid: the
+    line_nums = []  # file_id / line_num columns of the duplicate-detection rows
+    sources = IdSetBuilder()
+    targets = IdSetBuilder()
     invalid = []
     total_lines = 0
+    project = codec.make_projector(POST_FIELDS)
 
-    for filepath in batch:
+    for file_idx, filepath in enumerate(batch):
         try:
-            with open(filepath, "r", encoding="utf-8", errors="replace") as f:
+            with open_input(filepath, "rb") as f:
                 for line_num, line in enumerate(f, start=1):
                     total_lines += 1
                     try:
-                        post = json.loads(line)
-                    except json.JSONDecodeError:
+                        post = project(line)
+                    except codec.DecodeError:
                         invalid.append({"file": filepath, "reason": "decode_error", "line_num": line_num})
                         continue
 
-                    pid = post.get("post_id")
-                    if pid is None:
+                    pid = to_int(post.get("post_id"))  # "777" counts as 777, like the cached parser
+                    if pid == NULL_ID:
                         invalid.append({"file": filepath, "reason": "missing_post_id", "line_num": line_num})
                         continue
 
-                    # Duplicate detection
-                    if pid in seen_posts:
-                        duplicates.append({"file": filepath, "post_id": pid, "line_num": line_num})
-                    else:
-                        seen_posts.add(pid)
-                        all_posts.add(pid)
+                    pids.append(pid)
+                    file_idxs.append(file_idx)
+                    line_nums.append(line_num)
 
                     # Outgoing edges
                     has_interaction = False
                     for key in ("reply_to", "quotes", "repost_from"):
-                        target = post.get(key)
-                        if target is not None:
+                        target = to_int(post.get(key))
+                        if target != NULL_ID:
                             has_interaction = True
                             targets.add(target)
 
@@ -67,84 +80,258 @@ def batch_process(batch, worker_id):
         except Exception as e:
             print(f"Error reading {filepath}: {e}")
 
+    # One (post_id, file_id, line_num) row per post for corpus-wide duplicate detection
+    pids = np.asarray(pids, dtype=np.int64)
+    rows = make_rows(pids, make_file_id(worker_id, file_idxs), line_nums)
+
+    if worker_id % 10 == 0:
+        print(f"Processed {worker_id * len(batch):,} files so far...")
+
+    return IdSet(pids), sources.build(), targets.build(), invalid, rows, batch, total_lines
+
+
+# --- same as batch_process, but over one part of a columnar post store ---
+def store_process(part_dir, worker_id):
+    cols = open_part(part_dir, ["post_id", "reply_to", "quotes", "repost_from", "file_idx", "line_num"])
+    files = part_info(part_dir)["files"]
+    pids = np.asarray(cols["post_id"])
+
+    rows = make_rows(pids, make_file_id(worker_id, cols["file_idx"]), cols["line_num"])
+
+    # Outgoing edges
+    targets = IdSetBuilder()
+    has_interaction = np.zeros(len(pids), dtype=bool)
+    for key in ("reply_to", "quotes", "repost_from"):
+        col = np.asarray(cols[key])
+        present = col != NULL_ID
+        has_interaction |= present
+        targets.add_many(col[present])
+
+    if worker_id % 10 == 0:
+        print(f"Processed {worker_id:,} parts so far...")
+
+    # malformed lines were already dropped by the converter
+    return IdSet(pids), IdSet(pids[has_interaction]), targets.build(), [], rows, files, len(pids)
+
+
+# --- same as batch_process, but only parses files that are new or changed since the last run ---
+def cached_process(batch_entries, worker_id, cache_dir):
+    pids, line_nums, file_idxs = [], [], []
+    sources, targets = [], []
+    invalid = []
+    entries = []
+    total_lines = 0
+    batch = []
+
+    for file_idx, (filepath, entry) in enumerate(batch_entries):
+        batch.append(filepath)
+        try:
+            cols, new_entry, _ = file_columns(filepath, entry, cache_dir)
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+            continue
+        entries.append(new_entry)
+        total_lines += len(cols["status"])
+
+        ok = cols["status"] == STATUS_OK
+        for row in np.flatnonzero(~ok):
+            invalid.append({"file": filepath, "reason": STATUS_REASONS[int(cols["status"][row])],
+                            "line_num": int(cols["line_num"][row])})
+
+        pid = cols["post_id"][ok]
+        pids.append(pid)
+        line_nums.append(cols["line_num"][ok])
+        file_idxs.append(np.full(len(pid), file_idx, dtype=np.int64))
+
+        has_interaction = np.zeros(len(pid), dtype=bool)
+        for key in EDGE_FIELDS:
+            col = cols[key][ok]
+            present = col != NULL_ID
+            has_interaction |= present
+            targets.append(col[present])
+        sources.append(pid[has_interaction])
+
+    save_manifest_piece(cache_dir, worker_id, entries)
+
+    def cat(arrays, dtype=np.int64):
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+    pids = cat(pids)
+    rows = make_rows(pids, make_file_id(worker_id, cat(file_idxs)), cat(line_nums, np.int32))
+
     if worker_id % 10 == 0:
         print(f"Processed {worker_id * len(batch):,} files so far...")
 
-    return all_posts, sources, targets, invalid, duplicates, total_lines
+    return IdSet(pids), IdSet(cat(sources)), IdSet(cat(targets)), invalid, rows, batch, total_lines
+
+
+# --- run a batch and spill its id sets to hash partitions instead of returning them ---
+def spill_process(fn, work, worker_id, spill_dir, partitions):
+    all_posts, sources, targets, invalid, rows, files, total_lines = fn(work, worker_id)
+    for prefix, ids in zip(SPILLED_SETS, (all_posts, sources, targets)):
+        spill_partitioned(ids.ids, spill_dir, prefix, worker_id, partitions)
+    spill_partitioned(rows, spill_dir, "rows", worker_id, partitions, key="post_id")
+    save_file_list(spill_dir, worker_id, files)
+    return None, None, None, invalid, None, None, total_lines
+
+
+# --- phase 2: isolated posts of one hash partition ---
+def reduce_partition(spill_dir, k):
+    posts, sources, targets = (IdSet(load_partition(spill_dir, prefix, k, remove=True)) for prefix in SPILLED_SETS)
+    connected = sources | targets
+    isolated = posts - connected
+    isolated.save(os.path.join(spill_dir, f"isolated-p{k:04d}.npy"))
+    return {"posts": len(posts), "sources": len(sources), "targets": len(targets), "connected": len(connected)}
+
+
+# --- phase 2: duplicates of one hash partition, streamed to its own shard ---
+def reduce_duplicates(spill_dir, k, dup_dir, budget_bytes):
+    shard = os.path.join(dup_dir, f"duplicates-p{k:04d}.jsonl")
+    n = reduce_rows_partition(spill_dir, "rows", k, shard, budget_bytes)
+    if n == 0 and os.path.exists(shard):
+        os.remove(shard)
+    return n
+
+
+def reduce_spilled(args, spill_dir, dup_dir, n_workers):
+    counts = {"posts": 0, "sources": 0, "targets": 0, "connected": 0}
+    n_duplicates = 0
+    budget_bytes = args.memory_mb * 1024 * 1024
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(reduce_partition, spill_dir, k) for k in range(args.partitions)]
+        dup_futures = [executor.submit(reduce_duplicates, spill_dir, k, dup_dir, budget_bytes)
+                       for k in range(args.partitions)]
+        for fut in as_completed(futures):
+            for key, value in fut.result().items():
+                counts[key] += value
+        for fut in as_completed(dup_futures):
+            n_duplicates += fut.result()
+
+    for worker_id in range(1, n_workers + 1):
+        if os.path.exists(file_list_path(spill_dir, worker_id)):
+            os.remove(file_list_path(spill_dir, worker_id))
+
+    # isolated partitions are disjoint; one concatenation + sort gives the LUT order
+    isolated = []
+    for k in range(args.partitions):
+        path = os.path.join(spill_dir, f"isolated-p{k:04d}.npy")
+        isolated.append(np.load(path))
+        os.remove(path)
+    return counts, IdSet(np.sort(np.concatenate(isolated)), assume_unique=True), n_duplicates
 
 
 def main(args):
     st = time.time()
-    file_iterator = iter_files(args.inputpath)
+    if args.store:
+        work_iterator = ((store_process, part) for part in list_parts(args.store))
+    else:
+        work_iterator = ((batch_process, batch) for batch in chunker(iter_files(args.inputpath), args.batchsize))
+    if args.cache_dir:
+        # incremental mode: unchanged files come from the cache, appended files parse only the tail
+        os.makedirs(args.cache_dir, exist_ok=True)
+        manifest = load_manifest(args.cache_dir)
+        print(f"🗃 Manifest: {len(manifest):,} files from previous runs")
+        process = partial(cached_process, cache_dir=args.cache_dir)
+        work_iterator = ((process, attach_entries(batch, manifest))
+                         for batch in chunker(iter_files(args.inputpath), args.batchsize))
 
-    global_all_posts = set()
-    global_sources = set()
-    global_targets = set()
+    # Id sets and duplicate rows always go through hash partitions, so every
+    # reduction stays within --memory_mb; without --spilldir they live in a
+    # temporary directory next to the output
+    out_dir = os.path.dirname(args.output)
+    spill_dir = args.spilldir or mkdtemp(prefix=".threadless_spill_", dir=out_dir or ".")
     global_invalid = []
-    global_duplicates = []
     global_total_lines = 0
 
     with ProcessPoolExecutor(max_workers=args.workers) as executor:
-        futures = []
+        futures = {}
         worker_id = 1
-        for batch in chunker(file_iterator, args.batchsize):
-            futures.append(executor.submit(batch_process, batch, worker_id))
+        for fn, work in work_iterator:
+            futures[executor.submit(spill_process, fn, work, worker_id, spill_dir, args.partitions)] = worker_id
             worker_id += 1
 
         for fut in as_completed(futures):
-            all_posts, sources, targets, invalid, duplicates, total_lines = fut.result()
-            global_all_posts.update(all_posts)
-            global_sources.update(sources)
-            global_targets.update(targets)
+            _, _, _, invalid, _, _, total_lines = fut.result()
             global_invalid.extend(invalid)
-            global_duplicates.extend(duplicates)
             global_total_lines += total_lines
 
-    connected_posts = global_sources.union(global_targets)
-    isolated_posts = global_all_posts.difference(connected_posts)
+    if args.cache_dir:
+        prune_cache(args.cache_dir, manifest, merge_manifest_pieces(args.cache_dir))
+
+    # Each partition is reduced independently and in parallel;
+    # duplicates are streamed to one shard per partition
+    if args.spilldir:
+        dup_path = os.path.join(out_dir, "duplicates")
+    else:
+        dup_path = os.path.join(spill_dir, "duplicates")
+    # shards are appended to piece by piece, so drop the ones of a previous run
+    shutil.rmtree(dup_path, ignore_errors=True)
+    os.makedirs(dup_path)
+    counts, isolated_posts, n_duplicates = reduce_spilled(args, spill_dir, dup_path, worker_id - 1)
+
+    if not args.spilldir:
+        # default layout: the shards are concatenated into the single duplicate log
+        shards = sorted(os.path.join(dup_path, name) for name in os.listdir(dup_path))
+        dup_path = os.path.join(out_dir, "duplicate_posts.log")
+        if n_duplicates:
+            with open(dup_path, "wb") as out:
+                for shard in shards:
+                    with open(shard, "rb") as f:
+                        shutil.copyfileobj(f, out)
+        shutil.rmtree(spill_dir, ignore_errors=True)
 
     print(f"📄 Total JSON lines parsed: {global_total_lines:,}")
-    print(f"🆔 Unique post_ids: {len(global_all_posts):,}")
-    print(f"🔁 Duplicate post_ids skipped: {global_total_lines - len(global_all_posts):,}")
-    print(f"💾 Logged duplicate entries: {len(global_duplicates):,}")
+    print(f"🆔 Unique post_ids: {counts['posts']:,}")
+    print(f"🔁 Duplicate post_ids skipped: {global_total_lines - counts['posts']:,}")
+    print(f"💾 Logged duplicate entries: {n_duplicates:,}")
     print(f"⚠️ Invalid or malformed posts: {len(global_invalid):,}\n")
 
-    print(f"Posts interacting (sources): {len(global_sources):,}")
-    print(f"Posts interacted with (targets): {len(global_targets):,}")
-    print(f"Connected (any interaction): {len(connected_posts):,}")
+    print(f"Posts interacting (sources): {counts['sources']:,}")
+    print(f"Posts interacted with (targets): {counts['targets']:,}")
+    print(f"Connected (any interaction): {counts['connected']:,}")
     print(f"Isolated posts (no in/out edges): {len(isolated_posts):,}")
 
     # --- save isolated posts ---
     with open(args.output, "w") as f:
-        for pid in isolated_posts:
-            f.write(f"{pid}\n")
-
-    # --- save duplicates ---
-    if global_duplicates:
-        dup_path = os.path.join(os.path.dirname(args.output), "duplicate_posts.log")
-        with open(dup_path, "w", encoding="utf-8") as f:
-            for dup in global_duplicates:
-                f.write(json.dumps(dup, ensure_ascii=False) + "\n")
+        np.savetxt(f, isolated_posts.ids, fmt="%d")
+
+    # --- save the same table as a sorted int64 array for mmap lookups ---
+    lut_bin = args.lut_bin or os.path.splitext(args.output)[0] + ".npy"
+    isolated_posts.save(lut_bin)
+
+    if n_duplicates:
         print(f"\n🔁 Duplicates written to: {dup_path}")
 
     # --- save invalid posts ---
     if global_invalid:
         inv_path = os.path.join(os.path.dirname(args.output), "invalid_posts.log")
-        with open(inv_path, "w", encoding="utf-8") as f:
+        with open(inv_path, "wb") as f:
             for inv in global_invalid:
-                f.write(json.dumps(inv, ensure_ascii=False) + "\n")
+                f.write(codec.dumpline(inv))
         print(f"⚠️ Invalid/malformed posts written to: {inv_path}")
 
-    print(f"\n✅ Saved isolated post lookup table to: {args.output}")
+    print(f"\n✅ Saved isolated post lookup table to: {args.output} (binary: {lut_bin})")
     print(f"Total isolated posts: {len(isolated_posts):,}")
     print(f"Δt = {time.time() - st:.2f}s")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--inputpath", type=str, required=True, help="Path to input directory")
+    parser.add_argument("--inputpath", type=str, help="Path to input directory")
+    parser.add_argument("--store", type=str, help="Columnar post store (post_store.py) to read instead of --inputpath")
     parser.add_argument("--output", type=str, required=True, help="Output filepath")
+    parser.add_argument("--lut_bin", type=str, help="Binary (.npy) LUT path, defaults to --output with a .npy suffix")
     parser.add_argument("--workers", type=int, default=32, help="Number of parallel workers")
     parser.add_argument("--batchsize", type=int, default=1000, help="Number of files per batch")
+    parser.add_argument("--cache_dir", type=str, help="Manifest + per-file cache for incremental re-runs over --inputpath")
+    parser.add_argument("--spilldir", type=str, help="Keep the hash partitions here (default: a temporary dir next to --output)")
+    parser.add_argument("--partitions", type=int, default=64, help="Number of hash partitions")
+    parser.add_argument("--memory_mb", type=int, default=1024, help="Per-partition memory budget for duplicate detection")
     args = parser.parse_args()
+    if not (args.inputpath or args.store):
+        parser.error("one of --inputpath or --store is required")
+    if args.cache_dir and not args.inputpath:
+        parser.error("--cache_dir needs --inputpath")
+    if args.spilldir:
+        os.makedirs(args.spilldir, exist_ok=True)
     main(args)
@@ -3,11 +3,15 @@ import os
 from itertools import islice
 from concurrent.futures import ProcessPoolExecutor, as_completed, ThreadPoolExecutor
 import time
+import numpy as np
+from post_store import iter_parts
+from compressed_io import is_jsonl, open_input
+from packed_store import PackedStore
 
 # --- helper: iterate over files ---
 def iter_files(directory):
     for user in os.scandir(directory):
-        if user.is_file() and user.name.endswith(".jsonl"):
+        if user.is_file() and is_jsonl(user.name):
             yield user.path
 
 # --- helper: chunking generator ---
@@ -24,17 +28,15 @@ def batch_process(batch):
     total = 0
     for filepath in batch:
         try:
-            with open(filepath, "r", errors="ignore") as json_file:
+            with open_input(filepath, "r", errors="ignore") as json_file:
                 for line in json_file:
                     total += 1
         except Exception as e:
             print(f"Error reading {filepath}: {e}")
     return total
 
-# --- main script ---
-def main(args):
-    start = time.time()
-
+# --- count files and lines directly from the per-user directory ---
+def count_files(args):
     file_iterator = iter_files(args.inputpath)
 
     total_users = 0
@@ -48,6 +50,34 @@ def main(args):
 
         for fut in as_completed(futures):
             total_posts += fut.result()
+
+    return total_users, total_posts
+
+# --- count from a columnar post store: only the user_id column is read ---
+def count_store(store_dir):
+    user_ids = []
+    total_posts = 0
+    for _, cols in iter_parts(store_dir, ["user_id"]):
+        total_posts += len(cols["user_id"])
+        user_ids.append(np.unique(cols["user_id"]))
+    total_users = len(np.unique(np.concatenate(user_ids))) if user_ids else 0
+    return total_users, total_posts
+
+# --- count from a packed store: the index already holds users and line counts ---
+def count_packed(store_dir):
+    with PackedStore(store_dir) as store:
+        return len(store), int(store.index["lines"].sum())
+
+# --- main script ---
+def main(args):
+    start = time.time()
+
+    if args.store:
+        total_users, total_posts = count_store(args.store)
+    elif args.packed:
+        total_users, total_posts = count_packed(args.packed)
+    else:
+        total_users, total_posts = count_files(args)
     
     elapsed = time.time() - start
 
@@ -64,9 +94,13 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--inputpath', type=str, required=True, help='Path to input directory')
+    parser.add_argument('--inputpath', type=str, help='Path to input directory')
+    parser.add_argument('--store', type=str, help='Columnar post store (post_store.py) to count instead of --inputpath')
+    parser.add_argument('--packed', type=str, help='Packed per-user store (ID_seperator4 --packed) to count instead of --inputpath')
     parser.add_argument('--output', type=str, required=True, help='Output filepath')
     parser.add_argument('--workers', type=int, default=32, help='Number of parallel workers')
     parser.add_argument('--batchsize', type=int, default=1000, help="The size of the batches")
     args = parser.parse_args()
+    if not (args.inputpath or args.store or args.packed):
+        parser.error("one of --inputpath, --store or --packed is required")
     main(args)
\ No newline at end of file
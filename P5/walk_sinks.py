@@ -0,0 +1,318 @@
+import os
+import glob
+import time
+import struct
+import tarfile
+import numpy as np
+import jsonl_codec as codec
+from compressed_io import strip_jsonl_suffix, open_input, open_output, compresses_output
+from buffered_writer import BlockWriter
+from checkpoint import trim_partial_line
+
+# =====================================================
+# TRAVERSAL OUTPUT SINKS
+# =====================================================
+# Workers encode each walk once (encode_walk, runs in the traversal threads or
+# processes); sinks only route the bytes to BlockWriter threads, one per file.
+#
+#   jsonl     walks JSONL, optionally sharded by root id: walks-00000.jsonl ...
+#   metrics   JSONL with start_node / walk_length / walk_depth / layer_sizes only
+#   binary    packed records (format above encode_binary), read back with iter_binary_walks
+#   archive   opt-in per-root <root_id>.json members, batched into tar shards
+#             instead of one tiny file per root
+
+SINK_KINDS = ("jsonl", "metrics", "binary")
+
+
+# =====================================================
+# ENCODERS (worker side)
+# =====================================================
+def layer_sizes(result):
+    if "layer_sizes" in result:  # forest --layer_counts records
+        return list(result["layer_sizes"])
+    return [len(result["walk_path"][str(d)]) for d in range(result["walk_depth"] + 1)]
+
+
+def encode_jsonl(result):
+    return codec.dumpline(result)
+
+
+def encode_metrics(result):
+    return codec.dumpline({
+        "start_node": result["start_node"],
+        "walk_length": result["walk_length"],
+        "walk_depth": result["walk_depth"],
+        "layer_sizes": layer_sizes(result),
+    })
+
+
+def encode_member(result):
+    return codec.dumps_bytes(result)
+
+
+# --- binary walks: <q start_node><i n_layers> int32[n_layers] sizes, int64[sum(sizes)] nodes ---
+BINARY_HEADER = struct.Struct("<qi")
+
+
+def encode_binary(result):
+    if "walk_path" not in result:
+        raise ValueError("binary walks need walk_path (not available with --layer_counts)")
+    layers = [result["walk_path"][str(d)] for d in range(result["walk_depth"] + 1)]
+    sizes = np.array([len(layer) for layer in layers], dtype="<i4")
+    nodes = np.array([n for layer in layers for n in layer], dtype="<i8")
+    return BINARY_HEADER.pack(result["start_node"], len(sizes)) + sizes.tobytes() + nodes.tobytes()
+
+
+ENCODERS = {"jsonl": encode_jsonl, "metrics": encode_metrics, "binary": encode_binary, "archive": encode_member}
+
+
+def encode_walk(result, kinds):
+    """One payload per sink kind, in `kinds` order."""
+    return tuple(ENCODERS[kind](result) for kind in kinds)
+
+
+def iter_binary_walks(path, offsets=False):
+    """
+    Walk records (same shape as the JSONL ones) from a binary walks file; stops at
+    a torn final record. With offsets=True yields (end_offset, record).
+    """
+    offset = 0
+    with open_input(path, "rb") as f:
+        while True:
+            header = f.read(BINARY_HEADER.size)
+            if len(header) < BINARY_HEADER.size:
+                return
+            start_node, n_layers = BINARY_HEADER.unpack(header)
+            raw_sizes = f.read(4 * n_layers)
+            if len(raw_sizes) < 4 * n_layers:
+                return
+            sizes = np.frombuffer(raw_sizes, dtype="<i4")
+            raw_nodes = f.read(8 * int(sizes.sum()))
+            if len(raw_nodes) < 8 * int(sizes.sum()):
+                return
+            nodes = np.frombuffer(raw_nodes, dtype="<i8")
+            offset += len(header) + len(raw_sizes) + len(raw_nodes)
+            bounds = np.cumsum(sizes)[:-1]
+            record = {
+                "start_node": start_node,
+                "walk_length": len(nodes),
+                "walk_depth": n_layers - 1,
+                "walk_path": {str(d): layer.tolist() for d, layer in enumerate(np.split(nodes, bounds))},
+            }
+            yield (offset, record) if offsets else record
+
+
+# =====================================================
+# SINKS (writer side)
+# =====================================================
+class JSONLSink:
+    """Walks JSONL; with shards > 1 root ids are spread over <stem>-NNNNN<suffix> files."""
+    kind = "jsonl"
+
+    def __init__(self, path, shards=1):
+        self.shards = max(shards, 1)
+        if self.shards == 1:
+            self.paths = [path]
+        else:
+            stem = strip_jsonl_suffix(path)
+            suffix = path[len(stem):] or ".jsonl"
+            self.paths = [f"{stem}-{i:05d}{suffix}" for i in range(self.shards)]
+        self.files = []
+        self.writers = []
+
+    def open(self):
+        for path in self.paths:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            f = open_output(path, "ab")
+            self.files.append(f)
+            self.writers.append(BlockWriter(f))
+
+    def write_many(self, records):
+        """records: (root_id, payload) pairs."""
+        if self.shards == 1:
+            self.writers[0].write_many([payload for _, payload in records])
+            return
+        routed = [[] for _ in range(self.shards)]
+        for root_id, payload in records:
+            routed[root_id % self.shards].append(payload)
+        for writer, payloads in zip(self.writers, routed):
+            if payloads:
+                writer.write_many(payloads)
+
+    def done_roots(self):
+        """Full rescan (no checkpoint): start_node of every record; a torn last line is cut off plain files."""
+        done = set()
+        project = codec.make_projector(("start_node",))
+        for path in self.paths:
+            if not os.path.exists(path):
+                continue
+            if not compresses_output(path) and trim_partial_line(path):
+                print(f"[INFO] Dropped a torn final record from {path}")
+            with open_input(path, "rb") as f:
+                for line in f:
+                    try:
+                        done.add(project(line)["start_node"])
+                    except Exception:
+                        continue
+        return done
+
+    def sync(self):
+        return [writer.sync() for writer in self.writers]
+
+    def close(self):
+        written = 0
+        for writer, f in zip(self.writers, self.files):
+            try:
+                written += writer.close()
+            finally:
+                f.close()
+        return written
+
+
+class MetricsSink(JSONLSink):
+    kind = "metrics"
+
+
+class BinarySink:
+    kind = "binary"
+
+    def __init__(self, path):
+        self.path = path
+        self.paths = [path]
+        self.file = self.writer = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open_output(self.path, "ab")
+        self.writer = BlockWriter(self.file)
+
+    def write_many(self, records):
+        self.writer.write_many([payload for _, payload in records])
+
+    def done_roots(self):
+        if not os.path.exists(self.path):
+            return set()
+        done, end = set(), 0
+        for end, walk in iter_binary_walks(self.path, offsets=True):
+            done.add(walk["start_node"])
+        if not compresses_output(self.path) and os.path.getsize(self.path) > end:
+            os.truncate(self.path, end)
+            print(f"[INFO] Dropped a torn final record from {self.path}")
+        return done
+
+    def sync(self):
+        return [self.writer.sync()]
+
+    def close(self):
+        try:
+            return self.writer.close()
+        finally:
+            self.file.close()
+
+
+class ArchiveSink:
+    """
+    Per-root <root_id>.json members in <output_dir>/walks-NNNNN.tar, at most
+    members_per_shard per archive. Tar headers are built in memory, so the
+    archive bytes go through a BlockWriter like every other sink. A new run
+    starts a new shard (on its first walk) instead of reopening an old one.
+    """
+    kind = "archive"
+
+    def __init__(self, output_dir, members_per_shard=100_000):
+        self.output_dir = output_dir
+        self.members_per_shard = members_per_shard
+        self.shard = 0
+        self.members = 0
+        self.file = self.writer = None
+
+    def open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        existing = glob.glob(os.path.join(self.output_dir, "walks-*.tar"))
+        self.shard = max((int(os.path.basename(p)[6:11]) + 1 for p in existing), default=0)
+
+    def _next_shard(self):
+        self.file = open(os.path.join(self.output_dir, f"walks-{self.shard:05d}.tar"), "wb")
+        self.writer = BlockWriter(self.file)
+        self.members = 0
+
+    def _close_shard(self):
+        try:
+            self.writer.write(b"\0" * (2 * tarfile.BLOCKSIZE))  # end-of-archive marker
+            self.writer.close()
+        finally:
+            self.file.close()
+            self.file = self.writer = None
+            self.shard += 1
+
+    def write_many(self, records):
+        blocks = []
+        mtime = int(time.time())
+        for root_id, payload in records:
+            if self.writer is None:
+                self._next_shard()
+            info = tarfile.TarInfo(f"{root_id}.json")
+            info.size, info.mtime = len(payload), mtime
+            padding = -len(payload) % tarfile.BLOCKSIZE
+            blocks.append(info.tobuf(tarfile.GNU_FORMAT) + payload + b"\0" * padding)
+            self.members += 1
+            if self.members >= self.members_per_shard:
+                self.writer.write_many(blocks)
+                blocks = []
+                self._close_shard()
+        if blocks:
+            self.writer.write_many(blocks)
+
+    def close(self):
+        if self.writer is not None:
+            self._close_shard()
+
+
+class WalkSinks:
+    """The main sink plus the optional per-root archive; what the traversal writes to."""
+
+    def __init__(self, main, archive=None):
+        self.main, self.archive = main, archive
+        self.kinds = (main.kind,) + (("archive",) if archive else ())
+
+    def __enter__(self):
+        self.main.open()
+        if self.archive:
+            self.archive.open()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.main.close()
+        finally:
+            if self.archive:
+                self.archive.close()
+
+    @property
+    def paths(self):
+        """Files covered by checkpoints (the per-root archive is not)."""
+        return self.main.paths
+
+    def done_roots(self):
+        return self.main.done_roots()
+
+    def sync(self):
+        """fsync the main sink; returns the durable offset of each of its files."""
+        return self.main.sync()
+
+    def write_many(self, records):
+        """records: (root_id, payloads) with payloads from encode_walk(result, self.kinds)."""
+        self.main.write_many([(root_id, payloads[0]) for root_id, payloads in records])
+        if self.archive:
+            self.archive.write_many([(root_id, payloads[1]) for root_id, payloads in records])
+
+
+def make_sinks(kind, walks_file, shards=1, archive_dir=None, members_per_shard=100_000):
+    if kind == "binary":
+        main = BinarySink(walks_file)
+    elif kind == "metrics":
+        main = MetricsSink(walks_file, shards)
+    else:
+        main = JSONLSink(walks_file, shards)
+    archive = ArchiveSink(archive_dir, members_per_shard) if archive_dir else None
+    return WalkSinks(main, archive)